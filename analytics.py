@@ -0,0 +1,307 @@
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Valeur de « Formations en apprentissage » comptée comme apprentissage
+APPRENTISSAGE = "Formation en apprentissage"
+
+# Agrégats des tableaux de bord: nom -> (clés de regroupement, requête SQL, pipeline MongoDB avant $merge).
+# Les clés forment l'index unique de la vue matérialisée, exigé par REFRESH ... CONCURRENTLY.
+AGGREGATES = {
+    "par_region": (
+        ("session", "region"),
+        """
+        SELECT session, region, count(*) AS formations
+        FROM {table}
+        GROUP BY session, region
+        """,
+        [
+            {"$group": {"_id": {"session": "$session", "region": "$localisation.region"},
+                        "formations": {"$sum": 1}}},
+        ],
+    ),
+    "apprentissage_par_type": (
+        ("session", "formation_type"),
+        """
+        SELECT session, formation_type, count(*) AS formations,
+               count(*) FILTER (WHERE formation_apprentissage = {apprentissage}) AS apprentissage,
+               round(count(*) FILTER (WHERE formation_apprentissage = {apprentissage})::numeric / count(*), 4)::float8
+                   AS part_apprentissage
+        FROM {table}
+        GROUP BY session, formation_type
+        """,
+        [
+            {"$group": {"_id": {"session": "$session", "formation_type": "$formation.type"},
+                        "formations": {"$sum": 1},
+                        "apprentissage": {"$sum": {"$cond": [
+                            {"$eq": ["$formation.apprentissage", APPRENTISSAGE]}, 1, 0]}}}},
+            {"$addFields": {"part_apprentissage": {"$round": [{"$divide": ["$apprentissage", "$formations"]}, 4]}}},
+        ],
+    ),
+    "etablissements_par_departement": (
+        ("session", "departement"),
+        """
+        SELECT session, departement, count(DISTINCT etablissement_id) AS etablissements, count(*) AS formations
+        FROM {table}
+        GROUP BY session, departement
+        """,
+        [
+            # Un premier regroupement par établissement évite de garder tous les identifiants en mémoire ($addToSet)
+            {"$group": {"_id": {"session": "$session", "departement": "$localisation.departement",
+                                "etablissement": "$etablissement.id"},
+                        "formations": {"$sum": 1}}},
+            {"$group": {"_id": {"session": "$_id.session", "departement": "$_id.departement"},
+                        "etablissements": {"$sum": {"$cond": [{"$eq": ["$_id.etablissement", None]}, 0, 1]}},
+                        "formations": {"$sum": "$formations"}}},
+        ],
+    ),
+}
+
+
+def summary_name(source, name):
+    """Vue matérialisée (PostgreSQL) ou collection de résumé (MongoDB) d'un agrégat: <source>_<agrégat>."""
+    return f"{source}_{name}"
+
+
+def _check_name(name):
+    if name not in AGGREGATES:
+        raise ValueError(f"Agrégat inconnu: {name} (attendu: {', '.join(AGGREGATES)})")
+
+
+def prepare_postgres(cur, table):
+    """Crée les vues matérialisées des agrégats de `table` et leur index unique."""
+    from psycopg2 import sql
+
+    for name, (keys, query, _) in AGGREGATES.items():
+        view = sql.Identifier(summary_name(table, name))
+        cur.execute(sql.SQL("CREATE MATERIALIZED VIEW IF NOT EXISTS {} AS {}").format(
+            view, sql.SQL(query).format(table=sql.Identifier(table), apprentissage=sql.Literal(APPRENTISSAGE))))
+        # NULLS NOT DISTINCT: une seule ligne par groupe, même pour une région ou un type absent
+        cur.execute(sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} ({}) NULLS NOT DISTINCT").format(
+            sql.Identifier(f"{summary_name(table, name)}_cle_idx"), view,
+            sql.SQL(", ").join(sql.Identifier(key) for key in keys)))
+
+
+def refresh_postgres(conn, table):
+    """Recalcule les vues existantes de `table` sans bloquer leur lecture (REFRESH ... CONCURRENTLY).
+
+    Chaque vue est validée séparément. Renvoie les noms des vues recalculées.
+    """
+    from psycopg2 import sql
+
+    refreshed = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT matviewname FROM pg_matviews WHERE matviewname = ANY(%s)",
+                    ([summary_name(table, name) for name in AGGREGATES],))
+        existing = {row[0] for row in cur.fetchall()}
+        for name in AGGREGATES:
+            view = summary_name(table, name)
+            if view not in existing:
+                continue
+            cur.execute(sql.SQL("REFRESH MATERIALIZED VIEW CONCURRENTLY {}").format(sql.Identifier(view)))
+            conn.commit()
+            refreshed.append(view)
+    if refreshed:
+        print(f"Vues matérialisées recalculées: {', '.join(refreshed)}")
+    return refreshed
+
+
+def summary_postgres(cur, table, name, session=None):
+    """Lignes d'un agrégat lues dans sa vue matérialisée, éventuellement pour une session."""
+    from psycopg2 import sql
+
+    _check_name(name)
+    keys = AGGREGATES[name][0]
+    query = sql.SQL("SELECT * FROM {}").format(sql.Identifier(summary_name(table, name)))
+    params = []
+    if session is not None:
+        query += sql.SQL(" WHERE session = %s")
+        params.append(session)
+    query += sql.SQL(" ORDER BY {}").format(sql.SQL(", ").join(sql.Identifier(key) for key in keys))
+    cur.execute(query, params)
+    columns = [column.name for column in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+def refresh_mongodb(db, collection="formations_mongodb"):
+    """Recalcule les collections de résumé par des pipelines terminés par $merge.
+
+    Les groupes présents sont remplacés ou insérés dans la collection de résumé,
+    puis ceux qui n'existent plus (date de calcul différente) sont supprimés.
+    Renvoie les noms des collections mises à jour.
+    """
+    # MongoDB garde les dates à la milliseconde: la date comparée doit être celle qui sera stockée
+    now = datetime.now(timezone.utc)
+    refreshed_at = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    refreshed = []
+    for name, (keys, _, pipeline) in AGGREGATES.items():
+        target = summary_name(collection, name)
+        db[collection].aggregate(pipeline + [
+            {"$project": dict({key: f"$_id.{key}" for key in keys},
+                              **{field: 1 for field in _fields(pipeline) if field not in keys})},
+            {"$addFields": {"refreshed_at": refreshed_at}},
+            {"$merge": {"into": target, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ], allowDiskUse=True)
+        db[target].delete_many({"refreshed_at": {"$ne": refreshed_at}})
+        db[target].create_index([(key, 1) for key in keys])
+        refreshed.append(target)
+    print(f"Collections de résumé recalculées: {', '.join(refreshed)}")
+    return refreshed
+
+
+def _fields(pipeline):
+    # Champs calculés par le pipeline ($group et $addFields), dans l'ordre
+    fields = []
+    for stage in pipeline:
+        for operator in ("$group", "$addFields"):
+            for field in stage.get(operator, {}):
+                if field != "_id" and field not in fields:
+                    fields.append(field)
+    return fields
+
+
+def summary_mongodb(db, name, session=None, collection="formations_mongodb"):
+    """Documents d'un agrégat lus dans sa collection de résumé, éventuellement pour une session."""
+    _check_name(name)
+    keys = AGGREGATES[name][0]
+    query = {"session": session} if session is not None else {}
+    cursor = db[summary_name(collection, name)].find(query, {"_id": 0, "refreshed_at": 0})
+    return list(cursor.sort([(key, 1) for key in keys]))
+
+
+class AnalyticsServer(ThreadingHTTPServer):
+    """API JSON en lecture seule sur les agrégats précalculés.
+
+    GET /agregats                              -> noms des agrégats
+    GET /agregats/<nom>?session=2024&base=mongodb -> lignes de l'agrégat (base: postgres par défaut)
+    """
+
+    def __init__(self, address, table="formations", collection="formations_mongodb"):
+        super().__init__(address, _AnalyticsHandler)
+        self.table = table
+        self.collection = collection
+        self.postgres_pool = None
+        self.mongo_client = None
+        # Connexions ouvertes à la première requête de chaque base, une seule fois pour tous les threads
+        self._connect_lock = threading.Lock()
+
+    def postgres_rows(self, name, session):
+        with self._connect_lock:
+            if self.postgres_pool is None:
+                from psycopg2.pool import ThreadedConnectionPool
+
+                from create_table_postgre import db_params
+                self.postgres_pool = ThreadedConnectionPool(1, 8, **db_params)
+        conn = self.postgres_pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                return summary_postgres(cur, self.table, name, session)
+        finally:
+            conn.rollback()
+            self.postgres_pool.putconn(conn)
+
+    def mongodb_rows(self, name, session):
+        with self._connect_lock:
+            if self.mongo_client is None:
+                import import_in_mongo
+                self.mongo_client, _ = import_in_mongo.connect_mongodb()
+        return summary_mongodb(self.mongo_client["formations_mongodb"], name, session, self.collection)
+
+    def server_close(self):
+        super().server_close()
+        if self.postgres_pool:
+            self.postgres_pool.closeall()
+        if self.mongo_client:
+            self.mongo_client.close()
+
+
+class _AnalyticsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        if parts == ["agregats"]:
+            return self._send(200, {"agregats": list(AGGREGATES)})
+        if len(parts) != 2 or parts[0] != "agregats" or parts[1] not in AGGREGATES:
+            return self._send(404, {"erreur": f"Chemin inconnu: {url.path}"})
+
+        params = parse_qs(url.query)
+        backend = params.get("base", ["postgres"])[0]
+        try:
+            session = int(params["session"][0]) if "session" in params else None
+        except ValueError:
+            return self._send(400, {"erreur": "session doit être un entier"})
+        if backend not in ("postgres", "mongodb"):
+            return self._send(400, {"erreur": f"Base inconnue: {backend} (attendu: postgres, mongodb)"})
+
+        start_time = time.perf_counter()
+        try:
+            if backend == "postgres":
+                rows = self.server.postgres_rows(parts[1], session)
+            else:
+                rows = self.server.mongodb_rows(parts[1], session)
+        except Exception as e:
+            return self._send(503, {"erreur": str(e)})
+        self._send(200, {"agregat": parts[1], "base": backend, "session": session, "lignes": rows,
+                         "duree_ms": round((time.perf_counter() - start_time) * 1000, 2)})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    import psycopg2
+
+    import import_in_mongo
+    from create_table_postgre import db_params
+
+    parser = argparse.ArgumentParser(description="Agrégats précalculés (vues matérialisées, résumés MongoDB) et API")
+    parser.add_argument("action", choices=["prepare", "refresh", "serve"])
+    parser.add_argument("--backends", nargs="+", default=["postgres", "mongodb"], choices=["postgres", "mongodb"])
+    parser.add_argument("--table", default="formations")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    if args.action == "serve":
+        server = AnalyticsServer((args.host, args.port), args.table)
+        print(f"API des agrégats sur http://{args.host}:{args.port}/agregats")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    if "postgres" in args.backends:
+        conn = psycopg2.connect(**db_params)
+        try:
+            if args.action == "prepare":
+                with conn.cursor() as cur:
+                    prepare_postgres(cur, args.table)
+                conn.commit()
+                print(f"Vues matérialisées créées pour {args.table}")
+            else:
+                refresh_postgres(conn, args.table)
+        finally:
+            conn.close()
+    if "mongodb" in args.backends:
+        # Les collections de résumé sont créées par leur premier $merge
+        client, db = import_in_mongo.connect_mongodb()
+        try:
+            refresh_mongodb(db)
+        finally:
+            client.close()
+
+
+if __name__ == "__main__":
+    main()
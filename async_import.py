@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import time
+from datetime import timedelta
+
+import asyncpg
+import psycopg2
+import redis.asyncio as redis_async
+from pymongo.errors import BulkWriteError
+
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:
+    # pymongo < 4.10: pilote asynchrone historique
+    from motor.motor_asyncio import AsyncIOMotorClient as AsyncMongoClient
+
+import create_table_postgre
+import import_in_mongo
+import import_redis
+from column_mapping import SQL_COLUMNS, formation_keys, to_documents, to_tuples
+from csv_reader import read_csv_chunks
+from dead_letter import DeadLetterWriter, bisect_write_async, dead_letter_path
+from geo_search import with_position
+from postgres_bulk import UNIQUE_KEY, prepare_key
+from query_cache import invalidate_after_import, track_sessions
+from redis_formats import STORAGE_FORMATS
+from redis_pipeline import check_results
+from text_search import mongo_text_index
+
+STORES = ("postgres", "mongodb", "redis")
+
+# Configuration du moteur asynchrone
+async_params = {
+    # Connexions ouvertes par base et réutilisées d'un lot (et d'un import) à l'autre
+    "pool_size": {"postgres": 4, "mongodb": 8, "redis": 8},
+    # Lots envoyés sans attendre leur réponse, par base
+    "in_flight": {"postgres": 4, "mongodb": 8, "redis": 8},
+    "batch_size": 1000,
+}
+
+SESSION_INDEX = SQL_COLUMNS.index("session")
+
+# Erreurs dues au contenu d'une ligne: le lot est coupé en deux pour trouver la ligne fautive.
+# Les autres (connexion perdue, table absente...) interrompent l'import.
+POSTGRES_ROW_ERRORS = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError)
+
+
+def _quoted(columns):
+    return ", ".join(f'"{column}"' for column in columns)
+
+
+def _upsert_query(table, staging):
+    """Report d'un lot de la table temporaire vers `table`, comme postgres_bulk.copy_rows avec upsert."""
+    key = _quoted(UNIQUE_KEY)
+    # Clé incomplète: ctid unique, la ligne n'est regroupée avec aucune autre
+    incomplete = "CASE WHEN " + " OR ".join(f'"{column}" IS NULL' for column in UNIQUE_KEY) + " THEN ctid END"
+    updates = ", ".join(f'"{column}" = EXCLUDED."{column}"' for column in SQL_COLUMNS if column not in UNIQUE_KEY)
+    return (f'INSERT INTO "{table}" ({_quoted(SQL_COLUMNS)}) '
+            f'SELECT DISTINCT ON ({key}, {incomplete}) {_quoted(SQL_COLUMNS)} FROM "{staging}" '
+            f'ORDER BY {key}, {incomplete}, ctid DESC '
+            f'ON CONFLICT ({key}) DO UPDATE SET {updates}, row_hash = NULL')
+
+
+def _prepare_postgres(table):
+    # Clé unique (session, code) créée une fois, par psycopg2 comme pour les autres importeurs
+    conn = psycopg2.connect(**create_table_postgre.db_params)
+    try:
+        with conn.cursor() as cur:
+            prepare_key(cur, table)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _postgres_record(values):
+    # COPY binaire d'asyncpg: types Python exacts (session entière, autres colonnes en texte)
+    return tuple(
+        value if value is None else (int(value) if position == SESSION_INDEX else str(value))
+        for position, value in enumerate(values)
+    )
+
+
+class AsyncImportEngine:
+    """Import asynchrone vers PostgreSQL, MongoDB et Redis avec des pools de connexions.
+
+    Chaque base garde au plus `in_flight` lots en cours d'envoi: pendant qu'un
+    lot attend sa réponse, les suivants partent déjà, ce qui masque la latence
+    réseau quand les bases sont distantes. Les pools sont ouverts une fois par
+    `open()` et servent à tous les imports jusqu'à `close()`.
+    """
+
+    def __init__(self, stores=STORES, table="formations", batch_size=None, in_flight=None, pool_size=None,
+                 redis_storage="json"):
+        self.stores = tuple(stores)
+        self.table = table
+        self.batch_size = batch_size or async_params["batch_size"]
+        self.in_flight = dict(async_params["in_flight"], **(in_flight or {}))
+        self.pool_size = dict(async_params["pool_size"], **(pool_size or {}))
+        self.redis_storage = redis_storage
+        self.postgres_pool = None
+        self.mongo_client = None
+        self.collection = None
+        self.redis_client = None
+
+    async def open(self):
+        if "postgres" in self.stores:
+            await asyncio.to_thread(_prepare_postgres, self.table)
+            params = create_table_postgre.db_params
+            self.postgres_pool = await asyncpg.create_pool(
+                host=params["host"], port=int(params["port"]), user=params["user"],
+                password=params["password"], database=params["dbname"],
+                min_size=1, max_size=self.pool_size["postgres"])
+        if "mongodb" in self.stores:
+            self.mongo_client = AsyncMongoClient(maxPoolSize=self.pool_size["mongodb"], **import_in_mongo.mongo_params)
+            self.collection = self.mongo_client["formations_mongodb"]["formations_mongodb"]
+        if "redis" in self.stores:
+            pool = redis_async.ConnectionPool(max_connections=self.pool_size["redis"], **import_redis.redis_params)
+            self.redis_client = redis_async.Redis(connection_pool=pool)
+            await self.redis_client.ping()
+
+    async def close(self):
+        if self.postgres_pool:
+            await self.postgres_pool.close()
+        if self.mongo_client:
+            # close() est une coroutine avec AsyncMongoClient, une méthode simple avec motor
+            result = self.mongo_client.close()
+            if asyncio.iscoroutine(result):
+                await result
+        if self.redis_client:
+            await self.redis_client.aclose()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _copy_postgres(self, rows):
+        async with self.postgres_pool.acquire() as conn:
+            # Un lot = une transaction: les lots en parallèle utilisent des connexions différentes
+            async with conn.transaction():
+                # COPY binaire dans une table temporaire de la connexion, puis upsert sur (session, code)
+                staging = f"{self.table}_copie"
+                await conn.execute(f'CREATE TEMP TABLE IF NOT EXISTS "{staging}" ON COMMIT DELETE ROWS AS '
+                                   f'SELECT {_quoted(SQL_COLUMNS)} FROM "{self.table}" WITH NO DATA')
+                await conn.copy_records_to_table(staging, records=[_postgres_record(values) for values in rows],
+                                                 columns=SQL_COLUMNS)
+                await conn.execute(_upsert_query(self.table, staging))
+
+    async def _write_postgres(self, first_row, rows, dead_letter=None):
+        """Écrit un lot; un lot refusé est coupé en deux jusqu'aux lignes fautives, écrites dans `dead_letter`.
+
+        Les erreurs de transport ne sont pas des rejets: elles remontent et interrompent l'import.
+        """
+        def reject(row_number, values, error):
+            print(f"Erreur lors de l'insertion de la ligne {row_number}: {str(error).splitlines()[0]}")
+            if dead_letter is not None:
+                dead_letter.write(row_number, values, error)
+
+        return await bisect_write_async(self._copy_postgres, list(enumerate(rows, start=first_row)), reject,
+                                        POSTGRES_ROW_ERRORS)
+
+    async def _write_mongodb(self, first_row, documents):
+        try:
+            result = await self.collection.insert_many(documents, ordered=False)
+            return len(result.inserted_ids)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                print(f"Erreur lors de l'insertion de la ligne {first_row + error['index']}: {error.get('errmsg')}")
+            return e.details.get("nInserted", 0)
+
+    async def _write_redis(self, first_row, formation_ids, documents):
+        pipe = self.redis_client.pipeline(transaction=False)
+        rows = []
+        for row_number, (formation_id, document) in enumerate(zip(formation_ids, documents), start=first_row):
+            before = len(pipe)
+            # Les commandes sont seulement mises en file: queue_formation sert aussi au pipeline asynchrone
+            import_redis.queue_formation(pipe, formation_id, document, self.redis_storage)
+            rows.append((row_number, len(pipe) - before))
+        try:
+            results = await pipe.execute(raise_on_error=False)
+        except Exception as e:
+            print(f"Erreur lors de l'envoi des lignes {first_row} à {first_row + len(rows) - 1}: {e}")
+            return 0
+        successful_rows, _ = check_results(rows, results)
+        return successful_rows
+
+    def _batches(self, store, first_row, chunk, sessions, dead_letter=None):
+        """Coroutines d'écriture d'un bloc pour une base, par lots de batch_size lignes."""
+        if store == "postgres":
+            # Sessions chargées, dont le cache Redis des requêtes sera invalidé
+            items = list(track_sessions(to_tuples(chunk), sessions))
+        elif store == "mongodb":
+            items = [with_position(document) for document in to_documents(chunk)]
+        else:
+            items = list(zip(formation_keys(chunk, "Code interne Parcoursup de la formation"), to_documents(chunk)))
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start + self.batch_size]
+            row = first_row + start
+            if store == "postgres":
+                yield self._write_postgres(row, batch, dead_letter)
+            elif store == "mongodb":
+                yield self._write_mongodb(row, batch)
+            else:
+                yield self._write_redis(row, [formation_id for formation_id, _ in batch],
+                                        [document for _, document in batch])
+
+    async def import_csv(self, file_path, chunksize=None, memory_limit_mb=None, rejects_path=None):
+        """Importe le CSV dans les bases ouvertes. Renvoie les lignes écrites par base.
+
+        Les lignes refusées par PostgreSQL vont dans `rejects_path` (par défaut
+        <fichier>.rejets_postgres.csv). Une erreur de transport (connexion
+        perdue...) interrompt l'import après l'arrêt des lots en cours.
+        """
+        start_time = time.time()
+        successful = {store: 0 for store in self.stores}
+        slots = {store: asyncio.Semaphore(self.in_flight[store]) for store in self.stores}
+        pending = set()
+        sessions = set()
+
+        async def run(store, write):
+            try:
+                successful[store] += await write
+            finally:
+                slots[store].release()
+
+        def running(pending):
+            # L'erreur d'un lot terminé remonte ici, sans attendre la fin de l'import
+            for task in pending:
+                if task.done():
+                    task.result()
+            return {task for task in pending if not task.done()}
+
+        total_rows = 0
+        # La lecture pandas est synchrone: elle tourne dans un thread pendant que les lots partent
+        chunks = read_csv_chunks(file_path, chunksize, memory_limit_mb)
+        print(f"Début de l'importation asynchrone vers: {', '.join(self.stores)} "
+              f"(lots de {self.batch_size} lignes, {self.in_flight} lots en vol)")
+        with DeadLetterWriter(rejects_path or dead_letter_path(file_path, "postgres"), "postgres") as dead_letter:
+            try:
+                while True:
+                    chunk = await asyncio.to_thread(next, chunks, None)
+                    if chunk is None:
+                        break
+                    first_row = total_rows + 1
+                    total_rows += len(chunk)
+                    for store in self.stores:
+                        for write in self._batches(store, first_row, chunk, sessions, dead_letter):
+                            # Attente d'une place libre: au plus in_flight lots en cours par base
+                            await slots[store].acquire()
+                            pending.add(asyncio.create_task(run(store, write)))
+                            pending = running(pending)
+                    print(f"Progression: {total_rows} lignes lues")
+                if pending:
+                    await asyncio.gather(*pending)
+            except BaseException as e:
+                print(f"Import interrompu après {total_rows} lignes lues: {e}")
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                raise
+
+        if self.collection is not None:
+            for keys in import_in_mongo.collection_indexes:
+                await self.collection.create_index(keys)
+            text_keys, text_options = mongo_text_index()
+            await self.collection.create_index(text_keys, **text_options)
+        if self.postgres_pool:
+            await asyncio.to_thread(invalidate_after_import, self.table, sessions)
+
+        duration = time.time() - start_time
+        print("\nRésumé de l'importation:")
+        print(f"Durée totale: {str(timedelta(seconds=int(duration)))}")
+        print(f"Nombre total de lignes traitées: {total_rows}")
+        for store, count in successful.items():
+            rate = count / duration if duration > 0 else 0
+            print(f"  {store:>10}: {count}/{total_rows} lignes, {rate:.0f} lignes/s")
+        return successful
+
+
+async def run_imports(file_paths, stores=STORES, **options):
+    """Importe plusieurs fichiers à la suite en réutilisant les mêmes pools de connexions."""
+    chunk_options = {key: options.pop(key) for key in ("chunksize", "memory_limit_mb") if key in options}
+    async with AsyncImportEngine(stores, **options) as engine:
+        return [await engine.import_csv(file_path, **chunk_options) for file_path in file_paths]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import asynchrone (asyncio) vers PostgreSQL, MongoDB et Redis")
+    parser.add_argument("csv_files", nargs="*", default=["data/cartographie_formations_parcoursup.csv"])
+    parser.add_argument("--stores", nargs="+", default=list(STORES), choices=STORES)
+    parser.add_argument("--table", default="formations")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--in-flight", type=int, default=None, help="Lots en vol par base (même valeur pour toutes)")
+    parser.add_argument("--pool-size", type=int, default=None, help="Connexions par base (même valeur pour toutes)")
+    parser.add_argument("--chunksize", type=int, default=None)
+    parser.add_argument("--memory-limit-mb", type=int, default=None)
+    parser.add_argument("--redis-storage", default="json", choices=STORAGE_FORMATS)
+    parser.add_argument("--create", action="store_true", help="Crée la table formations avant l'import")
+    args = parser.parse_args()
+
+    if args.create:
+        create_table_postgre.create_table()
+    in_flight = {store: args.in_flight for store in STORES} if args.in_flight else None
+    pool_size = {store: args.pool_size for store in STORES} if args.pool_size else None
+    asyncio.run(run_imports(args.csv_files, args.stores, table=args.table, batch_size=args.batch_size,
+                            in_flight=in_flight, pool_size=pool_size, redis_storage=args.redis_storage,
+                            chunksize=args.chunksize, memory_limit_mb=args.memory_limit_mb))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from generate_dataset import write_dataset
+
+def reset_postgres(table):
+    import psycopg2
+    from psycopg2 import sql
+
+    from create_table_postgre import db_params
+    conn = psycopg2.connect(**db_params)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("TRUNCATE {}").format(sql.Identifier(table)))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def reset_mongodb(collection):
+    import import_in_mongo
+    client, db = import_in_mongo.connect_mongodb()
+    if not client:
+        raise RuntimeError("MongoDB indisponible: la collection n'a pas pu être vidée")
+    try:
+        db[collection].drop()
+    finally:
+        client.close()
+
+
+def reset_redis(_):
+    # La base Redis configurée doit être réservée au banc: toutes ses clés sont supprimées
+    import import_redis
+    client = import_redis.connect_redis()
+    if not client:
+        raise RuntimeError("Redis indisponible: la base n'a pas pu être vidée")
+    try:
+        client.flushdb()
+    finally:
+        client.close()
+
+
+# Importeurs mesurés: nom -> (module, fonction de préparation éventuelle, remise à zéro, table ou collection)
+IMPORTERS = {
+    "postgres": ("create_table_postgre", "create_table", reset_postgres, "formations"),
+    "postgres_2": ("create_table_postgre_2", "create_table", reset_postgres, "formation_2"),
+    "mongodb": ("import_in_mongo", None, reset_mongodb, "formations_mongodb"),
+    "redis_hash": ("import_in_redis", None, reset_redis, None),
+    "redis_json": ("import_redis", None, reset_redis, None),
+}
+
+
+def run_one(importer, file_path):
+    """Exécuté dans un sous-processus: un import dans une base vidée, puis son temps,
+    ses lignes importées et son pic de mémoire en JSON."""
+    module_name, prepare, reset, target = IMPORTERS[importer]
+    module = __import__(module_name)
+    if prepare:
+        getattr(module, prepare)()
+    # Chaque mesure part d'une base vide: pas de doublons ni d'index déjà remplis par la précédente
+    reset(target)
+    start_time = time.time()
+    successful_rows = module.import_csv(file_path) or 0
+    duration = time.time() - start_time
+    # ru_maxrss est en kilo-octets sous Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"duration": duration, "successful_rows": successful_rows, "peak_rss_mb": peak_rss_mb}))
+
+
+def measure(importer, file_path):
+    # Un sous-processus par mesure pour que le pic de mémoire ne concerne que cet import
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-one", importer, file_path],
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def plot(results, output):
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib n'est pas installé: graphique non généré")
+        return
+    figure, (rate_axis, rss_axis) = plt.subplots(1, 2, figsize=(12, 5))
+    for importer in sorted({result["importer"] for result in results}):
+        points = sorted((r["rows"], r["rows_per_second"], r["peak_rss_mb"])
+                        for r in results if r["importer"] == importer)
+        rows = [point[0] for point in points]
+        rate_axis.plot(rows, [point[1] for point in points], marker="o", label=importer)
+        rss_axis.plot(rows, [point[2] for point in points], marker="o", label=importer)
+    for axis, label in ((rate_axis, "lignes/s"), (rss_axis, "pic RSS (Mo)")):
+        axis.set_xscale("log")
+        axis.set_xlabel("lignes")
+        axis.set_ylabel(label)
+        axis.legend()
+    figure.tight_layout()
+    figure.savefig(output)
+    print(f"Graphique écrit dans {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesure le débit et la mémoire des importeurs à plusieurs volumes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--importers", nargs="+", default=list(IMPORTERS), choices=list(IMPORTERS))
+    parser.add_argument("--data-dir", default="data/synthetic")
+    parser.add_argument("--output", default="bench_imports.json")
+    parser.add_argument("--chart", default="bench_imports.png")
+    parser.add_argument("--compose", action="store_true",
+                        help="Démarre les conteneurs de docker-compose.yaml avant les mesures")
+    parser.add_argument("--run-one", nargs=2, metavar=("IMPORTER", "CSV"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_one(*args.run_one)
+        return
+
+    if args.compose:
+        subprocess.run(["docker", "compose", "up", "-d", "postgres", "mongo", "redis"], check=True)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = []
+    for size in args.sizes:
+        file_path = os.path.join(args.data_dir, f"formations_{size}.csv")
+        if not os.path.exists(file_path):
+            write_dataset(file_path, size, [2023, 2024])
+        for importer in args.importers:
+            measurement = measure(importer, file_path)
+            # Débit calculé sur les lignes réellement importées: un import en échec ne paraît pas rapide
+            result = {
+                "importer": importer,
+                "rows": size,
+                "successful_rows": measurement["successful_rows"],
+                "duration": round(measurement["duration"], 3),
+                "rows_per_second": round(measurement["successful_rows"] / measurement["duration"], 1),
+                "peak_rss_mb": round(measurement["peak_rss_mb"], 1),
+            }
+            results.append(result)
+            print(f"{importer:>10} {size:>9} lignes: {result['rows_per_second']:>10.0f} lignes/s, "
+                  f"pic RSS {result['peak_rss_mb']:.0f} Mo")
+            if result["successful_rows"] < size:
+                print(f"{'':>10} attention: {result['successful_rows']}/{size} lignes importées")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Résultats écrits dans {args.output}")
+    plot(results, args.chart)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import csv_cache
+from column_mapping import CSV_COLUMNS, to_tuples
+from csv_reader import CSV_DTYPES, NA_VALUES
+
+
+def untyped_load(file_path, rows):
+    """Chargement d'avant le schéma: types inférés par pandas puis NaN remplacés par None."""
+    chunk = pd.read_csv(file_path, sep=';', encoding='utf-8', na_values=NA_VALUES, nrows=rows)
+    return chunk.replace({np.nan: None})
+
+
+def typed_load(file_path, rows, engine="c"):
+    options = {"nrows": rows} if rows is not None else {}
+    return pd.read_csv(file_path, sep=';', encoding='utf-8', na_values=NA_VALUES, dtype=CSV_DTYPES,
+                       engine=engine, **options)
+
+
+def timed(load, *args):
+    start_time = time.perf_counter()
+    chunk = load(*args)
+    return chunk, time.perf_counter() - start_time
+
+
+def column_bytes(chunk):
+    return chunk.memory_usage(index=False, deep=True)
+
+
+def changed_columns(before, after):
+    """Colonnes dont les valeurs écrites en base diffèrent entre les deux chargements."""
+    expected = list(zip(*to_tuples(before))) if len(before) else []
+    result = list(zip(*to_tuples(after))) if len(after) else []
+    return [csv_column for csv_column, old, new in zip(CSV_COLUMNS, expected, result) if old != new]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare la mémoire du chargement actuel et du chargement typé")
+    parser.add_argument("csv_file", nargs="?", default="data/cartographie_formations_parcoursup.csv")
+    parser.add_argument("--rows", type=int, default=None, help="Lignes lues (par défaut tout le fichier)")
+    args = parser.parse_args()
+
+    before, before_time = timed(untyped_load, args.csv_file, args.rows)
+    after, after_time = timed(typed_load, args.csv_file, args.rows)
+    before_bytes = column_bytes(before)
+    after_bytes = column_bytes(after)
+
+    print(f"{len(after)} lignes, mémoire par colonne (memory_usage deep=True)")
+    print(f"{'colonne':>58} {'type actuel':>12} {'Ko':>9} {'type typé':>16} {'Ko':>9}")
+    for csv_column in CSV_COLUMNS:
+        if csv_column not in after.columns:
+            continue
+        print(f"{csv_column[:58]:>58} {str(before[csv_column].dtype):>12} {before_bytes[csv_column] / 1024:>9.0f} "
+              f"{str(after[csv_column].dtype):>16} {after_bytes[csv_column] / 1024:>9.0f}")
+
+    rows = max(len(after), 1)
+    print(f"\nActuel (types inférés, NULL en None): {before_bytes.sum() / 1024 / 1024:.1f} Mo, "
+          f"{before_bytes.sum() / rows:.0f} o/ligne, lecture {before_time:.2f}s")
+    print(f"Typé (CSV_DTYPES, NULL à l'écriture): {after_bytes.sum() / 1024 / 1024:.1f} Mo, "
+          f"{after_bytes.sum() / rows:.0f} o/ligne, lecture {after_time:.2f}s "
+          f"(x{before_bytes.sum() / max(after_bytes.sum(), 1):.1f} moins de mémoire)")
+
+    # Le moteur pyarrow ne lit pas par blocs ni un nombre limité de lignes: fichier entier seulement
+    if csv_cache.pa is not None and args.rows is None:
+        arrow_chunk, arrow_time = timed(typed_load, args.csv_file, None, "pyarrow")
+        print(f"Typé, moteur pyarrow (multithread): {column_bytes(arrow_chunk).sum() / 1024 / 1024:.1f} Mo, "
+              f"lecture {arrow_time:.2f}s")
+
+    changed = changed_columns(before, after)
+    if changed:
+        # Attendu pour les codes à zéros initiaux que l'inférence lisait comme des entiers
+        print(f"Valeurs écrites différentes pour: {', '.join(changed)}")
+    else:
+        print("Valeurs écrites identiques dans les deux chargements")
+
+
+if __name__ == "__main__":
+    main()
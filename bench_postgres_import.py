@@ -0,0 +1,62 @@
+import argparse
+import itertools
+
+import psycopg2
+
+from create_table_postgre import create_table, db_params
+from csv_reader import iter_rows
+from postgres_bulk import LOAD_MODES, load_rows, rows_per_second
+
+
+def read_rows(file_path):
+    # Lecture du CSV une seule fois, gardée en mémoire pour rejouer chaque mode
+    return list(iter_rows(file_path))
+
+
+def synthetic_rows(rows, target_rows):
+    """Répète les lignes du CSV jusqu'à atteindre `target_rows` lignes (générées à la volée)."""
+    return itertools.islice(itertools.cycle(rows), target_rows)
+
+
+def run_mode(rows, mode):
+    conn = psycopg2.connect(**db_params)
+    cur = conn.cursor()
+    try:
+        # Table temporaire de même structure que formations, vidée à la fin de la session
+        cur.execute("CREATE TEMP TABLE bench_formations (LIKE formations)")
+        total_rows, successful_rows, duration = load_rows(cur, "bench_formations", rows, mode=mode)
+        conn.commit()
+        return successful_rows, duration
+    finally:
+        cur.close()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare les modes de chargement PostgreSQL")
+    parser.add_argument("csv_file", nargs="?", default="data/cartographie_formations_parcoursup.csv")
+    parser.add_argument("--rows", type=int, default=None,
+                        help="Nombre de lignes synthétiques (ex: 5000000); par défaut le CSV tel quel")
+    parser.add_argument("--modes", nargs="+", default=list(LOAD_MODES), choices=LOAD_MODES)
+    args = parser.parse_args()
+
+    create_table()
+    source_rows = read_rows(args.csv_file)
+    row_count = args.rows or len(source_rows)
+    print(f"{len(source_rows)} lignes lues, {row_count} lignes chargées par mode")
+
+    results = {}
+    for mode in args.modes:
+        rows = synthetic_rows(source_rows, row_count)
+        loaded, duration = run_mode(rows, mode)
+        results[mode] = rows_per_second(loaded, duration)
+        print(f"{mode:>7}: {loaded} lignes en {duration:.2f}s -> {results[mode]:.0f} lignes/s")
+
+    if "row" in results:
+        for mode, rate in results.items():
+            if mode != "row":
+                print(f"{mode} est {rate / results['row']:.1f}x plus rapide que row")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import psycopg2
+
+import geo_search
+import import_in_mongo
+import import_redis
+import text_search
+from create_table_postgre import db_params
+from query_cache import QueryCache
+from redis_formats import STORAGE_FORMATS, load_formations, scan_formations
+
+# Termes recherchés dans formation_nom_long
+SEARCH_TERMS = ["informatique", "droit", "commerce", "santé", "mathématiques", "gestion", "langues", "art"]
+
+# Requêtes logiques communes aux trois bases
+# (search_texte, index plein texte, est comparée au parcours ILIKE / regex de search_nom_long sur les mêmes termes)
+QUERIES = ["lookup_etablissement", "filter_region_session", "count_par_type", "search_nom_long", "search_texte",
+           "near_point"]
+
+# Rayon (km) des recherches de formations autour d'un point
+NEAR_RADIUS_KM = 10
+
+
+class PostgresBackend:
+    name = "postgres"
+
+    def __init__(self, table="formations"):
+        self.table = table
+        self._local = threading.local()
+        self._connections = []
+
+    def _connection(self):
+        # Une connexion par thread: une connexion psycopg2 n'exécute qu'une requête à la fois
+        if not hasattr(self._local, "conn"):
+            self._local.conn = psycopg2.connect(**db_params)
+            self._local.conn.autocommit = True
+            self._connections.append(self._local.conn)
+        return self._local.conn
+
+    def _cursor(self):
+        return self._connection().cursor()
+
+    def open(self):
+        pass
+
+    def close(self):
+        for conn in self._connections:
+            conn.close()
+
+    def _fetch(self, query, params=None):
+        with self._cursor() as cur:
+            cur.execute(query, params)
+            return cur.fetchall()
+
+    def sample_parameters(self, limit=200):
+        """Valeurs réelles tirées de la table, partagées par toutes les bases."""
+        etablissements = [row[0] for row in self._fetch(
+            f"SELECT DISTINCT etablissement_id FROM {self.table} WHERE etablissement_id IS NOT NULL LIMIT %s", (limit,))]
+        regions_sessions = self._fetch(
+            f"SELECT DISTINCT region, session FROM {self.table} WHERE region IS NOT NULL LIMIT %s", (limit,))
+        # Points d'origine: positions (latitude, longitude) de formations existantes
+        points = self._fetch(
+            f"SELECT position[1], position[0] FROM {self.table} WHERE position IS NOT NULL LIMIT %s", (limit,))
+        return {"etablissements": etablissements, "regions_sessions": [list(pair) for pair in regions_sessions],
+                "points": [list(point) for point in points]}
+
+    def lookup_etablissement(self, etablissement_id):
+        return len(self._fetch(f"SELECT * FROM {self.table} WHERE etablissement_id = %s", (etablissement_id,)))
+
+    def filter_region_session(self, region, session):
+        return len(self._fetch(f"SELECT * FROM {self.table} WHERE region = %s AND session = %s", (region, session)))
+
+    def count_par_type(self):
+        return len(self._fetch(f"SELECT formation_type, count(*) FROM {self.table} GROUP BY formation_type"))
+
+    def search_nom_long(self, term):
+        return len(self._fetch(f"SELECT * FROM {self.table} WHERE formation_nom_long ILIKE %s", (f"%{term}%",)))
+
+    def search_texte(self, term):
+        with self._cursor() as cur:
+            return len(text_search.search_postgres(cur, term, table=self.table))
+
+    def row_count(self):
+        return self._fetch(f"SELECT count(*) FROM {self.table}")[0][0]
+
+    def near_point(self, latitude, longitude):
+        with self._cursor() as cur:
+            return len(geo_search.near_postgres(cur, latitude, longitude, NEAR_RADIUS_KM, table=self.table))
+
+
+class CachedPostgresBackend:
+    """Requêtes PostgreSQL servies par le cache Redis de query_cache.py (seulement celles mises en cache)."""
+
+    name = "postgres_cache"
+
+    def __init__(self, table="formations"):
+        self.postgres = PostgresBackend(table)
+        self._local = threading.local()
+
+    def _cache(self):
+        # Un cache par thread, chacun avec la connexion PostgreSQL de son thread
+        if not hasattr(self._local, "cache"):
+            self._local.cache = QueryCache(self.client, self.postgres._connection(), self.postgres.table)
+        return self._local.cache
+
+    def open(self):
+        self.client = import_redis.connect_redis()
+
+    def close(self):
+        self.postgres.close()
+        self.client.close()
+
+    def lookup_etablissement(self, etablissement_id):
+        return len(self._cache().formations_by_etablissement(etablissement_id))
+
+    def count_par_type(self):
+        return len(self._cache().counts_by("formation_type"))
+
+
+class MongoBackend:
+    name = "mongodb"
+
+    def open(self):
+        self.client, db = import_in_mongo.connect_mongodb()
+        self.collection = db["formations_mongodb"]
+
+    def close(self):
+        self.client.close()
+
+    def lookup_etablissement(self, etablissement_id):
+        return len(list(self.collection.find({"etablissement.id": etablissement_id})))
+
+    def filter_region_session(self, region, session):
+        return len(list(self.collection.find({"localisation.region": region, "session": session})))
+
+    def count_par_type(self):
+        return len(list(self.collection.aggregate([
+            {"$group": {"_id": "$formation.type", "count": {"$sum": 1}}}
+        ])))
+
+    def search_nom_long(self, term):
+        return len(list(self.collection.find(
+            {"formation.nom_long": {"$regex": re.escape(term), "$options": "i"}})))
+
+    def search_texte(self, term):
+        return len(text_search.search_mongodb(self.collection, term))
+
+    def near_point(self, latitude, longitude):
+        return len(geo_search.near_mongodb(self.collection, latitude, longitude, NEAR_RADIUS_KM))
+
+
+class RedisBackend:
+    """Requêtes sur les clés formation:* et les index créés par import_redis.py."""
+
+    name = "redis"
+
+    def __init__(self, storage="json"):
+        self.storage = storage
+
+    def open(self):
+        self.client = import_redis.connect_redis()
+
+    def close(self):
+        self.client.close()
+
+    def _load(self, formation_ids):
+        formation_ids = [formation_id.decode() for formation_id in formation_ids]
+        return [document for document in load_formations(self.client, formation_ids, self.storage) if document]
+
+    def _scan_all(self):
+        # Pas d'index pour ces requêtes: parcours complet des formations
+        return scan_formations(self.client, self.storage)
+
+    def lookup_etablissement(self, etablissement_id):
+        return len(self._load(self.client.smembers(f"etablissement:{etablissement_id}")))
+
+    def filter_region_session(self, region, session):
+        return len(self._load(self.client.sinter(f"region:{region}", f"session:{session}")))
+
+    def count_par_type(self):
+        counts = {}
+        for formation in self._scan_all():
+            formation_type = formation["formation"]["type"]
+            counts[formation_type] = counts.get(formation_type, 0) + 1
+        return len(counts)
+
+    def search_nom_long(self, term):
+        term = term.lower()
+        return sum(1 for formation in self._scan_all()
+                   if term in (formation["formation"]["nom_long"] or "").lower())
+
+    def near_point(self, latitude, longitude):
+        return len(geo_search.near_redis(self.client, latitude, longitude, NEAR_RADIUS_KM, storage=self.storage))
+
+
+BACKENDS = {backend.name: backend for backend in (PostgresBackend, CachedPostgresBackend, MongoBackend, RedisBackend)}
+
+
+def percentile(sorted_values, p):
+    """Percentile par rang le plus proche sur une liste déjà triée."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def query_arguments(query, parameters, rng):
+    if query == "lookup_etablissement":
+        return (rng.choice(parameters["etablissements"]),)
+    if query == "filter_region_session":
+        return tuple(rng.choice(parameters["regions_sessions"]))
+    if query in ("search_nom_long", "search_texte"):
+        return (rng.choice(SEARCH_TERMS),)
+    if query == "near_point":
+        return tuple(rng.choice(parameters["points"]))
+    return ()
+
+
+def run_query(backend, query, parameters, iterations, concurrency, seed):
+    """Exécute `iterations` requêtes réparties sur `concurrency` threads."""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    function = getattr(backend, query)
+
+    def worker(worker_id, count):
+        nonlocal errors
+        rng = random.Random(seed + worker_id)
+        local_latencies = []
+        local_errors = 0
+        for _ in range(count):
+            args = query_arguments(query, parameters, rng)
+            start_time = time.perf_counter()
+            try:
+                function(*args)
+                local_latencies.append(time.perf_counter() - start_time)
+            except Exception as e:
+                local_errors += 1
+                print(f"[{backend.name}] Erreur sur {query}{args}: {e}")
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    shares = [iterations // concurrency + (1 if i < iterations % concurrency else 0) for i in range(concurrency)]
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker, i, share) for i, share in enumerate(shares)]:
+            future.result()
+    wall_time = time.perf_counter() - start_time
+
+    latencies.sort()
+
+    def to_ms(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "p50_ms": to_ms(percentile(latencies, 50)),
+        "p95_ms": to_ms(percentile(latencies, 95)),
+        "p99_ms": to_ms(percentile(latencies, 99)),
+        "mean_ms": to_ms(sum(latencies) / len(latencies)) if latencies else None,
+        "throughput_qps": round(len(latencies) / wall_time, 2) if wall_time > 0 else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark des mêmes requêtes sur PostgreSQL, MongoDB et Redis",
+        epilog="Pour mesurer à grande échelle, importer d'abord un jeu synthétique "
+               "(python generate_dataset.py data/synthetique.csv --rows 1000000).")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--queries", nargs="+", default=QUERIES, choices=QUERIES)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_queries.json")
+    parser.add_argument("--redis-storage", default="json", choices=STORAGE_FORMATS,
+                        help="Format utilisé lors de l'import Redis")
+    args = parser.parse_args()
+
+    # Paramètres tirés une seule fois de PostgreSQL pour interroger toutes les bases avec les mêmes valeurs
+    reference = PostgresBackend()
+    reference.open()
+    try:
+        parameters = reference.sample_parameters()
+        row_count = reference.row_count()
+    finally:
+        reference.close()
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "rows": row_count,
+        },
+        "results": {},
+    }
+    for backend_name in args.backends:
+        backend = RedisBackend(args.redis_storage) if backend_name == "redis" else BACKENDS[backend_name]()
+        backend.open()
+        try:
+            report["results"][backend_name] = {}
+            for query in args.queries:
+                if not hasattr(backend, query):
+                    # Ex: pas de recherche plein texte dans Redis
+                    print(f"{backend_name:>8} {query:>22}: non disponible")
+                    continue
+                result = run_query(backend, query, parameters, args.iterations, args.concurrency, args.seed)
+                report["results"][backend_name][query] = result
+                print(f"{backend_name:>8} {query:>22}: p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+                      f"p99 {result['p99_ms']} ms, {result['throughput_qps']} req/s")
+        finally:
+            backend.close()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"Résultats écrits dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
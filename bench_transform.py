@@ -0,0 +1,81 @@
+import argparse
+import time
+
+import pandas as pd
+
+from column_mapping import CSV_COLUMNS, DOCUMENT_LAYOUT, REDIS_FIELDS, to_documents, to_flat_hashes, to_tuples
+from csv_reader import normalize_nulls, read_csv_chunks
+
+
+# Références: construction ligne par ligne avec iterrows, comme le faisaient les importeurs
+# (sur un bloc aux NULL déjà remplacés par None)
+
+def iterrows_tuples(chunk):
+    return [tuple(row[csv_column] for csv_column in CSV_COLUMNS) for _, row in chunk.iterrows()]
+
+
+def iterrows_documents(chunk):
+    documents = []
+    for _, row in chunk.iterrows():
+        document = {}
+        for top, fields in DOCUMENT_LAYOUT:
+            if len(fields) == 1 and not fields[0][0]:
+                document[top] = row[fields[0][1]]
+            else:
+                document[top] = {field: row[csv_column] for field, csv_column in fields}
+        documents.append(document)
+    return documents
+
+
+def iterrows_flat_hashes(chunk):
+    return [
+        {field: "" if row[csv_column] is None else row[csv_column]
+         for field, csv_column in zip(REDIS_FIELDS, CSV_COLUMNS)}
+        for _, row in chunk.iterrows()
+    ]
+
+
+BENCHMARKS = [
+    ("tuples (PostgreSQL)", iterrows_tuples, to_tuples),
+    ("documents (MongoDB / JSON)", iterrows_documents, to_documents),
+    ("hashes plats (Redis)", iterrows_flat_hashes, to_flat_hashes),
+]
+
+
+def load_sample(file_path, rows):
+    """Premier bloc du CSV, répété si besoin jusqu'à `rows` lignes."""
+    chunk = next(read_csv_chunks(file_path, chunksize=rows))
+    repeats = -(-rows // len(chunk))
+    return pd.concat([chunk] * repeats, ignore_index=True).head(rows)
+
+
+def timed(function, chunk, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function(chunk)
+        best = min(best, time.perf_counter() - start_time)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare iterrows et la transformation par colonnes")
+    parser.add_argument("csv_file", nargs="?", default="data/cartographie_formations_parcoursup.csv")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    chunk = load_sample(args.csv_file, args.rows)
+    reference_chunk = normalize_nulls(chunk)
+    print(f"{len(chunk)} lignes, meilleur temps sur {args.repeat} essais")
+    for name, reference, columnar in BENCHMARKS:
+        reference_time, expected = timed(reference, reference_chunk, args.repeat)
+        columnar_time, result = timed(columnar, chunk, args.repeat)
+        status = "identique" if result == expected else "DIFFÉRENT"
+        print(f"{name:>28}: iterrows {len(chunk) / reference_time:>10.0f} lignes/s, "
+              f"colonnes {len(chunk) / columnar_time:>10.0f} lignes/s "
+              f"(x{reference_time / columnar_time:.1f}, résultat {status})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import json
+import os
+import time
+from itertools import count, islice
+
+from csv_cache import file_hash
+from csv_reader import stage
+
+# Configuration des points de reprise
+checkpoint_params = {
+    # Lignes chargées par transaction PostgreSQL, chacune validée avec son point de reprise
+    "commit_rows": 50000,
+    # Table des points de reprise PostgreSQL
+    "table": "import_checkpoints",
+}
+
+
+def checkpoint_path(file_path, store):
+    """Point de reprise local d'un import: <fichier source>.reprise_<base>.json."""
+    return f"{os.path.splitext(file_path)[0]}.reprise_{store}.json"
+
+
+class FileCheckpoint:
+    """Nombre de lignes du CSV entièrement écrites dans une base, gardé dans un fichier JSON local.
+
+    Le fichier est écrit puis renommé après fsync: après un arrêt brutal, il
+    contient le dernier point enregistré, jamais un état à moitié écrit. Il
+    porte l'empreinte du CSV: un fichier modifié depuis repart du début.
+    """
+
+    def __init__(self, file_path, store):
+        self.file_path = file_path
+        self.store = store
+        self.path = checkpoint_path(file_path, store)
+        self.digest = file_hash(file_path)
+        self.rows = 0
+        self.sessions = set()
+
+    def load(self):
+        """Lignes déjà écrites par un import interrompu du même fichier (0 sinon)."""
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("file_hash") != self.digest:
+            print(f"Point de reprise {self.path} ignoré: le fichier source a changé")
+            return 0
+        self.rows = state["rows"]
+        self.sessions = set(state.get("sessions", []))
+        print(f"Reprise de l'import {self.store} après la ligne {self.rows}")
+        return self.rows
+
+    def save(self, rows, sessions=()):
+        self.rows = rows
+        self.sessions = set(sessions)
+        state = {"file_hash": self.digest, "source": self.file_path, "store": self.store, "rows": rows,
+                 "sessions": sorted(self.sessions), "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + ".tmp", self.path)
+
+    def clear(self):
+        """Import terminé: la prochaine exécution repart du début."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class PostgresCheckpoint:
+    """Point de reprise gardé dans PostgreSQL, écrit dans la transaction des lignes qu'il couvre.
+
+    Les lignes et leur point de reprise sont validés ensemble: après une
+    coupure, le point indique exactement les lignes présentes dans la table.
+    """
+
+    def __init__(self, cur, file_path, target):
+        # Importé ici: les imports MongoDB et Redis n'utilisent que FileCheckpoint
+        from psycopg2 import sql
+
+        self.cur = cur
+        self.file_path = file_path
+        self.target = target
+        self.digest = file_hash(file_path)
+        self.rows = 0
+        self.sessions = set()
+        self.table = sql.Identifier(checkpoint_params["table"])
+        cur.execute(sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {} (
+                file_hash TEXT,
+                target TEXT,
+                source TEXT,
+                rows BIGINT NOT NULL,
+                sessions INTEGER[],
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (file_hash, target)
+            )
+        """).format(self.table))
+
+    def load(self):
+        """Lignes déjà validées par un import interrompu du même fichier dans la même table (0 sinon)."""
+        from psycopg2 import sql
+
+        self.cur.execute(sql.SQL("SELECT rows, sessions FROM {} WHERE file_hash = %s AND target = %s")
+                         .format(self.table), (self.digest, self.target))
+        state = self.cur.fetchone()
+        if state is None:
+            return 0
+        self.rows, sessions = state
+        self.sessions = set(sessions or [])
+        print(f"Reprise de l'import dans {self.target} après la ligne {self.rows}")
+        return self.rows
+
+    def save(self, rows, sessions=()):
+        """Enregistre le point dans la transaction en cours; il est validé avec elle."""
+        from psycopg2 import sql
+
+        self.rows = rows
+        self.sessions = set(sessions)
+        self.cur.execute(sql.SQL("""
+            INSERT INTO {} (file_hash, target, source, rows, sessions) VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (file_hash, target)
+            DO UPDATE SET rows = EXCLUDED.rows, sessions = EXCLUDED.sessions, updated_at = now()
+        """).format(self.table), (self.digest, self.target, self.file_path, rows, sorted(self.sessions)))
+
+    def clear(self):
+        from psycopg2 import sql
+
+        self.cur.execute(sql.SQL("DELETE FROM {} WHERE file_hash = %s AND target = %s").format(self.table),
+                         (self.digest, self.target))
+
+
+def load_postgres(conn, cur, table, rows, checkpoint, sessions=(), mode="copy", dead_letter=None,
+                  commit_rows=None, metrics=None, upsert=False):
+    """Charge `rows` par transactions de `commit_rows` lignes, chacune validée avec son point de reprise.
+
+    `rows` commence après checkpoint.rows (lignes déjà validées). `sessions`
+    est l'ensemble des sessions vues jusque-là, enregistré avec chaque point.
+    Renvoie (total, succès, durée) pour les lignes de cette exécution, comme
+    postgres_bulk.load_rows (avec `upsert`, les lignes déjà présentes sont remplacées).
+    """
+    from postgres_bulk import load_rows
+
+    commit_rows = commit_rows or checkpoint_params["commit_rows"]
+    rows = iter(rows)
+    total_rows = 0
+    successful_rows = 0
+    load_duration = 0.0
+    while True:
+        first_row = checkpoint.rows + 1
+        batch_rows, loaded, duration = load_rows(cur, table, islice(rows, commit_rows), mode=mode,
+                                                 dead_letter=dead_letter, row_numbers=count(first_row),
+                                                 upsert=upsert)
+        if not batch_rows:
+            return total_rows, successful_rows, load_duration
+        total_rows += batch_rows
+        successful_rows += loaded
+        load_duration += duration
+        checkpoint.save(checkpoint.rows + batch_rows, sessions)
+        with stage(metrics, "commit"):
+            conn.commit()
+        print(f"Point de reprise: {checkpoint.rows} lignes validées dans {table}")
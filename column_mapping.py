@@ -0,0 +1,119 @@
+# Correspondance déclarative des colonnes, dans l'ordre du fichier CSV:
+# (en-tête CSV, colonne SQL, chemin MongoDB / JSON, champ du hash Redis plat)
+COLUMN_MAPPING = [
+    ("Session", "session", "session", "session"),
+    ("Identifiant de l'établissement", "etablissement_id", "etablissement.id", "etablissement_id"),
+    ("Nom de l'établissement", "etablissement_nom", "etablissement.nom", "etablissement_nom"),
+    ("Types d'établissement", "etablissement_type", "etablissement.type", "etablissement_type"),
+    ("Types de formation", "formation_type", "formation.type", "formation_type"),
+    ("Nom long de la formation", "formation_nom_long", "formation.nom_long", "formation_nom_long"),
+    ("Mentions/Spécialités", "mentions_specialites", "formation.mentions_specialites", "formation_mentions_specialites"),
+    ("Formations en apprentissage", "formation_apprentissage", "formation.apprentissage", "formation_apprentissage"),
+    ("Internat", "internat", "caracteristiques.internat", "caracteristiques_internat"),
+    ("Aménagement", "amenagement", "caracteristiques.amenagement", "caracteristiques_amenagement"),
+    ("Informations complémentaires", "informations_complementaires", "caracteristiques.informations_complementaires", "caracteristiques_informations_complementaires"),
+    ("Région", "region", "localisation.region", "localisation_region"),
+    ("Département", "departement", "localisation.departement", "localisation_departement"),
+    ("Commune", "commune", "localisation.commune", "localisation_commune"),
+    ("Lien vers la fiche formation", "lien_fiche", "liens.fiche", "liens_fiche"),
+    ("Lien vers les données statistiques pour l'année antérieure", "lien_statistiques", "liens.statistiques", "liens_statistiques"),
+    ("Site internet de l'établissement", "site_internet", "etablissement.site_internet", "etablissement_site_internet"),
+    ("Localisation", "localisation", "localisation.coordonnees", "localisation_coordonnees"),
+    ("Nom court de la formation", "formation_nom_court", "formation.nom_court", "formation_nom_court"),
+    ("Code interne Parcoursup de la formation", "code_formation_parcoursup", "formation.code_formation_parcoursup", "formation_code_parcoursup"),
+    ("Code interne Parcoursup pour les portails", "code_portail_parcoursup", "formation.code_portail_parcoursup", "formation_code_portail_parcoursup"),
+    ("etablissement_id_paysage", "etablissement_id_paysage", "etablissement.id_paysage", "etablissement_id_paysage"),
+    ("composante_id_paysage", "composante_id_paysage", "metadata.composante_id_paysage", "metadata_composante_id_paysage"),
+    ("rnd", "rnd", "metadata.rnd", "metadata_rnd"),
+    ("code_formation", "code_formation", "formation.code_formation", "formation_code"),
+]
+
+CSV_COLUMNS = [csv_column for csv_column, _, _, _ in COLUMN_MAPPING]
+SQL_COLUMNS = [sql_column for _, sql_column, _, _ in COLUMN_MAPPING]
+REDIS_FIELDS = [redis_field for _, _, _, redis_field in COLUMN_MAPPING]
+
+
+def _document_layout():
+    """Regroupe les colonnes par clé de premier niveau du document, dans l'ordre d'apparition."""
+    layout = {}
+    for csv_column, _, path, _ in COLUMN_MAPPING:
+        top, _, field = path.partition(".")
+        layout.setdefault(top, []).append((field, csv_column))
+    return list(layout.items())
+
+
+DOCUMENT_LAYOUT = _document_layout()
+
+
+def _column_values(chunk, csv_column):
+    # tolist() convertit toute la colonne en objets Python en une seule opération
+    column = chunk[csv_column]
+    values = column.tolist()
+    if column.hasnans:
+        # Les NULL (NaN, pd.NA) ne deviennent None qu'ici, au moment d'écrire
+        missing = column.isna().tolist()
+        values = [None if is_missing else value for value, is_missing in zip(values, missing)]
+    return values
+
+
+def to_tuples(chunk):
+    """Lignes du bloc sous forme de tuples, dans l'ordre des colonnes SQL."""
+    return list(zip(*(_column_values(chunk, csv_column) for csv_column in CSV_COLUMNS)))
+
+
+def to_documents(chunk):
+    """Documents imbriqués (MongoDB, JSON Redis) construits colonne par colonne."""
+    tops = []
+    values = []
+    for top, fields in DOCUMENT_LAYOUT:
+        tops.append(top)
+        if len(fields) == 1 and not fields[0][0]:
+            # Champ de premier niveau (ex: session)
+            values.append(_column_values(chunk, fields[0][1]))
+        else:
+            keys = [field for field, _ in fields]
+            columns = [_column_values(chunk, csv_column) for _, csv_column in fields]
+            values.append([dict(zip(keys, row)) for row in zip(*columns)])
+    return [dict(zip(tops, row)) for row in zip(*values)]
+
+
+def to_flat_hashes(chunk):
+    """Hashes Redis plats, NULL remplacés par une chaîne vide pour toute la colonne."""
+    flat = chunk[CSV_COLUMNS]
+    flat = flat.astype(object).where(flat.notna(), "")
+    columns = [_column_values(flat, csv_column) for csv_column in CSV_COLUMNS]
+    return [dict(zip(REDIS_FIELDS, row)) for row in zip(*columns)]
+
+
+def formation_keys(chunk, csv_column, prefix="formation"):
+    """Clés Redis `prefix:session:valeur` pour chaque ligne du bloc."""
+    sessions = _column_values(chunk, "Session")
+    values = _column_values(chunk, csv_column)
+    return [f"{prefix}:{session}:{value}" for session, value in zip(sessions, values)]
+
+
+# Position, dans l'ordre des colonnes SQL, de chaque champ des documents imbriqués
+_DOCUMENT_POSITIONS = [
+    (top, [(field, CSV_COLUMNS.index(csv_column)) for field, csv_column in fields])
+    for top, fields in DOCUMENT_LAYOUT
+]
+
+
+def document_to_tuple(document):
+    """Valeurs d'un document imbriqué, dans l'ordre des colonnes SQL."""
+    values = [None] * len(CSV_COLUMNS)
+    for top, fields in _DOCUMENT_POSITIONS:
+        for field, position in fields:
+            values[position] = document[top][field] if field else document[top]
+    return tuple(values)
+
+
+def tuple_to_document(values):
+    """Document imbriqué reconstruit à partir des valeurs dans l'ordre des colonnes SQL."""
+    document = {}
+    for top, fields in _DOCUMENT_POSITIONS:
+        if len(fields) == 1 and not fields[0][0]:
+            document[top] = values[fields[0][1]]
+        else:
+            document[top] = {field: values[position] for field, position in fields}
+    return document
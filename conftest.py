@@ -0,0 +1 @@
+# Les modules du projet sont à la racine du dépôt: pytest l'ajoute à sys.path grâce à ce fichier
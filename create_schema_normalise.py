@@ -0,0 +1,352 @@
+import time
+from datetime import timedelta
+
+import psycopg2
+from psycopg2 import sql
+
+from column_mapping import SQL_COLUMNS
+from create_table_postgre import db_params
+from csv_reader import iter_rows
+from dead_letter import DeadLetterWriter, dead_letter_path
+from postgres_bulk import copy_rows, rows_per_second
+
+# Schéma normalisé, séparé de la table large public.formations
+SCHEMA = "normalise"
+
+CREATE_SCHEMA_QUERIES = [
+    f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}",
+    f"""
+    CREATE TABLE IF NOT EXISTS {SCHEMA}.regions (
+        id SERIAL PRIMARY KEY,
+        nom VARCHAR(100) NOT NULL UNIQUE
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {SCHEMA}.departements (
+        id SERIAL PRIMARY KEY,
+        nom VARCHAR(100) NOT NULL UNIQUE,
+        region_id INTEGER
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {SCHEMA}.communes (
+        id SERIAL PRIMARY KEY,
+        nom VARCHAR(100) NOT NULL,
+        departement_id INTEGER,
+        UNIQUE NULLS NOT DISTINCT (nom, departement_id)
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {SCHEMA}.types_etablissement (
+        id SERIAL PRIMARY KEY,
+        nom TEXT NOT NULL UNIQUE
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {SCHEMA}.types_formation (
+        id SERIAL PRIMARY KEY,
+        nom TEXT NOT NULL UNIQUE
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {SCHEMA}.etablissements (
+        id VARCHAR(20) PRIMARY KEY,
+        nom TEXT,
+        type_id INTEGER,
+        commune_id INTEGER,
+        site_internet TEXT,
+        id_paysage VARCHAR(50)
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {SCHEMA}.formations (
+        id BIGSERIAL PRIMARY KEY,
+        session INTEGER NOT NULL,
+        code_formation_parcoursup VARCHAR(50),
+        etablissement_id VARCHAR(20),
+        type_formation_id INTEGER,
+        nom_long TEXT,
+        nom_court TEXT,
+        mentions_specialites TEXT,
+        apprentissage TEXT,
+        internat TEXT,
+        amenagement TEXT,
+        informations_complementaires TEXT,
+        lien_fiche TEXT,
+        lien_statistiques TEXT,
+        localisation TEXT,
+        code_portail_parcoursup VARCHAR(50),
+        composante_id_paysage VARCHAR(50),
+        rnd VARCHAR(50),
+        code_formation VARCHAR(50),
+        UNIQUE (session, code_formation_parcoursup)
+    )
+    """,
+    # Vue qui redonne la forme de la table large pour les requêtes existantes
+    f"""
+    CREATE OR REPLACE VIEW {SCHEMA}.formations_detail AS
+    SELECT f.*, e.nom AS etablissement_nom, te.nom AS etablissement_type,
+           tf.nom AS formation_type, c.nom AS commune, d.nom AS departement, r.nom AS region
+    FROM {SCHEMA}.formations f
+    LEFT JOIN {SCHEMA}.etablissements e ON e.id = f.etablissement_id
+    LEFT JOIN {SCHEMA}.types_etablissement te ON te.id = e.type_id
+    LEFT JOIN {SCHEMA}.types_formation tf ON tf.id = f.type_formation_id
+    LEFT JOIN {SCHEMA}.communes c ON c.id = e.commune_id
+    LEFT JOIN {SCHEMA}.departements d ON d.id = c.departement_id
+    LEFT JOIN {SCHEMA}.regions r ON r.id = d.region_id
+    """,
+]
+
+# Clés étrangères, supprimées pendant le chargement puis recréées
+FOREIGN_KEYS = [
+    ("departements", "departements_region_fk", "region_id", "regions"),
+    ("communes", "communes_departement_fk", "departement_id", "departements"),
+    ("etablissements", "etablissements_type_fk", "type_id", "types_etablissement"),
+    ("etablissements", "etablissements_commune_fk", "commune_id", "communes"),
+    ("formations", "formations_etablissement_fk", "etablissement_id", "etablissements"),
+    ("formations", "formations_type_formation_fk", "type_formation_id", "types_formation"),
+]
+
+# Index secondaires sur les colonnes filtrées, supprimés pendant le chargement puis reconstruits
+SECONDARY_INDEXES = [
+    ("formations_session_idx", "formations", "(session)"),
+    ("formations_etablissement_idx", "formations", "(etablissement_id)"),
+    ("formations_type_session_idx", "formations", "(type_formation_id, session)"),
+    ("etablissements_commune_idx", "etablissements", "(commune_id)"),
+    ("etablissements_type_idx", "etablissements", "(type_id)"),
+    ("communes_departement_idx", "communes", "(departement_id)"),
+    ("departements_region_idx", "departements", "(region_id)"),
+]
+
+TABLES = ["regions", "departements", "communes", "types_etablissement",
+          "types_formation", "etablissements", "formations"]
+
+SESSION_INDEX = SQL_COLUMNS.index("session")
+
+# Répartition des lignes du staging dans les tables normalisées, dans l'ordre des dépendances
+LOAD_QUERIES = [
+    ("regions", f"""
+    INSERT INTO {SCHEMA}.regions (nom)
+    SELECT DISTINCT region FROM staging_formations WHERE region IS NOT NULL
+    ON CONFLICT (nom) DO NOTHING
+    """),
+    ("departements", f"""
+    INSERT INTO {SCHEMA}.departements (nom, region_id)
+    SELECT DISTINCT ON (s.departement) s.departement, r.id
+    FROM staging_formations s
+    LEFT JOIN {SCHEMA}.regions r ON r.nom = s.region
+    WHERE s.departement IS NOT NULL
+    ORDER BY s.departement, r.id
+    ON CONFLICT (nom) DO NOTHING
+    """),
+    ("communes", f"""
+    INSERT INTO {SCHEMA}.communes (nom, departement_id)
+    SELECT DISTINCT s.commune, d.id
+    FROM staging_formations s
+    LEFT JOIN {SCHEMA}.departements d ON d.nom = s.departement
+    WHERE s.commune IS NOT NULL
+    ON CONFLICT (nom, departement_id) DO NOTHING
+    """),
+    ("types_etablissement", f"""
+    INSERT INTO {SCHEMA}.types_etablissement (nom)
+    SELECT DISTINCT etablissement_type FROM staging_formations WHERE etablissement_type IS NOT NULL
+    ON CONFLICT (nom) DO NOTHING
+    """),
+    ("types_formation", f"""
+    INSERT INTO {SCHEMA}.types_formation (nom)
+    SELECT DISTINCT formation_type FROM staging_formations WHERE formation_type IS NOT NULL
+    ON CONFLICT (nom) DO NOTHING
+    """),
+    ("etablissements", f"""
+    INSERT INTO {SCHEMA}.etablissements (id, nom, type_id, commune_id, site_internet, id_paysage)
+    SELECT DISTINCT ON (s.etablissement_id)
+           s.etablissement_id, s.etablissement_nom, te.id, c.id, s.site_internet, s.etablissement_id_paysage
+    FROM staging_formations s
+    LEFT JOIN {SCHEMA}.types_etablissement te ON te.nom = s.etablissement_type
+    LEFT JOIN {SCHEMA}.departements d ON d.nom = s.departement
+    LEFT JOIN {SCHEMA}.communes c ON c.nom = s.commune AND c.departement_id IS NOT DISTINCT FROM d.id
+    WHERE s.etablissement_id IS NOT NULL
+    ORDER BY s.etablissement_id, s.session DESC
+    ON CONFLICT (id) DO UPDATE SET
+        nom = EXCLUDED.nom,
+        type_id = EXCLUDED.type_id,
+        commune_id = EXCLUDED.commune_id,
+        site_internet = EXCLUDED.site_internet,
+        id_paysage = EXCLUDED.id_paysage
+    """),
+    ("formations", f"""
+    INSERT INTO {SCHEMA}.formations (
+        session, code_formation_parcoursup, etablissement_id, type_formation_id,
+        nom_long, nom_court, mentions_specialites, apprentissage, internat, amenagement,
+        informations_complementaires, lien_fiche, lien_statistiques, localisation,
+        code_portail_parcoursup, composante_id_paysage, rnd, code_formation
+    )
+    SELECT s.session, s.code_formation_parcoursup, s.etablissement_id, tf.id,
+           s.formation_nom_long, s.formation_nom_court, s.mentions_specialites,
+           s.formation_apprentissage, s.internat, s.amenagement,
+           s.informations_complementaires, s.lien_fiche, s.lien_statistiques, s.localisation,
+           s.code_portail_parcoursup, s.composante_id_paysage, s.rnd, s.code_formation
+    FROM (
+        -- Dernière ligne du fichier pour chaque clé: une même clé ne peut pas être mise à jour deux fois
+        -- (un code NULL n'entre jamais en conflit, chacune de ces lignes est gardée)
+        SELECT DISTINCT ON (session, code_formation_parcoursup,
+                            CASE WHEN code_formation_parcoursup IS NULL THEN ctid END) *
+        FROM staging_formations
+        ORDER BY session, code_formation_parcoursup,
+                 CASE WHEN code_formation_parcoursup IS NULL THEN ctid END, ctid DESC
+    ) s
+    LEFT JOIN {SCHEMA}.types_formation tf ON tf.nom = s.formation_type
+    ON CONFLICT (session, code_formation_parcoursup) DO UPDATE SET
+        etablissement_id = EXCLUDED.etablissement_id,
+        type_formation_id = EXCLUDED.type_formation_id,
+        nom_long = EXCLUDED.nom_long,
+        nom_court = EXCLUDED.nom_court,
+        mentions_specialites = EXCLUDED.mentions_specialites,
+        apprentissage = EXCLUDED.apprentissage,
+        internat = EXCLUDED.internat,
+        amenagement = EXCLUDED.amenagement,
+        informations_complementaires = EXCLUDED.informations_complementaires,
+        lien_fiche = EXCLUDED.lien_fiche,
+        lien_statistiques = EXCLUDED.lien_statistiques,
+        localisation = EXCLUDED.localisation,
+        code_portail_parcoursup = EXCLUDED.code_portail_parcoursup,
+        composante_id_paysage = EXCLUDED.composante_id_paysage,
+        rnd = EXCLUDED.rnd,
+        code_formation = EXCLUDED.code_formation
+    """),
+]
+
+
+def create_schema():
+    conn = None
+    cur = None
+    try:
+        conn = psycopg2.connect(**db_params)
+        cur = conn.cursor()
+        for query in CREATE_SCHEMA_QUERIES:
+            cur.execute(query)
+        create_indexes(cur)
+        conn.commit()
+        print(f"Schéma {SCHEMA} créé avec succès")
+    except Exception as e:
+        print(f"Erreur lors de la création du schéma: {e}")
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            conn.close()
+
+
+def drop_indexes(cur):
+    """Supprime clés étrangères et index secondaires avant un chargement en masse."""
+    for table, name, _, _ in FOREIGN_KEYS:
+        cur.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT IF EXISTS {}").format(
+            sql.Identifier(SCHEMA, table), sql.Identifier(name)))
+    for name, _, _ in SECONDARY_INDEXES:
+        cur.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(SCHEMA, name)))
+
+
+def create_indexes(cur):
+    """(Re)crée index secondaires et clés étrangères."""
+    for name, table, columns in SECONDARY_INDEXES:
+        cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} " + columns).format(
+            sql.Identifier(name), sql.Identifier(SCHEMA, table)))
+    for table, name, column, referenced in FOREIGN_KEYS:
+        cur.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT IF EXISTS {}").format(
+            sql.Identifier(SCHEMA, table), sql.Identifier(name)))
+        cur.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} FOREIGN KEY ({}) REFERENCES {} (id)").format(
+            sql.Identifier(SCHEMA, table), sql.Identifier(name),
+            sql.Identifier(column), sql.Identifier(SCHEMA, referenced)))
+
+
+def analyze(cur):
+    for table in TABLES:
+        cur.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(SCHEMA, table)))
+
+
+def with_session(rows, dead_letter):
+    """Écarte vers `dead_letter` les lignes sans session (NOT NULL dans normalise.formations).
+
+    Une seule d'entre elles ferait échouer toute la répartition INSERT ... SELECT.
+    """
+    for row_number, values in enumerate(rows, start=1):
+        if values[SESSION_INDEX] is None:
+            dead_letter.write(row_number, values, "session manquante")
+            continue
+        yield values
+
+
+def import_csv(file_path, chunksize=None, memory_limit_mb=None, rejects_path=None):
+    """Charge le CSV dans le schéma normalisé: index supprimés, COPY, répartition, index reconstruits.
+
+    Les lignes sans session vont dans `rejects_path` (par défaut
+    <fichier>.rejets_normalise.csv); une formation déjà chargée est mise à jour.
+    """
+    start_time = time.time()
+    conn = None
+    cur = None
+    dead_letter = DeadLetterWriter(rejects_path or dead_letter_path(file_path, "normalise"), "normalise")
+    try:
+        conn = psycopg2.connect(**db_params)
+        cur = conn.cursor()
+
+        print("Suppression des index secondaires et des clés étrangères...")
+        drop_indexes(cur)
+
+        # Table de staging au format du CSV, supprimée à la fin de la transaction
+        columns = sql.SQL(", ").join(
+            sql.SQL("{} {}").format(sql.Identifier(column), sql.SQL("INTEGER" if column == "session" else "TEXT"))
+            for column in SQL_COLUMNS
+        )
+        cur.execute(sql.SQL("CREATE TEMP TABLE staging_formations ({}) ON COMMIT DROP").format(columns))
+
+        print("Chargement en flux du CSV avec COPY...")
+        rows = with_session(iter_rows(file_path, chunksize=chunksize, memory_limit_mb=memory_limit_mb), dead_letter)
+        loaded_rows, _ = copy_rows(cur, "staging_formations", rows)
+        total_rows = loaded_rows + dead_letter.count
+        load_duration = time.time() - start_time
+        cur.execute("ANALYZE staging_formations")
+
+        inserted = {}
+        for table, query in LOAD_QUERIES:
+            cur.execute(query)
+            inserted[table] = cur.rowcount
+
+        print("Reconstruction des index et des clés étrangères...")
+        index_start = time.time()
+        create_indexes(cur)
+        analyze(cur)
+        index_duration = time.time() - index_start
+
+        # Validation des changements
+        conn.commit()
+
+        duration = time.time() - start_time
+        print("\nRésumé de l'importation:")
+        print(f"Durée totale: {str(timedelta(seconds=int(duration)))}")
+        print(f"Nombre total de lignes lues: {total_rows}")
+        print(f"Nombre de lignes sans session écartées: {dead_letter.count}")
+        for table, count in inserted.items():
+            print(f"  {SCHEMA}.{table}: {count} lignes insérées ou mises à jour")
+        print(f"Débit du COPY: {rows_per_second(loaded_rows, load_duration):.0f} lignes/s")
+        print(f"Reconstruction des index et ANALYZE: {index_duration:.1f}s")
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"Erreur lors de l'importation: {e}")
+    finally:
+        dead_letter.close()
+        if cur:
+            cur.close()
+        if conn:
+            conn.close()
+
+
+if __name__ == "__main__":
+    # Créer le schéma normalisé
+    create_schema()
+
+    # Importer les données
+    csv_file_path = "data/cartographie_formations_parcoursup.csv"  # Remplacez par le chemin de votre fichier CSV
+    import_csv(csv_file_path)
@@ -1,10 +1,18 @@
-import pandas as pd
 import psycopg2
-from psycopg2 import sql
-import numpy as np
 import time
 from datetime import timedelta
 
+from checkpoints import PostgresCheckpoint, load_postgres
+from csv_reader import iter_rows
+from dead_letter import DeadLetterWriter, dead_letter_path
+from import_metrics import ImportMetrics
+import analytics
+import geo_search
+import text_search
+from postgres_bulk import load_rows, prepare_key, rows_per_second
+from postgres_partitions import load_partitions
+from query_cache import invalidate_after_import, track_sessions
+
 # Configuration de la connexion à la base de données
 db_params = {
     "dbname": "DBR",
@@ -14,7 +22,7 @@ db_params = {
     "port": "5432"
 }
 
-def create_table():
+def create_table(partitioned=False):
     # Création de la table avec les colonnes appropriées
     create_table_query = """
     CREATE TABLE IF NOT EXISTS formation_2 (
@@ -45,10 +53,21 @@ def create_table():
         code_formation VARCHAR(50)
     )
     """
+    if partitioned:
+        # Une partition par session, attachée par l'importeur
+        create_table_query += "PARTITION BY LIST (session)"
     try:
         conn = psycopg2.connect(**db_params)
         cur = conn.cursor()
         cur.execute(create_table_query)
+        # Colonne position calculée depuis localisation, avec son index GiST
+        geo_search.prepare_postgres(cur, "formation_2")
+        # Colonne tsvector (français) pour la recherche plein texte, avec son index GIN
+        text_search.prepare_postgres(cur, "formation_2")
+        # Vues matérialisées des agrégats des tableaux de bord (voir analytics.py)
+        analytics.prepare_postgres(cur, "formation_2")
+        # Clé unique (session, code) permanente: les imports la respectent par upsert
+        prepare_key(cur, "formation_2")
         conn.commit()
         print("Table créée avec succès")
     except Exception as e:
@@ -59,60 +78,74 @@ def create_table():
         if conn:
             conn.close()
 
-def import_csv(file_path):
+def import_csv(file_path, mode="copy", chunksize=None, memory_limit_mb=None, partitioned=False,
+               invalidate_cache=True, metrics_dir=None, rejects_path=None, checkpoint=False,
+               refresh_views=True):
+    """Charge le CSV; les lignes refusées par PostgreSQL vont dans `rejects_path`
+    (par défaut <fichier>.rejets_postgres.csv) au lieu d'interrompre le chargement.
+    Avec `checkpoint`, les lignes sont validées par lots avec un point de reprise
+    (voir checkpoints.py): relancé après une coupure, l'import saute les lots validés.
+    Renvoie le nombre de lignes importées avec succès (None si l'import échoue)."""
+    # Durée de chaque étape (lecture_csv, transformation, ecriture, commit), rapport JSON / Prometheus
+    metrics = ImportMetrics("postgres_formation_2")
     start_time = time.time()
+    conn = None
+    cur = None
+    dead_letter = None
     try:
-        # Lecture du fichier CSV avec pandas
-        print("Début de la lecture du fichier CSV...")
-        df = pd.read_csv(file_path, 
-                        sep=';', 
-                        encoding='utf-8',
-                        na_values=['', 'NA', 'N/A', 'null', 'NULL', 'None'])
-        
-        # Remplacement des NaN de pandas par None pour PostgreSQL
-        df = df.replace({np.nan: None})
-        print(f"Lecture du fichier terminée. {len(df)} lignes trouvées.")
-        
         # Connexion à la base de données
         conn = psycopg2.connect(**db_params)
         cur = conn.cursor()
+
+        # Point de reprise d'un import interrompu du même fichier (lignes déjà validées)
+        # Une formation par (session, code): un réimport remplace les lignes au lieu de les dupliquer
+        prepare_key(cur, "formation_2")
+        resume = PostgresCheckpoint(cur, file_path, "formation_2") if checkpoint else None
+        start_row = resume.load() if resume else 0
+        if resume and partitioned:
+            raise ValueError("Les points de reprise ne s'appliquent pas au chargement par partitions")
+        dead_letter = DeadLetterWriter(rejects_path or dead_letter_path(file_path, "postgres"), "postgres",
+                                       append=start_row > 0)
+
+        print("Début de la lecture en flux du fichier CSV...")
+        # Lecture du fichier CSV par blocs, après les lignes déjà validées
+        rows = iter_rows(file_path, chunksize=chunksize, memory_limit_mb=memory_limit_mb, metrics=metrics,
+                         start_row=start_row)
+        # Sessions présentes dans le fichier, dont le cache Redis sera invalidé
+        sessions = set(resume.sessions) if resume else set()
+        rows = track_sessions(rows, sessions)
         
-        # Compteurs pour le suivi
-        total_rows = 0
-        successful_rows = 0
-        
-        print("Début de l'importation des données...")
-        # Préparation des données pour l'insertion
-        for _, row in df.iterrows():
-            try:
-                total_rows += 1
-                insert_query = """
-                INSERT INTO formation_2 (
-                    session, etablissement_id, etablissement_nom, etablissement_type,
-                    formation_type, formation_nom_long, mentions_specialites,
-                    formation_apprentissage, internat, amenagement,
-                    informations_complementaires, region, departement, commune,
-                    lien_fiche, lien_statistiques, site_internet, localisation,
-                    formation_nom_court, code_formation_parcoursup,
-                    code_portail_parcoursup, etablissement_id_paysage,
-                    composante_id_paysage, rnd, code_formation
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 
-                         %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """
-                values = tuple(row)
-                cur.execute(insert_query, values)
-                successful_rows += 1
-                
-                # Affichage de la progression tous les 1000 enregistrements
-                if successful_rows % 1000 == 0:
-                    print(f"Progression: {successful_rows}/{total_rows} lignes traitées")
-                
-            except Exception as e:
-                print(f"Erreur lors de l'insertion de la ligne {total_rows}: {e}")
-                continue
+        print(f"Début de l'importation des données (mode {mode})...")
+        # Chargement des lignes selon le mode choisi (copy, values ou row)
+        if resume:
+            # Une transaction par lot de checkpoint_params["commit_rows"] lignes, point de reprise compris
+            total_rows, successful_rows, load_duration = load_postgres(
+                conn, cur, "formation_2", rows, resume, sessions, mode=mode, dead_letter=dead_letter, metrics=metrics,
+                upsert=True)
+        elif partitioned:
+            # Chaque session est chargée dans sa propre table puis attachée comme partition
+            load_start = time.time()
+            total_rows, successful_rows = load_partitions(cur, "formation_2", rows, mode=mode,
+                                                          dead_letter=dead_letter, upsert=True)
+            load_duration = time.time() - load_start
+        else:
+            total_rows, successful_rows, load_duration = load_rows(cur, "formation_2", rows, mode=mode,
+                                                                   dead_letter=dead_letter, upsert=True)
         
-        # Validation des changements
-        conn.commit()
+        # COPY consomme les lignes au fil de l'eau: l'écriture est le chargement hors lecture et transformation
+        metrics.record("ecriture", max(0.0, load_duration - metrics.seconds("lecture_csv", "transformation")))
+        metrics.add_errors("ecriture", total_rows - successful_rows)
+
+        # Validation des changements (import terminé: le point de reprise est supprimé)
+        if resume:
+            resume.clear()
+        with metrics.stage("commit"):
+            conn.commit()
+        if invalidate_cache:
+            invalidate_after_import("formation_2", sessions)
+        if refresh_views:
+            # Agrégats recalculés sans bloquer les lectures des tableaux de bord
+            analytics.refresh_postgres(conn, "formation_2")
         
         # Calcul de la durée totale
         end_time = time.time()
@@ -125,12 +158,18 @@ def import_csv(file_path):
         print(f"Nombre total de lignes traitées: {total_rows}")
         print(f"Nombre de lignes importées avec succès: {successful_rows}")
         print(f"Nombre de lignes en erreur: {total_rows - successful_rows}")
+        print(f"Débit du chargement (mode {mode}): {rows_per_second(successful_rows, load_duration):.0f} lignes/s")
         if total_rows > 0:
             print(f"Taux de réussite: {(successful_rows/total_rows)*100:.2f}%")
+        metrics.print_summary()
+        metrics.write(metrics_dir)
+        return successful_rows
         
     except Exception as e:
         print(f"Erreur lors de l'importation: {e}")
     finally:
+        if dead_letter:
+            dead_letter.close()
         if cur:
             cur.close()
         if conn:
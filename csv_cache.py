@@ -0,0 +1,270 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+# Configuration du cache Arrow des CSV analysés
+cache_params = {
+    # Dossier des fichiers <nom du CSV>.<chemin>.<empreinte>.v<version>.arrow et de leur empreinte mémorisée
+    "dir": "data/cache",
+    # Colonnes texte encodées en dictionnaire si (valeurs distinctes / lignes) ne dépasse pas ce ratio
+    "dictionary_max_ratio": 0.5,
+    # Lignes par record batch dans le fichier Arrow (au plus)
+    "batch_rows": 65536,
+    # Octets de CSV analysés à la fois: la mémoire de construction ne dépend pas de la taille du fichier
+    "read_block_bytes": 16 << 20,
+}
+
+# Incrémentée quand le typage du cache change: les caches des versions précédentes sont reconstruits
+CACHE_VERSION = 2
+
+# Valeurs NULL par défaut de pandas.read_csv, pour que le cache donne les mêmes valeurs que pandas
+PANDAS_NA_VALUES = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+                    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"]
+
+
+def _content_hash(file_path, block_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _base_name(file_path):
+    """Nom des fichiers du cache d'un CSV: <nom du CSV>.<8 caractères d'empreinte du chemin absolu>.
+
+    Deux CSV de même nom dans des dossiers différents ont chacun leur cache.
+    """
+    source = os.path.abspath(file_path)
+    path_id = hashlib.blake2b(source.encode("utf-8"), digest_size=4).hexdigest()
+    return f"{os.path.splitext(os.path.basename(file_path))[0]}.{path_id}"
+
+
+def digest_path(file_path):
+    """Empreinte mémorisée du fichier: <dossier du cache>/<nom du CSV>.<chemin>.empreinte.json."""
+    return os.path.join(cache_params["dir"], f"{_base_name(file_path)}.empreinte.json")
+
+
+def _file_state(file_path):
+    stat = os.stat(file_path)
+    return {"source": os.path.abspath(file_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _saved_digest(file_path, state):
+    # Empreinte mémorisée, si le fichier n'a changé ni de taille ni de date depuis son calcul
+    try:
+        with open(digest_path(file_path), encoding="utf-8") as f:
+            saved = json.load(f)
+        if all(saved.get(field) == value for field, value in state.items()):
+            return saved["digest"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def file_hash(file_path):
+    """Empreinte du contenu du fichier: le cache est invalidé dès que le CSV change.
+
+    Le fichier n'est relu que si sa taille ou sa date de modification (ns) ont
+    changé depuis le dernier calcul, gardé dans digest_path(file_path).
+    """
+    state = _file_state(file_path)
+    digest = _saved_digest(file_path, state)
+    if digest is not None:
+        return digest
+
+    path = digest_path(file_path)
+    state["digest"] = _content_hash(file_path)
+    try:
+        os.makedirs(cache_params["dir"], exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        # Sans dossier de cache inscriptible, l'empreinte est recalculée à chaque fois
+        print(f"Empreinte de {file_path} non mémorisée: {e}")
+    return state["digest"]
+
+
+def cache_path(file_path, digest=None):
+    return os.path.join(cache_params["dir"],
+                        f"{_base_name(file_path)}.{digest or file_hash(file_path)}.v{CACHE_VERSION}.arrow")
+
+
+def _cache_files(file_path):
+    # Seulement <nom>.<chemin>.<empreinte>[.v<N>].arrow: les caches de data.v2.csv ne sont pas ceux de data.csv
+    if not os.path.isdir(cache_params["dir"]):
+        return
+    pattern = re.compile(re.escape(_base_name(file_path)) + r"\.[0-9a-f]{32}(\.v[0-9]+)?\.arrow")
+    for entry in os.listdir(cache_params["dir"]):
+        if pattern.fullmatch(entry):
+            yield os.path.join(cache_params["dir"], entry)
+
+
+def _stale_caches(file_path, path):
+    return (cache for cache in _cache_files(file_path) if cache != path)
+
+
+def _plain_type(arrow_type):
+    return (pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type) or pa.types.is_boolean(arrow_type)
+            or pa.types.is_string(arrow_type) or pa.types.is_null(arrow_type))
+
+
+class _GrowingDictionary:
+    """Encodage dictionnaire d'une colonne texte, partagé par tous les lots du fichier.
+
+    Les valeurs nouvelles d'un lot sont ajoutées à la fin du dictionnaire: le
+    fichier IPC n'accepte qu'un dictionnaire par colonne, complété par des deltas.
+    """
+
+    def __init__(self):
+        self.values = pa.array([], pa.string())
+
+    def encode(self, column):
+        distinct = pc.drop_null(pc.unique(column))
+        added = pc.filter(distinct, pc.invert(pc.is_in(distinct, value_set=self.values)))
+        if len(added):
+            self.values = pa.concat_arrays([self.values, added])
+        return pa.DictionaryArray.from_arrays(pc.index_in(column, value_set=self.values), self.values)
+
+
+def _plain_columns(batch):
+    # pandas ne convertit pas les dates sans parse_dates: elles restent du texte
+    return [column if _plain_type(column.type) else column.cast(pa.string()) for column in batch.columns]
+
+
+def _dictionaries(columns, names):
+    """Encodeurs des colonnes texte peu variées, choisies sur le premier lot."""
+    dictionaries = {}
+    for name, column in zip(names, columns):
+        if pa.types.is_string(column.type) and len(column):
+            if len(pc.unique(column)) / len(column) <= cache_params["dictionary_max_ratio"]:
+                dictionaries[name] = _GrowingDictionary()
+    return dictionaries
+
+
+def _column_types(dtypes):
+    # Types Arrow du schéma pandas: entiers nullables en int64, tout le reste en texte
+    return {name: pa.int64() if dtype == "Int64" else pa.string() for name, dtype in (dtypes or {}).items()}
+
+
+def build_cache(file_path, na_values=(), force=False, dtypes=None):
+    """Analyse le CSV une fois avec le lecteur Arrow (multithread) et l'écrit au format Arrow IPC.
+
+    Le CSV est lu et écrit lot par lot: seul le lot en cours est en mémoire. Le
+    fichier n'est pas compressé pour pouvoir être projeté en mémoire (mmap) sans
+    copie. `dtypes` (schéma pandas de csv_reader) fixe le type de chaque colonne:
+    sans lui, les types sont déduits du premier lot. Renvoie le chemin du cache.
+    """
+    if pa is None:
+        raise ImportError("Le cache Arrow nécessite le paquet pyarrow (pip install pyarrow)")
+    digest = file_hash(file_path)
+    path = cache_path(file_path, digest)
+    if os.path.exists(path) and not force:
+        return path
+    os.makedirs(cache_params["dir"], exist_ok=True)
+
+    reader = pa_csv.open_csv(
+        file_path,
+        read_options=pa_csv.ReadOptions(use_threads=True, encoding="utf8",
+                                        block_size=cache_params["read_block_bytes"]),
+        parse_options=pa_csv.ParseOptions(delimiter=";"),
+        convert_options=pa_csv.ConvertOptions(
+            null_values=sorted(set(PANDAS_NA_VALUES) | set(na_values)),
+            strings_can_be_null=True,
+            column_types=_column_types(dtypes),
+            # Pas de détection de dates: même typage que pandas.read_csv
+            timestamp_parsers=[],
+        ),
+    )
+    names = reader.schema.names
+    dictionaries = None
+    writer = None
+    # Écriture puis renommage: un import concurrent ne lit jamais un cache incomplet
+    with pa.OSFile(path + ".tmp", "wb") as sink:
+        for batch in reader:
+            columns = _plain_columns(batch)
+            if dictionaries is None:
+                dictionaries = _dictionaries(columns, names)
+            columns = [dictionaries[name].encode(column) if name in dictionaries else column
+                       for name, column in zip(names, columns)]
+            table = pa.Table.from_arrays(columns, names=names)
+            if writer is None:
+                writer = pa.ipc.new_file(sink, table.schema,
+                                         options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+            writer.write_table(table, max_chunksize=cache_params["batch_rows"])
+        if writer is None:
+            # CSV sans ligne de données: cache vide avec le schéma de l'en-tête
+            writer = pa.ipc.new_file(sink, reader.schema)
+        writer.close()
+    os.replace(path + ".tmp", path)
+
+    # Les caches d'anciennes versions du même fichier ne servent plus
+    for stale in _stale_caches(file_path, path):
+        os.remove(stale)
+    return path
+
+
+def open_cache(file_path):
+    """Table Arrow projetée en mémoire depuis le cache du fichier, None s'il n'existe pas."""
+    if pa is None:
+        return None
+    digest = _saved_digest(file_path, _file_state(file_path))
+    if digest is None and not any(_cache_files(file_path)):
+        # Aucun cache pour ce fichier: inutile de relire tout le CSV pour calculer son empreinte
+        return None
+    path = cache_path(file_path, digest)
+    if not os.path.exists(path):
+        return None
+    # Lecture sans copie: les colonnes pointent directement dans le fichier projeté
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def to_dataframe(table, dtypes):
+    """Bloc pandas d'une tranche de table, typé comme read_csv avec le schéma `dtypes`.
+
+    Le texte passe directement en chaînes pandas adossées à Arrow, sans objets
+    Python intermédiaires; les colonnes dictionnaire deviennent des catégories.
+    """
+    chunk = table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
+    return chunk.astype({name: dtype for name, dtype in dtypes.items() if name in chunk.columns})
+
+
+def main():
+    from csv_reader import CSV_DTYPES, NA_VALUES, reader_params
+
+    parser = argparse.ArgumentParser(description="Convertit un CSV en cache Arrow IPC projeté en mémoire par les imports")
+    parser.add_argument("csv_file", nargs="?", default="data/cartographie_formations_parcoursup.csv")
+    parser.add_argument("--force", action="store_true", help="Reconstruit le cache même s'il est à jour")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    path = build_cache(args.csv_file, NA_VALUES, args.force, CSV_DTYPES)
+    build_duration = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    table = open_cache(args.csv_file)
+    open_duration = time.perf_counter() - start_time
+    encoded = [name for name, column_type in zip(table.column_names, table.schema.types)
+               if pa.types.is_dictionary(column_type)]
+    print(f"Cache: {path} ({os.path.getsize(path) / 1024 / 1024:.1f} Mo, {table.num_rows} lignes)")
+    print(f"Construction: {build_duration:.2f}s, ouverture (mmap + empreinte): {open_duration:.3f}s")
+    print(f"Colonnes encodées en dictionnaire ({len(encoded)}): {', '.join(encoded)}")
+    if not reader_params["use_cache"]:
+        print("Attention: reader_params['use_cache'] vaut False, les imports n'utiliseront pas ce cache")
+
+
+if __name__ == "__main__":
+    main()
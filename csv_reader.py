@@ -0,0 +1,154 @@
+import os
+from contextlib import nullcontext
+
+import pandas as pd
+
+import csv_cache
+from column_mapping import CSV_COLUMNS, to_tuples
+
+# Valeurs considérées comme NULL dans les fichiers Parcoursup
+NA_VALUES = ['', 'NA', 'N/A', 'null', 'NULL', 'None']
+
+# Colonnes à peu de valeurs distinctes: une catégorie stocke chaque valeur une seule fois par bloc
+CATEGORY_COLUMNS = [
+    "Types d'établissement",
+    "Types de formation",
+    "Mentions/Spécialités",
+    "Formations en apprentissage",
+    "Internat",
+    "Région",
+    "Département",
+    "Commune",
+]
+
+# Entiers pouvant être NULL (Int64 plutôt que float64 avec NaN). Les codes Parcoursup
+# sont des identifiants: ils restent du texte, convertis en nombre seulement là où un
+# calcul l'exige (seau Redis, seau de réconciliation)
+INTEGER_COLUMNS = [
+    "Session",
+]
+
+# Chaînes stockées au format Arrow quand pyarrow est installé, sinon chaînes pandas
+STRING_DTYPE = "string[pyarrow]" if csv_cache.pa is not None else "string"
+
+# Schéma explicite des 25 colonnes: pas d'inférence, mêmes types pour chaque bloc
+CSV_DTYPES = {
+    csv_column: ("category" if csv_column in CATEGORY_COLUMNS
+                 else "Int64" if csv_column in INTEGER_COLUMNS
+                 else STRING_DTYPE)
+    for csv_column in CSV_COLUMNS
+}
+
+# Configuration de la lecture en flux
+reader_params = {
+    # Nombre de lignes par bloc lorsque aucune limite mémoire n'est fixée
+    "chunksize": 10000,
+    # Limite mémoire (en Mo) pour un bloc en cours de traitement, None pour désactiver
+    "memory_limit_mb": None,
+    # Nombre de lignes lues pour estimer la taille mémoire d'une ligne
+    "sample_rows": 1000,
+    # Un bloc est présent plusieurs fois en mémoire (lecture, transformation, lot du loader)
+    "copies_per_chunk": 3,
+    # Lecture depuis le cache Arrow du fichier s'il existe et correspond au contenu (voir csv_cache.py)
+    "use_cache": True
+}
+
+
+def normalize_nulls(chunk):
+    """Remplace les NULL de pandas (NaN, pd.NA) par None dans tout le bloc, colonnes converties en objets.
+
+    Les imports ne l'utilisent plus: les NULL sont convertis en None à l'écriture
+    (column_mapping). Sert de référence au rapport mémoire de bench_memory.py.
+    """
+    return chunk.astype(object).where(chunk.notna(), None)
+
+
+def estimate_chunksize(sample, memory_limit_mb, copies_per_chunk=None):
+    """Calcule le nombre de lignes par bloc qui respecte la limite mémoire."""
+    if copies_per_chunk is None:
+        copies_per_chunk = reader_params["copies_per_chunk"]
+    bytes_per_row = sample.memory_usage(index=False, deep=True).sum() / max(len(sample), 1)
+    budget = memory_limit_mb * 1024 * 1024 / copies_per_chunk
+    return max(1, int(budget // max(bytes_per_row, 1)))
+
+
+def stage(metrics, name):
+    """Mesure de l'étape `name` si des métriques sont collectées (import_metrics.ImportMetrics)."""
+    return metrics.stage(name) if metrics is not None else nullcontext()
+
+
+def read_csv_chunks(file_path, chunksize=None, memory_limit_mb=None, metrics=None, start_row=0):
+    """Lit le CSV par blocs de taille fixe typés selon CSV_DTYPES, sans jamais charger tout le fichier.
+
+    Les NULL restent des valeurs manquantes pandas (NaN, pd.NA): ils ne deviennent
+    None qu'au moment de construire les lignes à écrire. Avec `metrics`, la lecture
+    (lecture_csv) est mesurée et chaque bloc est compté dans le débit. Les
+    `start_row` premières lignes de données sont sautées (reprise d'un import).
+    """
+    if memory_limit_mb is None:
+        memory_limit_mb = reader_params["memory_limit_mb"]
+    if chunksize is None:
+        chunksize = reader_params["chunksize"]
+
+    if reader_params["use_cache"] and isinstance(file_path, (str, os.PathLike)):
+        table = csv_cache.open_cache(file_path)
+        if table is not None:
+            yield from _cached_chunks(table, chunksize, memory_limit_mb, metrics, start_row)
+            return
+
+    reader = pd.read_csv(file_path,
+                         sep=';',
+                         encoding='utf-8',
+                         na_values=NA_VALUES,
+                         dtype=CSV_DTYPES,
+                         # Lignes sautées sans être converties (la ligne 0 est l'en-tête)
+                         skiprows=range(1, start_row + 1) if start_row else None,
+                         iterator=True)
+    with reader:
+        if memory_limit_mb is not None:
+            # Estimation de la taille d'une ligne sur un premier échantillon
+            try:
+                with stage(metrics, "lecture_csv"):
+                    sample = reader.get_chunk(reader_params["sample_rows"])
+            except StopIteration:
+                return
+            chunksize = estimate_chunksize(sample, memory_limit_mb)
+            yield _counted(sample, metrics)
+        while True:
+            try:
+                with stage(metrics, "lecture_csv"):
+                    chunk = reader.get_chunk(chunksize)
+            except StopIteration:
+                return
+            yield _counted(chunk, metrics)
+
+
+def _cached_chunks(table, chunksize, memory_limit_mb, metrics, start_row=0):
+    # Tranches de la table projetée en mémoire: seul le bloc courant est converti en pandas
+    offset = start_row
+    if memory_limit_mb is not None:
+        with stage(metrics, "lecture_csv"):
+            sample = csv_cache.to_dataframe(table.slice(offset, reader_params["sample_rows"]), CSV_DTYPES)
+        chunksize = estimate_chunksize(sample, memory_limit_mb)
+        offset += len(sample)
+        if len(sample):
+            yield _counted(sample, metrics)
+    while offset < table.num_rows:
+        with stage(metrics, "lecture_csv"):
+            chunk = csv_cache.to_dataframe(table.slice(offset, chunksize), CSV_DTYPES)
+        offset += len(chunk)
+        yield _counted(chunk, metrics)
+
+
+def _counted(chunk, metrics):
+    if metrics is not None:
+        metrics.add_rows(len(chunk))
+    return chunk
+
+
+def iter_rows(file_path, chunksize=None, memory_limit_mb=None, metrics=None, start_row=0):
+    """Itère sur les lignes du CSV sous forme de tuples (ordre des colonnes SQL), bloc par bloc."""
+    for chunk in read_csv_chunks(file_path, chunksize, memory_limit_mb, metrics, start_row):
+        with stage(metrics, "transformation"):
+            rows = to_tuples(chunk)
+        yield from rows
@@ -0,0 +1,99 @@
+import csv
+import os
+import threading
+
+from column_mapping import CSV_COLUMNS, document_to_tuple
+
+
+def dead_letter_path(file_path, store):
+    """Fichier des rejets d'un import: <fichier source>.rejets_<base>.csv."""
+    return f"{os.path.splitext(file_path)[0]}.rejets_{store}.csv"
+
+
+class DeadLetterWriter:
+    """Écrit les lignes rejetées par une base dans un CSV, avec l'erreur renvoyée.
+
+    Le fichier garde les colonnes et le séparateur du CSV source, suivis du
+    numéro de ligne d'origine et de l'erreur: après correction, il peut être
+    réimporté tel quel. Il n'est créé qu'au premier rejet. Avec `append` (reprise
+    d'un import), les rejets s'ajoutent à ceux de l'exécution interrompue.
+    """
+
+    def __init__(self, file_path, store, append=False):
+        self.file_path = file_path
+        self.store = store
+        self.append = append
+        self.count = 0
+        self._file = None
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def write(self, row_number, values, error):
+        """`values`: tuple dans l'ordre des colonnes SQL (celui du CSV)."""
+        with self._lock:
+            if self._writer is None:
+                resume = self.append and os.path.exists(self.file_path) and os.path.getsize(self.file_path) > 0
+                self._file = open(self.file_path, "a" if resume else "w", encoding="utf-8", newline="")
+                self._writer = csv.writer(self._file, delimiter=";")
+                if not resume:
+                    self._writer.writerow(CSV_COLUMNS + ["ligne_source", "base", "erreur"])
+            self._writer.writerow(list(values) + [row_number, self.store, " ".join(str(error).split())])
+            self.count += 1
+
+    def write_document(self, row_number, document, error):
+        self.write(row_number, document_to_tuple(document), error)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+            self._writer = None
+        if self.count:
+            print(f"{self.count} lignes rejetées par {self.store} écrites dans {self.file_path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def bisect_write(write_batch, numbered_rows, reject, errors=(Exception,)):
+    """Écrit un lot d'un bloc et, s'il échoue, le coupe en deux jusqu'à isoler les lignes fautives.
+
+    `write_batch(rows)` écrit toutes les lignes ou aucune et lève une exception
+    de `errors` en cas de refus. `numbered_rows` est une liste de (numéro, ligne);
+    chaque ligne refusée seule est passée à `reject(numéro, ligne, erreur)`.
+    Avec k lignes fautives sur n, il faut environ 2k·log2(n) envois au lieu de n.
+    Renvoie le nombre de lignes écrites.
+    """
+    if not numbered_rows:
+        return 0
+    try:
+        write_batch([row for _, row in numbered_rows])
+        return len(numbered_rows)
+    except errors as e:
+        if len(numbered_rows) == 1:
+            row_number, row = numbered_rows[0]
+            reject(row_number, row, e)
+            return 0
+        middle = len(numbered_rows) // 2
+        return (bisect_write(write_batch, numbered_rows[:middle], reject, errors)
+                + bisect_write(write_batch, numbered_rows[middle:], reject, errors))
+
+
+async def bisect_write_async(write_batch, numbered_rows, reject, errors=(Exception,)):
+    """bisect_write pour un `write_batch(rows)` asynchrone (coroutine)."""
+    if not numbered_rows:
+        return 0
+    try:
+        await write_batch([row for _, row in numbered_rows])
+        return len(numbered_rows)
+    except errors as e:
+        if len(numbered_rows) == 1:
+            row_number, row = numbered_rows[0]
+            reject(row_number, row, e)
+            return 0
+        middle = len(numbered_rows) // 2
+        return (await bisect_write_async(write_batch, numbered_rows[:middle], reject, errors)
+                + await bisect_write_async(write_batch, numbered_rows[middle:], reject, errors))
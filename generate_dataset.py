@@ -0,0 +1,133 @@
+import argparse
+import csv
+import random
+
+from column_mapping import CSV_COLUMNS
+
+# Régions et nombre de départements par région (ordre de grandeur national)
+REGIONS = {
+    "Auvergne-Rhône-Alpes": 12, "Bourgogne-Franche-Comté": 8, "Bretagne": 4,
+    "Centre-Val de Loire": 6, "Corse": 2, "Grand Est": 10, "Hauts-de-France": 5,
+    "Île-de-France": 8, "Normandie": 5, "Nouvelle-Aquitaine": 12, "Occitanie": 13,
+    "Pays de la Loire": 5, "Provence-Alpes-Côte d'Azur": 6, "Guadeloupe": 1,
+    "Martinique": 1, "Guyane": 1, "La Réunion": 1, "Mayotte": 1,
+}
+
+TYPES_ETABLISSEMENT = ["Lycée", "Université", "École d'ingénieurs", "École de commerce",
+                       "IUT", "École d'art", "Institut de formation en soins infirmiers", "CFA"]
+TYPES_FORMATION = ["BTS", "BUT", "Licence", "CPGE", "Formation d'ingénieur", "DE infirmier",
+                   "DN MADE", "Formation des écoles de commerce", "DEUST", "DCG", "PASS", "L.AS"]
+DISCIPLINES = ["Informatique", "Droit", "Gestion", "Mathématiques", "Biologie", "Commerce",
+               "Langues étrangères", "Histoire", "Physique", "Chimie", "Santé", "Arts plastiques",
+               "Économie", "Génie civil", "Tourisme", "Communication", "Sport", "Électronique"]
+MOTS = ["formation", "parcours", "stage", "alternance", "projet", "étudiants", "entreprise",
+        "accompagnement", "numérique", "international", "recherche", "option", "pratique",
+        "enseignement", "semestre", "spécialité", "métiers", "compétences", "accueil", "dossier"]
+
+# Taux de valeurs NULL par colonne (les autres colonnes sont toujours renseignées)
+NULL_RATES = {
+    "Mentions/Spécialités": 0.55,
+    "Aménagement": 0.7,
+    "Informations complémentaires": 0.4,
+    "Site internet de l'établissement": 0.1,
+    "Localisation": 0.02,
+    "etablissement_id_paysage": 0.15,
+    "composante_id_paysage": 0.6,
+    "rnd": 0.3,
+    "code_formation": 0.05,
+}
+
+
+def _text(rng, min_words, max_words):
+    return " ".join(rng.choice(MOTS) for _ in range(rng.randint(min_words, max_words)))
+
+
+def build_referentials(rng, etablissements):
+    """Départements, communes et établissements partagés par toutes les lignes générées."""
+    departements = []
+    numero = 1
+    for region, count in REGIONS.items():
+        for _ in range(count):
+            departements.append((region, f"Département {numero:03d}"))
+            numero += 1
+
+    etablissement_list = []
+    for i in range(etablissements):
+        region, departement = rng.choice(departements)
+        commune = f"Commune {departement[-3:]}-{rng.randint(1, 40):02d}"
+        latitude = round(rng.uniform(42.3, 51.0), 6)
+        longitude = round(rng.uniform(-4.8, 8.2), 6)
+        etablissement_list.append({
+            "Identifiant de l'établissement": f"{rng.randint(1, 9999999):07d}{chr(65 + i % 26)}",
+            "Nom de l'établissement": f"{rng.choice(TYPES_ETABLISSEMENT)} {commune} {i}",
+            "Types d'établissement": rng.choice(TYPES_ETABLISSEMENT),
+            "Région": region,
+            "Département": departement,
+            "Commune": commune,
+            "Site internet de l'établissement": f"https://etablissement-{i}.example.fr",
+            "Localisation": f"{latitude}, {longitude}",
+            "etablissement_id_paysage": f"p{i:06d}",
+        })
+    return etablissement_list
+
+
+def generate_rows(rows, sessions, seed=0):
+    """Génère `rows` lignes réalistes, une session après l'autre."""
+    rng = random.Random(seed)
+    # Environ 6 formations par établissement, comme dans la cartographie Parcoursup
+    etablissements = build_referentials(rng, max(1, rows // (6 * len(sessions))))
+    per_session = -(-rows // len(sessions))
+    produced = 0
+    for session in sessions:
+        for code in range(1, per_session + 1):
+            if produced >= rows:
+                return
+            etablissement = rng.choice(etablissements)
+            discipline = rng.choice(DISCIPLINES)
+            formation_type = rng.choice(TYPES_FORMATION)
+            row = dict(etablissement)
+            row.update({
+                "Session": session,
+                "Types de formation": formation_type,
+                "Nom long de la formation": f"{formation_type} - {discipline} - {_text(rng, 2, 8)}",
+                "Mentions/Spécialités": rng.choice(DISCIPLINES),
+                "Formations en apprentissage": rng.choice(["Formation en apprentissage", "Formation sous statut scolaire"]),
+                "Internat": rng.choice(["Avec internat", "Sans internat"]),
+                "Aménagement": _text(rng, 3, 12),
+                "Informations complémentaires": _text(rng, 20, 120),
+                "Lien vers la fiche formation": f"https://dossierappel.parcoursup.fr/Candidats/public/fiches/afficherFicheFormation?g_ta_cod={code}",
+                "Lien vers les données statistiques pour l'année antérieure": f"https://dossierappel.parcoursup.fr/Candidats/public/statistiques?g_ta_cod={code}",
+                "Nom court de la formation": f"{formation_type} {discipline}",
+                "Code interne Parcoursup de la formation": code,
+                "Code interne Parcoursup pour les portails": rng.randint(1, 5000),
+                "composante_id_paysage": f"c{rng.randint(1, 99999):05d}",
+                "rnd": f"RND{rng.randint(1, 9999):04d}",
+                "code_formation": f"{rng.randint(1, 99999999):08d}",
+            })
+            for column, rate in NULL_RATES.items():
+                if rng.random() < rate:
+                    row[column] = ""
+            yield [row[column] for column in CSV_COLUMNS]
+            produced += 1
+
+
+def write_dataset(file_path, rows, sessions, seed=0):
+    with open(file_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(CSV_COLUMNS)
+        writer.writerows(generate_rows(rows, sessions, seed))
+    print(f"{rows} lignes écrites dans {file_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère un CSV synthétique au format de la cartographie Parcoursup")
+    parser.add_argument("output")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[2023, 2024])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_dataset(args.output, args.rows, args.sessions, args.seed)
+
+
+if __name__ == "__main__":
+    main()
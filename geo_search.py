@@ -0,0 +1,182 @@
+import argparse
+import json
+import math
+
+from column_mapping import SQL_COLUMNS, tuple_to_document
+from redis_formats import STORAGE_FORMATS, load_formations
+
+# Ensemble trié GEO des formations, membre = identifiant formation:session:code
+GEO_KEY = "geo:formations"
+
+# Latitude maximale acceptée par GEOADD (projection Web Mercator)
+REDIS_MAX_LATITUDE = 85.05112878
+
+KM_PER_DEGREE = 111.32
+KM_PER_MILE = 1.609344
+
+# Colonne `localisation` au format "latitude, longitude"; les valeurs mal formées donnent NULL
+_COORDINATES_PATTERN = r"^\s*-?[0-9]+(\.[0-9]+)?\s*,\s*-?[0-9]+(\.[0-9]+)?\s*$"
+POSITION_EXPRESSION = (
+    f"CASE WHEN localisation ~ '{_COORDINATES_PATTERN}' THEN point("
+    "split_part(localisation, ',', 2)::float8, split_part(localisation, ',', 1)::float8) END"
+)
+
+
+def parse_coordinates(value):
+    """(latitude, longitude) d'une valeur "latitude, longitude", None si absente ou invalide."""
+    if value is None:
+        return None
+    latitude, separator, longitude = str(value).partition(",")
+    if not separator:
+        return None
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except ValueError:
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+
+def with_position(document):
+    """Copie du document avec sa position GeoJSON (index 2dsphere MongoDB), si la localisation est valide."""
+    coordinates = parse_coordinates(document["localisation"]["coordonnees"])
+    if coordinates is None:
+        return document
+    latitude, longitude = coordinates
+    # Copie: le document peut être partagé avec d'autres bases (JSON Redis)
+    localisation = dict(document["localisation"], position={"type": "Point", "coordinates": [longitude, latitude]})
+    return dict(document, localisation=localisation)
+
+
+def queue_position(pipe, formation_id, document):
+    """Met en file le GEOADD de la formation si sa localisation est utilisable par Redis."""
+    coordinates = parse_coordinates(document["localisation"]["coordonnees"])
+    if coordinates and abs(coordinates[0]) <= REDIS_MAX_LATITUDE:
+        latitude, longitude = coordinates
+        pipe.geoadd(GEO_KEY, (longitude, latitude, formation_id))
+
+
+def prepare_postgres(cur, table):
+    """Ajoute la colonne `position` (point longitude, latitude) calculée à l'insertion et son index GiST."""
+    from psycopg2 import sql
+
+    # earthdistance fournit l'opérateur <@> (distance sur la sphère, en miles) entre deux points
+    cur.execute("CREATE EXTENSION IF NOT EXISTS cube")
+    cur.execute("CREATE EXTENSION IF NOT EXISTS earthdistance")
+    cur.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS position POINT GENERATED ALWAYS AS ({}) STORED").format(
+        sql.Identifier(table), sql.SQL(POSITION_EXPRESSION)))
+    cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} USING gist (position)").format(
+        sql.Identifier(f"{table}_position_idx"), sql.Identifier(table)))
+
+
+def _bounding_box(latitude, longitude, radius_km):
+    # Rectangle englobant le cercle, utilisable par l'index GiST avant le calcul exact de distance
+    delta_latitude = radius_km / KM_PER_DEGREE
+    delta_longitude = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    return (longitude - delta_longitude, latitude - delta_latitude,
+            longitude + delta_longitude, latitude + delta_latitude)
+
+
+def near_postgres(cur, latitude, longitude, radius_km, limit=50, table="formations"):
+    """Formations à moins de `radius_km` km du point, de la plus proche à la plus lointaine.
+
+    Renvoie une liste de (distance en km, document imbriqué), comme near_mongodb et near_redis.
+    """
+    from psycopg2 import sql
+
+    query = sql.SQL("""
+        SELECT {columns}, (position <@> point(%(lon)s, %(lat)s)) * %(km_per_mile)s AS distance_km
+        FROM {table}
+        WHERE position <@ box(point(%(lon_min)s, %(lat_min)s), point(%(lon_max)s, %(lat_max)s))
+          AND (position <@> point(%(lon)s, %(lat)s)) * %(km_per_mile)s <= %(radius)s
+        ORDER BY distance_km
+        LIMIT %(limit)s
+    """).format(
+        columns=sql.SQL(", ").join(sql.Identifier(column) for column in SQL_COLUMNS),
+        table=sql.Identifier(table),
+    )
+    lon_min, lat_min, lon_max, lat_max = _bounding_box(latitude, longitude, radius_km)
+    cur.execute(query, {
+        "lat": latitude, "lon": longitude, "km_per_mile": KM_PER_MILE, "radius": radius_km, "limit": limit,
+        "lon_min": lon_min, "lat_min": lat_min, "lon_max": lon_max, "lat_max": lat_max,
+    })
+    return [(row[-1], tuple_to_document(row[:-1])) for row in cur.fetchall()]
+
+
+def near_mongodb(collection, latitude, longitude, radius_km, limit=50):
+    """Même recherche avec $geoNear sur l'index 2dsphere de localisation.position."""
+    documents = collection.aggregate([
+        {"$geoNear": {
+            "near": {"type": "Point", "coordinates": [longitude, latitude]},
+            "key": "localisation.position",
+            "distanceField": "distance_m",
+            "maxDistance": radius_km * 1000,
+            "spherical": True,
+        }},
+        {"$limit": limit},
+        {"$project": {"_id": 0}},
+    ])
+    return [(document.pop("distance_m") / 1000, document) for document in documents]
+
+
+def near_redis(client, latitude, longitude, radius_km, limit=50, storage="json"):
+    """Même recherche avec GEOSEARCH, puis lecture pipelinée des formations trouvées."""
+    results = client.geosearch(GEO_KEY, longitude=longitude, latitude=latitude, radius=radius_km, unit="km",
+                               sort="ASC", count=limit, withdist=True)
+    formation_ids = [member.decode("utf-8") for member, _ in results]
+    documents = load_formations(client, formation_ids, storage)
+    return [(distance, document) for (_, distance), document in zip(results, documents) if document]
+
+
+def main():
+    import psycopg2
+
+    import import_in_mongo
+    import import_redis
+    from create_table_postgre import db_params
+
+    parser = argparse.ArgumentParser(description="Formations à moins de X km d'un point")
+    parser.add_argument("latitude", type=float)
+    parser.add_argument("longitude", type=float)
+    parser.add_argument("--radius-km", type=float, default=10)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--backend", default="postgres", choices=["postgres", "mongodb", "redis"])
+    parser.add_argument("--table", default="formations")
+    parser.add_argument("--redis-storage", default="json", choices=STORAGE_FORMATS)
+    args = parser.parse_args()
+
+    if args.backend == "postgres":
+        conn = psycopg2.connect(**db_params)
+        try:
+            with conn.cursor() as cur:
+                results = near_postgres(cur, args.latitude, args.longitude, args.radius_km, args.limit, args.table)
+        finally:
+            conn.close()
+    elif args.backend == "mongodb":
+        client, db = import_in_mongo.connect_mongodb()
+        try:
+            results = near_mongodb(db["formations_mongodb"], args.latitude, args.longitude,
+                                   args.radius_km, args.limit)
+        finally:
+            client.close()
+    else:
+        client = import_redis.connect_redis()
+        if not client:
+            return
+        try:
+            results = near_redis(client, args.latitude, args.longitude, args.radius_km, args.limit,
+                                 args.redis_storage)
+        finally:
+            client.close()
+
+    print(f"{len(results)} formations à moins de {args.radius_km} km ({args.backend}):")
+    for distance, document in results:
+        print(f"{distance:>8.2f} km  " + json.dumps(
+            {"session": document["session"], "etablissement": document["etablissement"]["nom"],
+             "formation": document["formation"]["nom_long"], "commune": document["localisation"]["commune"]},
+            ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import argparse
+import queue
+import threading
+import time
+from datetime import timedelta
+from itertools import count
+
+import psycopg2
+
+import analytics
+import create_table_postgre
+import import_in_mongo
+import import_in_redis
+import import_redis
+from column_mapping import formation_keys, to_documents, to_flat_hashes, to_tuples
+from csv_reader import read_csv_chunks
+from geo_search import with_position
+from postgres_bulk import load_rows, load_rows_isolated, prepare_key
+from query_cache import invalidate_after_import, track_sessions
+from redis_pipeline import PipelineWriter
+
+# Marqueur de fin de flux envoyé à chaque sink
+_END = object()
+
+
+class PostgresSink:
+    """Charge chaque bloc dans la table PostgreSQL avec COPY, validé en fin d'import.
+
+    Avec `refresh`, le cache des requêtes est invalidé et les vues des agrégats
+    recalculées à la fermeture; parallel_import le fait une seule fois pour tous
+    ses processus.
+    """
+
+    name = "postgres"
+
+    def __init__(self, table="formations", mode="copy", create=True, refresh=True):
+        self.table = table
+        self.mode = mode
+        self.create = create
+        self.refresh = refresh
+        self.conn = None
+        self.cur = None
+        self.sessions = set()
+
+    def open(self):
+        if self.create:
+            create_table_postgre.create_table()
+        self.conn = psycopg2.connect(**create_table_postgre.db_params)
+        self.cur = self.conn.cursor()
+        if self.create:
+            # Clé (session, code) de la table cible, respectée par upsert dans write
+            prepare_key(self.cur, self.table)
+
+    def write(self, first_row, chunk):
+        rows = track_sessions(to_tuples(chunk), self.sessions)
+        if self.mode == "row":
+            total_rows, successful_rows, _ = load_rows(self.cur, self.table, rows, mode=self.mode, upsert=True)
+            return total_rows, successful_rows
+        # Lignes refusées isolées par SAVEPOINT: comptées en erreur sans annuler le reste du chargement
+        return load_rows_isolated(self.cur, self.table, rows, None, mode=self.mode, row_numbers=count(first_row),
+                                  upsert=True)
+
+    def close(self, success):
+        if self.conn:
+            if success:
+                self.conn.commit()
+                if self.refresh:
+                    invalidate_after_import(self.table, self.sessions)
+                    # Agrégats des tableaux de bord, comme après create_table_postgre.import_csv
+                    analytics.refresh_postgres(self.conn, self.table)
+            else:
+                self.conn.rollback()
+            self.cur.close()
+            self.conn.close()
+
+
+class MongoSink:
+    """Insère chaque bloc dans la collection formations_mongodb par lots non ordonnés.
+
+    Avec `refresh`, les collections de résumé sont recalculées à la fermeture.
+    """
+
+    name = "mongodb"
+
+    def __init__(self, batch_size=1000, indexes="after", refresh=True):
+        self.batch_size = batch_size
+        self.indexes = indexes
+        self.refresh = refresh
+        self.client = None
+        self.db = None
+        self.collection = None
+
+    def open(self):
+        self.client, self.db = import_in_mongo.connect_mongodb()
+        if not self.client:
+            raise RuntimeError("connexion à MongoDB impossible")
+        self.collection = self.db["formations_mongodb"]
+        if self.indexes == "before":
+            import_in_mongo.create_indexes(self.collection)
+
+    def write(self, first_row, chunk):
+        documents = [with_position(document) for document in to_documents(chunk)]
+        successful_rows = 0
+        for start in range(0, len(documents), self.batch_size):
+            batch = documents[start:start + self.batch_size]
+            row_numbers = range(first_row + start, first_row + start + len(batch))
+            successful_rows += import_in_mongo.insert_batch(self.collection, batch, row_numbers)
+        return len(documents), successful_rows
+
+    def close(self, success):
+        if self.client:
+            if success and self.indexes == "after":
+                import_in_mongo.create_indexes(self.collection)
+            if success and self.refresh:
+                # Collections de résumé des tableaux de bord, comme après import_in_mongo.import_csv
+                analytics.refresh_mongodb(self.db)
+            self.client.close()
+
+
+class _RedisSink:
+    """Base des sinks Redis: écriture des lignes d'un bloc par pipeline."""
+
+    connect = None
+
+    def __init__(self, pipeline_size=1000):
+        self.pipeline_size = pipeline_size
+        self.client = None
+
+    def open(self):
+        self.client = self.connect()
+        if not self.client:
+            raise RuntimeError("connexion à Redis impossible")
+
+    def queue_rows(self, chunk):
+        """Renvoie, pour chaque ligne du bloc, la fonction qui met ses commandes en file."""
+        raise NotImplementedError
+
+    def write(self, first_row, chunk):
+        writer = PipelineWriter(self.client, self.pipeline_size)
+        total_rows = 0
+        for row_number, queue_commands in enumerate(self.queue_rows(chunk), start=first_row):
+            total_rows += 1
+            writer.add_row(row_number, queue_commands)
+        writer.flush()
+        return total_rows, writer.successful_rows
+
+    def close(self, success):
+        if self.client:
+            self.client.close()
+
+
+class RedisHashSink(_RedisSink):
+    """Hash Redis plat par formation, comme import_in_redis.py."""
+
+    name = "redis_hash"
+    connect = staticmethod(import_in_redis.connect_redis)
+
+    def queue_rows(self, chunk):
+        keys = formation_keys(chunk, "Identifiant de l'établissement")
+        for key, document in zip(keys, to_flat_hashes(chunk)):
+            yield lambda pipe, key=key, document=document: pipe.hset(key, mapping=document)
+
+
+class RedisJsonSink(_RedisSink):
+    """Document JSON et index secondaires par formation, comme import_redis.py."""
+
+    name = "redis_json"
+    connect = staticmethod(import_redis.connect_redis)
+
+    def __init__(self, pipeline_size=1000, storage="json"):
+        super().__init__(pipeline_size)
+        self.storage = storage
+
+    def queue_rows(self, chunk):
+        formation_ids = formation_keys(chunk, "Code interne Parcoursup de la formation")
+        for formation_id, formation_data in zip(formation_ids, to_documents(chunk)):
+            yield lambda pipe, formation_id=formation_id, formation_data=formation_data: \
+                import_redis.queue_formation(pipe, formation_id, formation_data, self.storage)
+
+
+# Sinks disponibles, par nom
+SINKS = {
+    sink.name: sink
+    for sink in (PostgresSink, MongoSink, RedisHashSink, RedisJsonSink)
+}
+
+
+def _run_sink(sink, chunks, stats):
+    """Boucle d'un thread de sink: consomme les blocs jusqu'au marqueur de fin."""
+    start_time = time.time()
+    stats.update(total_rows=0, successful_rows=0, error=None)
+    try:
+        sink.open()
+    except Exception as e:
+        stats["error"] = e
+        print(f"[{sink.name}] Erreur à l'ouverture: {e}")
+    while True:
+        item = chunks.get()
+        if item is _END:
+            break
+        # Après une erreur, on continue de vider la file pour ne pas bloquer la lecture
+        if stats["error"] is not None:
+            continue
+        first_row, chunk = item
+        try:
+            total_rows, successful_rows = sink.write(first_row, chunk)
+            stats["total_rows"] += total_rows
+            stats["successful_rows"] += successful_rows
+        except Exception as e:
+            stats["error"] = e
+            print(f"[{sink.name}] Erreur lors de l'écriture des lignes à partir de {first_row}: {e}")
+    try:
+        sink.close(stats["error"] is None)
+    except Exception as e:
+        print(f"[{sink.name}] Erreur à la fermeture: {e}")
+    stats["duration"] = time.time() - start_time
+
+
+def import_csv(file_path, sinks, chunksize=None, memory_limit_mb=None, max_pending_chunks=2):
+    """Lit le CSV une seule fois et envoie chaque bloc à tous les sinks en parallèle.
+
+    Chaque sink a sa propre file d'au plus `max_pending_chunks` blocs: la
+    lecture se bloque dès que le sink le plus lent a pris ce retard.
+    Les agrégats des tableaux de bord sont recalculés à la fermeture des sinks
+    PostgreSQL et MongoDB. Les fichiers de rejets et les points de reprise des
+    importeurs ne sont pas pris en charge ici: une ligne refusée (isolée par
+    SAVEPOINT dans PostgreSQL) n'est que comptée en erreur, et un import
+    interrompu repart du début.
+    """
+    start_time = time.time()
+    queues = [queue.Queue(maxsize=max_pending_chunks) for _ in sinks]
+    stats = [{} for _ in sinks]
+    threads = [
+        threading.Thread(target=_run_sink, args=(sink, chunks, sink_stats), name=sink.name)
+        for sink, chunks, sink_stats in zip(sinks, queues, stats)
+    ]
+    for thread in threads:
+        thread.start()
+
+    total_rows = 0
+    try:
+        print(f"Début de l'importation vers: {', '.join(sink.name for sink in sinks)}")
+        for chunk in read_csv_chunks(file_path, chunksize, memory_limit_mb):
+            for chunks in queues:
+                chunks.put((total_rows + 1, chunk))
+            total_rows += len(chunk)
+    except Exception as e:
+        print(f"Erreur lors de la lecture du fichier: {e}")
+    finally:
+        for chunks in queues:
+            chunks.put(_END)
+        for thread in threads:
+            thread.join()
+
+    # Affichage du résumé
+    duration = time.time() - start_time
+    print("\nRésumé de l'importation:")
+    print(f"Durée totale: {str(timedelta(seconds=int(duration)))}")
+    print(f"Nombre total de lignes lues: {total_rows}")
+    for sink, sink_stats in zip(sinks, stats):
+        status = "OK" if sink_stats["error"] is None else f"ÉCHEC ({sink_stats['error']})"
+        print(f"  {sink.name:>10}: {sink_stats['successful_rows']}/{sink_stats['total_rows']} lignes "
+              f"en {sink_stats['duration']:.1f}s - {status}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import unique du CSV vers PostgreSQL, MongoDB et Redis")
+    parser.add_argument("csv_file", nargs="?", default="data/cartographie_formations_parcoursup.csv")
+    parser.add_argument("--sinks", nargs="+", default=list(SINKS), choices=list(SINKS))
+    parser.add_argument("--chunksize", type=int, default=None)
+    parser.add_argument("--memory-limit-mb", type=int, default=None)
+    parser.add_argument("--max-pending-chunks", type=int, default=2)
+    args = parser.parse_args()
+
+    sinks = [SINKS[name]() for name in args.sinks]
+    import_csv(args.csv_file, sinks,
+               chunksize=args.chunksize,
+               memory_limit_mb=args.memory_limit_mb,
+               max_pending_chunks=args.max_pending_chunks)
+
+
+if __name__ == "__main__":
+    main()
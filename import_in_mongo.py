@@ -1,9 +1,18 @@
-import pandas as pd
-import numpy as np
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, GEOSPHERE
+from pymongo.errors import BulkWriteError
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import time
 from datetime import timedelta
 
+from checkpoints import FileCheckpoint
+from analytics import refresh_mongodb
+from column_mapping import to_documents
+from csv_reader import read_csv_chunks
+from dead_letter import DeadLetterWriter, dead_letter_path
+from geo_search import with_position
+from import_metrics import ImportMetrics
+from text_search import mongo_text_index
+
 # Configuration de la connexion MongoDB
 mongo_params = {
     "host": "localhost",
@@ -12,6 +21,19 @@ mongo_params = {
     "password": "password"
 }
 
+# Code d'erreur MongoDB d'une clé _id déjà présente
+DUPLICATE_KEY = 11000
+
+# Index de la collection, construits avant ou après le chargement
+collection_indexes = [
+    [("session", ASCENDING)],
+    [("etablissement.id", ASCENDING)],
+    [("localisation.region", ASCENDING), ("session", ASCENDING)],
+    [("formation.code_formation_parcoursup", ASCENDING)],
+    # Recherche par distance ($geoNear) sur la position GeoJSON tirée de localisation
+    [("localisation.position", GEOSPHERE)]
+]
+
 def connect_mongodb():
     try:
         # Construction de l'URI de connexion
@@ -28,97 +50,153 @@ def connect_mongodb():
         print(f"Erreur de connexion à MongoDB: {e}")
         return None, None
 
-def import_csv(file_path):
+def create_indexes(collection):
+    for keys in collection_indexes:
+        collection.create_index(keys)
+    # Index texte (français) sur les noms de formation, d'établissement et les mentions
+    text_keys, text_options = mongo_text_index()
+    collection.create_index(text_keys, **text_options)
+    print(f"{len(collection_indexes) + 1} index créés sur la collection {collection.name}")
+
+def insert_batch(collection, documents, row_numbers, dead_letter=None, ignore_duplicates=False):
+    """Insère un lot sans ordre et renvoie le nombre de documents insérés.
+
+    `row_numbers` donne le numéro de ligne du CSV de chaque document, pour
+    signaler les lignes rejetées comme le faisait l'insertion unitaire.
+    MongoDB isole déjà les rejets d'un lot (writeErrors): pas besoin de le
+    couper en deux, les documents refusés vont directement dans `dead_letter`.
+    Avec `ignore_duplicates`, un _id déjà présent (lot renvoyé après une reprise)
+    compte comme inséré.
+    """
+    if not documents:
+        return 0
+    try:
+        result = collection.insert_many(documents, ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as e:
+        # Avec ordered=False, MongoDB insère tout ce qu'il peut et liste les rejets
+        already_inserted = 0
+        for error in e.details.get("writeErrors", []):
+            if ignore_duplicates and error.get("code") == DUPLICATE_KEY:
+                already_inserted += 1
+                continue
+            print(f"Erreur lors de l'insertion de la ligne {row_numbers[error['index']]}: {error.get('errmsg')}")
+            if dead_letter is not None:
+                dead_letter.write_document(row_numbers[error["index"]], documents[error["index"]], error.get("errmsg"))
+        return e.details.get("nInserted", 0) + already_inserted
+
+def import_csv(file_path, chunksize=None, memory_limit_mb=None,
+               batch_size=1000, writers=1, indexes="after", metrics_dir=None, rejects_path=None,
+               checkpoint=False, refresh_summaries=True):
+    """Importe le CSV par lots `insert_many(ordered=False)`.
+
+    `writers` fixe le nombre de lots envoyés en parallèle et `indexes`
+    vaut "before", "after" ou None selon le moment où les index sont créés.
+    Les métriques par étape sont écrites dans `metrics_dir` (voir import_metrics) et les
+    documents refusés dans `rejects_path` (par défaut <fichier>.rejets_mongodb.csv).
+    Avec `checkpoint`, la dernière ligne dont tous les lots sont écrits est gardée
+    dans <fichier>.reprise_mongodb.json et un import relancé reprend après elle;
+    l'_id des documents est alors dérivé de la ligne source, pour qu'un lot
+    renvoyé ne soit pas inséré deux fois. Avec `refresh_summaries`, les collections
+    de résumé des tableaux de bord sont recalculées à la fin (voir analytics.py).
+    Renvoie le nombre de documents insérés (None si l'import échoue).
+    """
+    metrics = ImportMetrics("mongodb_formations")
     start_time = time.time()
     client = None
-    
+    executor = None
+    # Point de reprise d'un import interrompu du même fichier (lignes déjà écrites)
+    resume = FileCheckpoint(file_path, "mongodb") if checkpoint else None
+    start_row = resume.load() if resume else 0
+    dead_letter = DeadLetterWriter(rejects_path or dead_letter_path(file_path, "mongodb"), "mongodb",
+                                   append=start_row > 0)
+
     try:
         # Connexion à MongoDB
         client, db = connect_mongodb()
         if not client:
             return
-        
+
         # Sélection de la collection
         collection = db["formations_mongodb"]
-        
-        print("Début de la lecture du fichier CSV...")
-        # Lecture du fichier CSV avec pandas
-        df = pd.read_csv(file_path, 
-                        sep=';', 
-                        encoding='utf-8',
-                        na_values=['', 'NA', 'N/A', 'null', 'NULL', 'None'])
-        
-        # Remplacement des NaN par None
-        df = df.replace({np.nan: None})
-        print(f"Lecture du fichier terminée. {len(df)} lignes trouvées.")
-        
+        if indexes == "before":
+            create_indexes(collection)
+
         # Compteurs pour le suivi
         total_rows = 0
         successful_rows = 0
-        
-        print("Début de l'importation des données...")
-        # Conversion des données en documents MongoDB
-        for _, row in df.iterrows():
-            try:
-                total_rows += 1
-                # Conversion de la ligne en dictionnaire
-                document = {
-                    "session": row["Session"],
-                    "etablissement": {
-                        "id": row["Identifiant de l'établissement"],
-                        "nom": row["Nom de l'établissement"],
-                        "type": row["Types d'établissement"],
-                        "id_paysage": row["etablissement_id_paysage"],
-                        "site_internet": row["Site internet de l'établissement"]
-                    },
-                    "formation": {
-                        "type": row["Types de formation"],
-                        "nom_long": row["Nom long de la formation"],
-                        "nom_court": row["Nom court de la formation"],
-                        "mentions_specialites": row["Mentions/Spécialités"],
-                        "apprentissage": row["Formations en apprentissage"],
-                        "code_formation": row["code_formation"],
-                        "code_formation_parcoursup": row["Code interne Parcoursup de la formation"],
-                        "code_portail_parcoursup": row["Code interne Parcoursup pour les portails"]
-                    },
-                    "caracteristiques": {
-                        "internat": row["Internat"],
-                        "amenagement": row["Aménagement"],
-                        "informations_complementaires": row["Informations complémentaires"]
-                    },
-                    "localisation": {
-                        "region": row["Région"],
-                        "departement": row["Département"],
-                        "commune": row["Commune"],
-                        "coordonnees": row["Localisation"]
-                    },
-                    "liens": {
-                        "fiche": row["Lien vers la fiche formation"],
-                        "statistiques": row["Lien vers les données statistiques pour l'année antérieure"]
-                    },
-                    "metadata": {
-                        "composante_id_paysage": row["composante_id_paysage"],
-                        "rnd": row["rnd"]
-                    }
-                }
-                
-                # Insertion du document
-                collection.insert_one(document)
-                successful_rows += 1
-                
-                # Affichage de la progression tous les 1000 enregistrements
-                if successful_rows % 1000 == 0:
-                    print(f"Progression: {successful_rows}/{total_rows} lignes traitées")
-                
-            except Exception as e:
-                print(f"Erreur lors de l'insertion de la ligne {total_rows}: {e}")
-                continue
-        
+
+        # Les lots sont écrits par un pool de threads, avec au plus 2 lots en attente par writer
+        executor = ThreadPoolExecutor(max_workers=writers)
+        pending = set()
+        # Lignes (première, dernière) de chaque lot en cours, et lots terminés en avance sur le point de reprise
+        batch_rows = {}
+        finished = {}
+        committed_row = start_row
+
+        def collect(futures):
+            nonlocal successful_rows, committed_row
+            for future in futures:
+                successful_rows += future.result()
+                first, last = batch_rows.pop(future)
+                finished[first] = last
+                # Affichage de la progression à chaque lot écrit
+                print(f"Progression: {successful_rows}/{total_rows} lignes traitées")
+            if resume:
+                # Les lots finissent dans le désordre: le point avance jusqu'au premier lot non terminé
+                while committed_row + 1 in finished:
+                    committed_row = finished.pop(committed_row + 1)
+                if committed_row > resume.rows:
+                    resume.save(committed_row)
+
+        def write_batch(batch, row_numbers):
+            with metrics.stage("ecriture", batch=True):
+                inserted = insert_batch(collection, batch, row_numbers, dead_letter, ignore_duplicates=bool(resume))
+            metrics.add_errors("ecriture", len(batch) - inserted)
+            return inserted
+
+        def submit(batch, row_numbers):
+            nonlocal pending
+            if len(pending) >= 2 * writers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            future = executor.submit(write_batch, batch, row_numbers)
+            batch_rows[future] = (row_numbers[0], row_numbers[-1])
+            pending.add(future)
+
+        print("Début de la lecture en flux et de l'importation des données...")
+        # Conversion des données en documents MongoDB, par lots de batch_size
+        # Lecture du CSV par blocs de taille bornée (NULL normalisés bloc par bloc)
+        for chunk in read_csv_chunks(file_path, chunksize, memory_limit_mb, metrics, start_row):
+            first_row = start_row + total_rows + 1
+            with metrics.stage("transformation"):
+                documents = [with_position(document) for document in to_documents(chunk)]
+                if resume:
+                    # _id stable d'une exécution à l'autre: <empreinte du fichier>:<ligne>
+                    for row_number, document in enumerate(documents, start=first_row):
+                        document["_id"] = f"{resume.digest[:16]}:{row_number}"
+            total_rows += len(documents)
+            for start in range(0, len(documents), batch_size):
+                batch = documents[start:start + batch_size]
+                submit(batch, range(first_row + start, first_row + start + len(batch)))
+
+        collect(wait(pending).done)
+
+        if indexes == "after":
+            with metrics.stage("index"):
+                create_indexes(collection)
+        if refresh_summaries:
+            with metrics.stage("resumes"):
+                refresh_mongodb(db)
+        # Import terminé: le prochain repartira du début
+        if resume:
+            resume.clear()
+
         # Calcul de la durée totale
         end_time = time.time()
         duration = end_time - start_time
         duration_formatted = str(timedelta(seconds=int(duration)))
-        
+
         # Affichage du résumé
         print("\nRésumé de l'importation:")
         print(f"Durée totale: {duration_formatted}")
@@ -127,14 +205,20 @@ def import_csv(file_path):
         print(f"Nombre de lignes en erreur: {total_rows - successful_rows}")
         if total_rows > 0:
             print(f"Taux de réussite: {(successful_rows/total_rows)*100:.2f}%")
-        
+        metrics.print_summary()
+        metrics.write(metrics_dir)
+        return successful_rows
+
     except Exception as e:
         print(f"Erreur lors de l'importation: {e}")
     finally:
+        if executor:
+            executor.shutdown(wait=True)
+        dead_letter.close()
         if client:
             client.close()
 
 if __name__ == "__main__":
     # Importer les données
     csv_file_path = "data/cartographie_formations_parcoursup.csv"  # Remplacez par le chemin de votre fichier CSV
-    import_csv(csv_file_path)
\ No newline at end of file
+    import_csv(csv_file_path)
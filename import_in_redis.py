@@ -1,9 +1,13 @@
-import pandas as pd
-import numpy as np
 import redis
 import time
 from datetime import timedelta
 
+from column_mapping import formation_keys, to_documents, to_flat_hashes
+from csv_reader import read_csv_chunks
+from dead_letter import DeadLetterWriter, dead_letter_path
+from import_metrics import ImportMetrics
+from redis_pipeline import TRANSPORT_ERRORS, PipelineWriter
+
 # Configuration de la connexion Redis
 redis_params = {
     "host": "localhost",
@@ -27,13 +31,18 @@ def connect_redis():
         print(f"Erreur de connexion à Redis: {e}")
         return None
 
-def convert_none_to_empty(value):
-    """Convertit les valeurs None en chaîne vide."""
-    return "" if value is None else value
+def import_csv(file_path, chunksize=None, memory_limit_mb=None, pipeline_size=1000, metrics_dir=None,
+               rejects_path=None):
+    """Importe le CSV dans Redis, un aller-retour réseau toutes les `pipeline_size` lignes.
 
-def import_csv(file_path):
+    Les métriques par étape sont écrites dans `metrics_dir` (voir import_metrics) et les
+    lignes refusées dans `rejects_path` (par défaut <fichier>.rejets_redis_hash.csv).
+    Renvoie le nombre de lignes importées avec succès (None si l'import échoue).
+    """
+    metrics = ImportMetrics("redis_hash")
     start_time = time.time()
     client = None
+    dead_letter = DeadLetterWriter(rejects_path or dead_letter_path(file_path, "redis_hash"), "redis_hash")
     
     try:
         # Connexion à Redis
@@ -41,69 +50,38 @@ def import_csv(file_path):
         if not client:
             return
         
-        print("Début de la lecture du fichier CSV...")
-        # Lecture du fichier CSV avec pandas
-        df = pd.read_csv(file_path, 
-                        sep=';', 
-                        encoding='utf-8',
-                        na_values=['', 'NA', 'N/A', 'null', 'NULL', 'None'])
-        
-        # Remplacement des NaN par None
-        df = df.replace({np.nan: None})
-        print(f"Lecture du fichier terminée. {len(df)} lignes trouvées.")
-        
         # Compteurs pour le suivi
         total_rows = 0
-        successful_rows = 0
+        writer = PipelineWriter(client, pipeline_size, metrics, dead_letter)
         
-        print("Début de l'importation des données...")
+        print(f"Début de la lecture en flux et de l'importation des données (pipeline de {writer.pipeline_size} lignes)...")
         # Conversion des données en clés-valeurs Redis
-        for _, row in df.iterrows():
-            try:
-                total_rows += 1
-                # Création d'une clé unique pour chaque enregistrement
-                key = f"formation:{row['Session']}:{row['Identifiant de l\'établissement']}"
-                
-                # Création d'un dictionnaire pour stocker les valeurs
-                document = {
-                    "session": convert_none_to_empty(row["Session"]),
-                    "etablissement_id": convert_none_to_empty(row["Identifiant de l'établissement"]),
-                    "etablissement_nom": convert_none_to_empty(row["Nom de l'établissement"]),
-                    "etablissement_type": convert_none_to_empty(row["Types d'établissement"]),
-                    "etablissement_id_paysage": convert_none_to_empty(row["etablissement_id_paysage"]),
-                    "etablissement_site_internet": convert_none_to_empty(row["Site internet de l'établissement"]),
-                    "formation_type": convert_none_to_empty(row["Types de formation"]),
-                    "formation_nom_long": convert_none_to_empty(row["Nom long de la formation"]),
-                    "formation_nom_court": convert_none_to_empty(row["Nom court de la formation"]),
-                    "formation_mentions_specialites": convert_none_to_empty(row["Mentions/Spécialités"]),
-                    "formation_apprentissage": convert_none_to_empty(row["Formations en apprentissage"]),
-                    "formation_code": convert_none_to_empty(row["code_formation"]),
-                    "formation_code_parcoursup": convert_none_to_empty(row["Code interne Parcoursup de la formation"]),
-                    "formation_code_portail_parcoursup": convert_none_to_empty(row["Code interne Parcoursup pour les portails"]),
-                    "caracteristiques_internat": convert_none_to_empty(row["Internat"]),
-                    "caracteristiques_amenagement": convert_none_to_empty(row["Aménagement"]),
-                    "caracteristiques_informations_complementaires": convert_none_to_empty(row["Informations complémentaires"]),
-                    "localisation_region": convert_none_to_empty(row["Région"]),
-                    "localisation_departement": convert_none_to_empty(row["Département"]),
-                    "localisation_commune": convert_none_to_empty(row["Commune"]),
-                    "localisation_coordonnees": convert_none_to_empty(row["Localisation"]),
-                    "liens_fiche": convert_none_to_empty(row["Lien vers la fiche formation"]),
-                    "liens_statistiques": convert_none_to_empty(row["Lien vers les données statistiques pour l'année antérieure"]),
-                    "metadata_composante_id_paysage": convert_none_to_empty(row["composante_id_paysage"]),
-                    "metadata_rnd": convert_none_to_empty(row["rnd"])
-                }
-                
-                # Insertion des données dans Redis
-                client.hset(key, mapping=document)
-                successful_rows += 1
-                
-                # Affichage de la progression tous les 1000 enregistrements
-                if successful_rows % 1000 == 0:
-                    print(f"Progression: {successful_rows}/{total_rows} lignes traitées")
-                
-            except Exception as e:
-                print(f"Erreur lors de l'insertion de la ligne {total_rows}: {e}")
-                continue
+        # Lecture du CSV par blocs de taille bornée (NULL normalisés bloc par bloc)
+        for chunk in read_csv_chunks(file_path, chunksize, memory_limit_mb, metrics):
+            # Clés et hashes construits colonne par colonne pour tout le bloc
+            with metrics.stage("transformation"):
+                keys = formation_keys(chunk, "Identifiant de l'établissement")
+                hashes = to_flat_hashes(chunk)
+                # Documents imbriqués, écrits dans les rejets si une ligne est refusée
+                documents = to_documents(chunk)
+            for key, flat_hash, document in zip(keys, hashes, documents):
+                try:
+                    total_rows += 1
+                    # Insertion des données dans Redis, envoyée par le pipeline
+                    writer.add_row(total_rows, lambda pipe: pipe.hset(key, mapping=flat_hash), document)
+                    
+                except TRANSPORT_ERRORS:
+                    raise
+                except Exception as e:
+                    print(f"Erreur lors de l'insertion de la ligne {total_rows}: {e}")
+                    continue
+            
+            writer.flush()
+            # Affichage de la progression à chaque bloc lu
+            print(f"Progression: {writer.successful_rows}/{total_rows} lignes traitées")
+        
+        writer.flush()
+        successful_rows = writer.successful_rows
         
         # Calcul de la durée totale
         end_time = time.time()
@@ -116,12 +94,17 @@ def import_csv(file_path):
         print(f"Nombre total de lignes traitées: {total_rows}")
         print(f"Nombre de lignes importées avec succès: {successful_rows}")
         print(f"Nombre de lignes en erreur: {total_rows - successful_rows}")
+        print(f"Débit Redis: {writer.ops} commandes, {writer.ops_per_second():.0f} ops/s")
         if total_rows > 0:
             print(f"Taux de réussite: {(successful_rows/total_rows)*100:.2f}%")
+        metrics.print_summary()
+        metrics.write(metrics_dir)
+        return successful_rows
         
     except Exception as e:
         print(f"Erreur lors de l'importation: {e}")
     finally:
+        dead_letter.close()
         if client:
             client.close()
 
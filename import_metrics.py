@@ -0,0 +1,181 @@
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+# Configuration des rapports de métriques
+metrics_params = {
+    # Dossier des rapports <nom>.json et <nom>.prom (textfile Prometheus); None: pas de fichier
+    "output_dir": None,
+    # Bornes (secondes) de l'histogramme des latences de lot
+    "latency_buckets": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+}
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+                break
+
+    def cumulative(self):
+        """Comptes cumulés par borne, comme les buckets `le` de Prometheus."""
+        total = 0
+        cumulative = []
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+
+class ImportMetrics:
+    """Mesures d'un import: durée par étape, latence des lots, débit dans le temps, erreurs, mémoire.
+
+    Étapes usuelles: lecture_csv, transformation, ecriture, commit. Utilisable
+    depuis plusieurs threads: avec des écritures parallèles, le temps cumulé d'une
+    étape peut dépasser la durée de l'import.
+    """
+
+    def __init__(self, name, buckets=None):
+        self.name = name
+        self.start_time = time.time()
+        self._lock = threading.Lock()
+        self._buckets = buckets or metrics_params["latency_buckets"]
+        self.stage_seconds = {}
+        self.stage_calls = {}
+        self.latencies = {}
+        self.errors = {}
+        self.rows = 0
+        # (secondes depuis le début, lignes cumulées) à chaque appel de add_rows
+        self.timeline = []
+
+    def record(self, stage, duration, batch=False):
+        """Ajoute `duration` secondes à l'étape; `batch` l'enregistre aussi comme latence d'un lot."""
+        with self._lock:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + duration
+            self.stage_calls[stage] = self.stage_calls.get(stage, 0) + 1
+            if batch:
+                self.latencies.setdefault(stage, _Histogram(self._buckets)).observe(duration)
+
+    @contextmanager
+    def stage(self, stage, batch=False):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start_time, batch)
+
+    def seconds(self, *stages):
+        with self._lock:
+            return sum(self.stage_seconds.get(stage, 0.0) for stage in stages)
+
+    def add_rows(self, count):
+        with self._lock:
+            self.rows += count
+            self.timeline.append((round(time.time() - self.start_time, 3), self.rows))
+
+    def add_errors(self, stage, count=1):
+        if count:
+            with self._lock:
+                self.errors[stage] = self.errors.get(stage, 0) + count
+
+    def rows_per_second(self):
+        """Débit entre deux points successifs de la chronologie: [(secondes, lignes/s)]."""
+        rates = []
+        previous_time, previous_rows = 0.0, 0
+        for elapsed, rows in self.timeline:
+            if elapsed > previous_time:
+                rates.append((elapsed, round((rows - previous_rows) / (elapsed - previous_time), 1)))
+                previous_time, previous_rows = elapsed, rows
+        return rates
+
+    def report(self):
+        duration = time.time() - self.start_time
+        with self._lock:
+            return {
+                "import": self.name,
+                "duration_s": round(duration, 3),
+                "rows": self.rows,
+                "rows_per_second": round(self.rows / duration, 1) if duration > 0 else None,
+                # ru_maxrss est en kilo-octets sous Linux
+                "peak_memory_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                "stages": {
+                    stage: {"seconds": round(seconds, 4), "calls": self.stage_calls[stage],
+                            "share": round(seconds / duration, 4) if duration > 0 else None}
+                    for stage, seconds in self.stage_seconds.items()
+                },
+                "batch_latency": {
+                    stage: {"buckets": dict(zip(map(str, histogram.buckets), histogram.cumulative())),
+                            "count": histogram.count, "sum_s": round(histogram.sum, 4)}
+                    for stage, histogram in self.latencies.items()
+                },
+                "errors": dict(self.errors),
+                "throughput": self.rows_per_second(),
+            }
+
+    def prometheus(self):
+        """Rapport au format texte Prometheus (collecteur textfile de node_exporter)."""
+        report = self.report()
+        label = f'import="{self.name}"'
+        lines = [
+            "# HELP import_duration_seconds Durée totale du dernier import.",
+            "# TYPE import_duration_seconds gauge",
+            f"import_duration_seconds{{{label}}} {report['duration_s']}",
+            "# HELP import_rows_total Lignes lues par le dernier import.",
+            "# TYPE import_rows_total gauge",
+            f"import_rows_total{{{label}}} {report['rows']}",
+            "# HELP import_peak_memory_bytes Mémoire résidente maximale du processus d'import.",
+            "# TYPE import_peak_memory_bytes gauge",
+            f"import_peak_memory_bytes{{{label}}} {report['peak_memory_bytes']}",
+            "# HELP import_stage_seconds Temps passé dans chaque étape.",
+            "# TYPE import_stage_seconds gauge",
+        ]
+        for stage, values in report["stages"].items():
+            lines.append(f'import_stage_seconds{{{label},stage="{stage}"}} {values["seconds"]}')
+        lines += ["# HELP import_errors_total Lignes en erreur par étape.", "# TYPE import_errors_total gauge"]
+        for stage, count in report["errors"].items():
+            lines.append(f'import_errors_total{{{label},stage="{stage}"}} {count}')
+        lines += ["# HELP import_batch_duration_seconds Latence des lots écrits.",
+                  "# TYPE import_batch_duration_seconds histogram"]
+        for stage, histogram in self.latencies.items():
+            stage_label = f'{label},stage="{stage}"'
+            for bound, count in zip(histogram.buckets, histogram.cumulative()):
+                lines.append(f'import_batch_duration_seconds_bucket{{{stage_label},le="{bound}"}} {count}')
+            lines.append(f'import_batch_duration_seconds_bucket{{{stage_label},le="+Inf"}} {histogram.count}')
+            lines.append(f"import_batch_duration_seconds_sum{{{stage_label}}} {histogram.sum:.6f}")
+            lines.append(f"import_batch_duration_seconds_count{{{stage_label}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def print_summary(self):
+        report = self.report()
+        print(f"Répartition du temps par étape ({self.name}):")
+        for stage, values in sorted(report["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            share = f"{values['share'] * 100:.1f}%" if values["share"] is not None else "-"
+            print(f"  {stage:>15}: {values['seconds']:.2f}s ({share})")
+        print(f"Mémoire maximale: {report['peak_memory_bytes'] / 1024 / 1024:.0f} Mo")
+
+    def write(self, output_dir=None):
+        """Écrit <nom>.json et <nom>.prom dans `output_dir` (par défaut metrics_params["output_dir"])."""
+        output_dir = output_dir or metrics_params["output_dir"]
+        if not output_dir:
+            return
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, f"{self.name}.json"), "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        # Écriture puis renommage: le collecteur textfile ne lit jamais un fichier à moitié écrit
+        prometheus_path = os.path.join(output_dir, f"{self.name}.prom")
+        with open(prometheus_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(prometheus_path + ".tmp", prometheus_path)
+        print(f"Métriques écrites dans {output_dir}")
@@ -1,10 +1,16 @@
-import pandas as pd
-import numpy as np
 import redis
-import json
 import time
 from datetime import timedelta
 
+from checkpoints import FileCheckpoint
+from column_mapping import formation_keys, to_documents
+from csv_reader import read_csv_chunks
+from dead_letter import DeadLetterWriter, dead_letter_path
+from geo_search import queue_position
+from import_metrics import ImportMetrics
+from redis_formats import _require_msgpack, queue_record
+from redis_pipeline import TRANSPORT_ERRORS, PipelineWriter
+
 # Configuration de la connexion Redis
 redis_params = {
     "host": "localhost",
@@ -23,127 +29,144 @@ def connect_redis():
         print(f"Erreur de connexion à Redis: {e}")
         return None
 
-def import_csv(file_path):
+# Index secondaires: famille -> chemin de la valeur indexée dans le document
+INDEX_FAMILIES = {
+    "etablissement": ("etablissement", "id"),
+    "region": ("localisation", "region"),
+    "session": ("session", None),
+    "departement": ("localisation", "departement"),
+    "type_formation": ("formation", "type"),
+    "apprentissage": ("formation", "apprentissage"),
+}
+
+# Familles indexées même quand la valeur est vide (comportement historique)
+ALWAYS_INDEXED = ("etablissement", "session")
+
+def index_value(formation_data, family):
+    top, field = INDEX_FAMILIES[family]
+    return formation_data[top][field] if field else formation_data[top]
+
+def formation_indexes(formation_data):
+    """Couples (famille, valeur) des index secondaires d'une formation."""
+    indexes = []
+    for family in INDEX_FAMILIES:
+        value = index_value(formation_data, family)
+        if value or family in ALWAYS_INDEXED:
+            indexes.append((family, value))
+    return indexes
+
+def queue_formation(pipe, formation_id, formation_data, storage="json"):
+    """Met en file la formation, dans le format `storage`, et ses index secondaires."""
+    # Stockage de la formation (voir redis_formats.STORAGE_FORMATS)
+    queue_record(pipe, formation_id, formation_data, storage)
+
+    # Création d'index secondaires pour la recherche (etablissement:, region:, session:, ...)
+    for family, value in formation_indexes(formation_data):
+        pipe.sadd(f"{family}:{value}", formation_id)
+        # Registre des valeurs de chaque famille, pour compter sans parcourir les clés
+        pipe.sadd(f"index_values:{family}", f"{value}")
+
+    # Index géographique (GEOADD) pour la recherche par distance
+    queue_position(pipe, formation_id, formation_data)
+
+def import_csv(file_path, chunksize=None, memory_limit_mb=None, pipeline_size=1000, storage="json",
+               metrics_dir=None, rejects_path=None, checkpoint=False):
+    """Importe le CSV dans Redis, un aller-retour réseau toutes les `pipeline_size` lignes.
+
+    `storage` choisit l'encodage des formations: json, hash, msgpack ou bucket.
+    Les métriques par étape sont écrites dans `metrics_dir` (voir import_metrics) et les
+    lignes refusées dans `rejects_path` (par défaut <fichier>.rejets_redis.csv).
+    Avec `checkpoint`, la dernière ligne envoyée est gardée après chaque bloc dans
+    <fichier>.reprise_redis.json et un import relancé reprend après elle (les
+    commandes SET/HSET/SADD/GEOADD peuvent être rejouées sans effet de bord).
+    Une coupure de Redis interrompt l'import: le point de reprise reste au dernier
+    bloc entièrement envoyé.
+    Renvoie le nombre de lignes importées avec succès (None si l'import échoue).
+    """
+    # Format indisponible signalé avant d'ouvrir quoi que ce soit
+    _require_msgpack(storage)
+    metrics = ImportMetrics("redis_formations")
     start_time = time.time()
     client = None
-    
+    # Point de reprise d'un import interrompu du même fichier (lignes déjà écrites)
+    resume = FileCheckpoint(file_path, "redis") if checkpoint else None
+    start_row = resume.load() if resume else 0
+    dead_letter = DeadLetterWriter(rejects_path or dead_letter_path(file_path, "redis"), "redis",
+                                   append=start_row > 0)
+
     try:
         # Connexion à Redis
         client = connect_redis()
         if not client:
             return
-        
-        print("Début de la lecture du fichier CSV...")
-        # Lecture du fichier CSV avec pandas
-        df = pd.read_csv(file_path, 
-                        sep=';', 
-                        encoding='utf-8',
-                        na_values=['', 'NA', 'N/A', 'null', 'NULL', 'None'])
-        
-        # Remplacement des NaN par None
-        df = df.replace({np.nan: None})
-        print(f"Lecture du fichier terminée. {len(df)} lignes trouvées.")
-        
+
         # Compteurs pour le suivi
         total_rows = 0
-        successful_rows = 0
-        
-        print("Début de l'importation des données...")
+        writer = PipelineWriter(client, pipeline_size, metrics, dead_letter)
+
+        print(f"Début de la lecture en flux et de l'importation des données "
+              f"(format {storage}, pipeline de {writer.pipeline_size} lignes)...")
         # Conversion des données pour Redis
-        for _, row in df.iterrows():
-            try:
-                total_rows += 1
-                
-                # Création d'un identifiant unique pour la formation
-                formation_id = f"formation:{row['Session']}:{row['Code interne Parcoursup de la formation']}"
-                
-                # Structure des données
-                formation_data = {
-                    "session": row["Session"],
-                    "etablissement": {
-                        "id": row["Identifiant de l'établissement"],
-                        "nom": row["Nom de l'établissement"],
-                        "type": row["Types d'établissement"],
-                        "id_paysage": row["etablissement_id_paysage"],
-                        "site_internet": row["Site internet de l'établissement"]
-                    },
-                    "formation": {
-                        "type": row["Types de formation"],
-                        "nom_long": row["Nom long de la formation"],
-                        "nom_court": row["Nom court de la formation"],
-                        "mentions_specialites": row["Mentions/Spécialités"],
-                        "apprentissage": row["Formations en apprentissage"],
-                        "code_formation": row["code_formation"],
-                        "code_formation_parcoursup": row["Code interne Parcoursup de la formation"],
-                        "code_portail_parcoursup": row["Code interne Parcoursup pour les portails"]
-                    },
-                    "caracteristiques": {
-                        "internat": row["Internat"],
-                        "amenagement": row["Aménagement"],
-                        "informations_complementaires": row["Informations complémentaires"]
-                    },
-                    "localisation": {
-                        "region": row["Région"],
-                        "departement": row["Département"],
-                        "commune": row["Commune"],
-                        "coordonnees": row["Localisation"]
-                    },
-                    "liens": {
-                        "fiche": row["Lien vers la fiche formation"],
-                        "statistiques": row["Lien vers les données statistiques pour l'année antérieure"]
-                    },
-                    "metadata": {
-                        "composante_id_paysage": row["composante_id_paysage"],
-                        "rnd": row["rnd"]
-                    }
-                }
-                
-                # Stockage dans Redis
-                # Utilisation de HSET pour stocker les données comme un hash
-                client.hset(formation_id, mapping={
-                    "data": json.dumps(formation_data, ensure_ascii=False)
-                })
-                
-                # Création d'index secondaires pour la recherche
-                # Index par établissement
-                client.sadd(f"etablissement:{row['Identifiant de l'établissement']}", formation_id)
-                # Index par région
-                if row["Région"]:
-                    client.sadd(f"region:{row['Région']}", formation_id)
-                # Index par session
-                client.sadd(f"session:{row['Session']}", formation_id)
-                
-                successful_rows += 1
-                
-                # Affichage de la progression tous les 1000 enregistrements
-                if successful_rows % 1000 == 0:
-                    print(f"Progression: {successful_rows}/{total_rows} lignes traitées")
-                
-            except Exception as e:
-                print(f"Erreur lors de l'insertion de la ligne {total_rows}: {e}")
-                continue
-        
+        # Lecture du CSV par blocs de taille bornée (NULL normalisés bloc par bloc)
+        for chunk in read_csv_chunks(file_path, chunksize, memory_limit_mb, metrics, start_row):
+            # Identifiants et structures construits colonne par colonne pour tout le bloc
+            with metrics.stage("transformation"):
+                formation_ids = formation_keys(chunk, "Code interne Parcoursup de la formation")
+                documents = to_documents(chunk)
+            for formation_id, formation_data in zip(formation_ids, documents):
+                try:
+                    total_rows += 1
+                    # Stockage dans Redis, envoyé par le pipeline
+                    writer.add_row(start_row + total_rows,
+                                   lambda pipe: queue_formation(pipe, formation_id, formation_data, storage),
+                                   formation_data)
+
+                except TRANSPORT_ERRORS:
+                    raise
+                except Exception as e:
+                    print(f"Erreur lors de l'insertion de la ligne {start_row + total_rows}: {e}")
+                    continue
+
+            writer.flush()
+            if resume:
+                resume.save(start_row + total_rows)
+            # Affichage de la progression à chaque bloc lu
+            print(f"Progression: {writer.successful_rows}/{total_rows} lignes traitées")
+
+        writer.flush()
+        successful_rows = writer.successful_rows
+        # Import terminé: le prochain repartira du début
+        if resume:
+            resume.clear()
+
         # Calcul de la durée totale
         end_time = time.time()
         duration = end_time - start_time
         duration_formatted = str(timedelta(seconds=int(duration)))
-        
+
         # Affichage du résumé
         print("\nRésumé de l'importation:")
         print(f"Durée totale: {duration_formatted}")
         print(f"Nombre total de lignes traitées: {total_rows}")
         print(f"Nombre de lignes importées avec succès: {successful_rows}")
         print(f"Nombre de lignes en erreur: {total_rows - successful_rows}")
+        print(f"Débit Redis: {writer.ops} commandes, {writer.ops_per_second():.0f} ops/s")
         if total_rows > 0:
             print(f"Taux de réussite: {(successful_rows/total_rows)*100:.2f}%")
-        
+        metrics.print_summary()
+        metrics.write(metrics_dir)
+        return successful_rows
+
     except Exception as e:
         print(f"Erreur lors de l'importation: {e}")
+        if resume and resume.rows:
+            print(f"Import interrompu: relancer avec checkpoint=True reprendra après la ligne {resume.rows}")
     finally:
+        dead_letter.close()
         if client:
             client.close()
 
 if __name__ == "__main__":
     # Importer les données
     csv_file_path = "votre_fichier.csv"  # Remplacez par le chemin de votre fichier CSV
-    import_csv(csv_file_path)
\ No newline at end of file
+    import_csv(csv_file_path)
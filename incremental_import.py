@@ -0,0 +1,343 @@
+import argparse
+import hashlib
+import time
+from datetime import timedelta
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+from pymongo import ASCENDING, DeleteMany, ReplaceOne
+
+import analytics
+import import_in_mongo
+import import_redis
+from column_mapping import SQL_COLUMNS, to_documents, to_tuples
+from create_table_postgre import db_params
+from csv_reader import read_csv_chunks
+from dead_letter import DeadLetterWriter
+from geo_search import GEO_KEY, with_position
+from postgres_bulk import prepare_key
+from query_cache import invalidate_after_import
+from redis_formats import load_formations, queue_delete
+
+# Clé d'une formation: (session, code interne Parcoursup)
+KEY_COLUMNS = ("session", "code_formation_parcoursup")
+SESSION_INDEX = SQL_COLUMNS.index("session")
+CODE_INDEX = SQL_COLUMNS.index("code_formation_parcoursup")
+
+
+def row_hash(values):
+    """Empreinte du contenu d'une ligne (tuple dans l'ordre des colonnes SQL)."""
+    canonical = "\x1f".join("" if value is None else str(value) for value in values)
+    return hashlib.md5(canonical.encode("utf-8")).hexdigest()
+
+
+def row_key(values):
+    # Le code est stocké en VARCHAR dans PostgreSQL: la clé est normalisée en texte
+    return int(values[SESSION_INDEX]), str(values[CODE_INDEX])
+
+
+def _code_variants(code):
+    # Le code est lu en texte, mais les imports MongoDB antérieurs l'ont parfois stocké en entier
+    return [code, int(code)] if code.isdigit() else [code]
+
+
+def prepare_postgres(cur, table):
+    """Colonne d'empreinte et clé unique (session, code) nécessaires à l'upsert.
+
+    La clé est permanente (postgres_bulk.prepare_key): créée une fois, elle est
+    aussi respectée par les imports complets. Une table chargée avant son
+    introduction et contenant des doublons est refusée jusqu'à remove_duplicates.
+    """
+    prepare_key(cur, table)
+
+
+def remove_duplicates(table="formations", rejects_path=None):
+    """Migration unique: supprime les doublons (session, code) d'une ancienne table et crée sa clé unique.
+
+    La dernière ligne insérée de chaque clé est gardée; les lignes supprimées
+    sont conservées dans `rejects_path` (par défaut <table>.doublons.csv), au
+    format des rejets, pour pouvoir être vérifiées ou réimportées.
+    Renvoie le nombre de lignes supprimées (None en cas d'erreur).
+    """
+    conn = None
+    cur = None
+    duplicates = DeadLetterWriter(rejects_path or f"{table}.doublons.csv", "postgres")
+    try:
+        conn = psycopg2.connect(**db_params)
+        cur = conn.cursor()
+        cur.execute(sql.SQL(
+            "DELETE FROM {0} a USING {0} b "
+            "WHERE a.session = b.session AND a.code_formation_parcoursup = b.code_formation_parcoursup "
+            "AND a.ctid < b.ctid RETURNING {1}"
+        ).format(sql.Identifier(table), sql.SQL(", ").join(sql.SQL("a.{}").format(sql.Identifier(column))
+                                                            for column in SQL_COLUMNS)))
+        # Une même ligne peut être plus ancienne que plusieurs doublons: DELETE ne la renvoie qu'une fois
+        for values in cur:
+            duplicates.write(None, values, "doublon (session, code) supprimé")
+        prepare_key(cur, table)
+        conn.commit()
+        print(f"{duplicates.count} lignes en double sur (session, code) supprimées de {table}")
+        return duplicates.count
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"Erreur lors de la suppression des doublons: {e}")
+    finally:
+        duplicates.close()
+        if cur:
+            cur.close()
+        if conn:
+            conn.close()
+
+
+def load_previous_hashes(cur, table):
+    cur.execute(sql.SQL("SELECT session, code_formation_parcoursup, row_hash FROM {} "
+                        "WHERE session IS NOT NULL AND code_formation_parcoursup IS NOT NULL").format(
+        sql.Identifier(table)))
+    return {(session, code): hash_value for session, code, hash_value in cur.fetchall()}
+
+
+class PostgresDelta:
+    def __init__(self, cur, table):
+        self.cur = cur
+        self.table = table
+        columns = SQL_COLUMNS + ["row_hash"]
+        updates = sql.SQL(", ").join(
+            sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(column))
+            for column in columns if column not in KEY_COLUMNS
+        )
+        self.upsert_query = sql.SQL(
+            "INSERT INTO {} ({}) VALUES %s ON CONFLICT (session, code_formation_parcoursup) DO UPDATE SET {}"
+        ).format(
+            sql.Identifier(table),
+            sql.SQL(", ").join(sql.Identifier(column) for column in columns),
+            updates
+        ).as_string(cur)
+        self.delete_query = sql.SQL(
+            "DELETE FROM {} t USING (VALUES %s) AS d(session, code) "
+            "WHERE t.session = d.session AND t.code_formation_parcoursup = d.code"
+        ).format(sql.Identifier(table)).as_string(cur)
+
+    def upsert(self, changes):
+        execute_values(self.cur, self.upsert_query,
+                       [values + (hash_value,) for _, values, _, hash_value in changes])
+
+    def delete(self, keys):
+        execute_values(self.cur, self.delete_query, keys)
+
+
+class MongoDelta:
+    def __init__(self, collection):
+        self.collection = collection
+        self.collection.create_index([("session", ASCENDING), ("formation.code_formation_parcoursup", ASCENDING)])
+
+    def upsert(self, changes):
+        self.collection.bulk_write([
+            ReplaceOne({"session": session, "formation.code_formation_parcoursup": {"$in": _code_variants(code)}},
+                       with_position(document), upsert=True)
+            for (session, code), _, document, _ in changes
+        ], ordered=False)
+
+    def delete(self, keys):
+        self.collection.bulk_write([
+            DeleteMany({"session": session, "formation.code_formation_parcoursup": {"$in": _code_variants(code)}})
+            for session, code in keys
+        ], ordered=False)
+
+
+class RedisDelta:
+    """Mise à jour ciblée des clés formation:* et des index de import_redis.py."""
+
+    def __init__(self, client, storage="json"):
+        self.client = client
+        self.storage = storage
+
+    def _remove_from_indexes(self, pipe, formation_ids):
+        # Les index doivent suivre l'ancienne valeur avant réécriture ou suppression
+        for formation_id, old in zip(formation_ids, load_formations(self.client, formation_ids, self.storage)):
+            pipe.zrem(GEO_KEY, formation_id)
+            if not old:
+                continue
+            for family, value in import_redis.formation_indexes(old):
+                pipe.srem(f"{family}:{value}", formation_id)
+
+    def upsert(self, changes):
+        formation_ids = [f"formation:{session}:{code}" for (session, code), _, _, _ in changes]
+        pipe = self.client.pipeline(transaction=False)
+        self._remove_from_indexes(pipe, formation_ids)
+        for formation_id, (_, _, document, _) in zip(formation_ids, changes):
+            import_redis.queue_formation(pipe, formation_id, document, self.storage)
+        pipe.execute()
+
+    def delete(self, keys):
+        formation_ids = [f"formation:{session}:{code}" for session, code in keys]
+        pipe = self.client.pipeline(transaction=False)
+        self._remove_from_indexes(pipe, formation_ids)
+        for formation_id in formation_ids:
+            queue_delete(pipe, formation_id, self.storage)
+        pipe.execute()
+
+
+class ChangeSet:
+    """Classe les lignes du fichier par rapport aux empreintes de référence.
+
+    Une clé répétée dans le fichier n'est comptée qu'une fois et la dernière
+    occurrence l'emporte: elle est comparée à l'empreinte déjà vue pendant cet
+    import. Les changements en attente sont indexés par clé, donc un lot ne
+    contient jamais deux fois la même clé (ON CONFLICT DO UPDATE le refuse).
+    """
+
+    def __init__(self, previous):
+        self.previous = previous
+        self.stats = {"ajoutées": 0, "modifiées": 0, "inchangées": 0, "répétées": 0, "supprimées": 0}
+        # Clé -> empreinte de la dernière occurrence lue dans le fichier
+        self.current = {}
+        self.status = {}
+        self.pending = {}
+
+    def add(self, key, values, document, hash_value):
+        if key in self.current:
+            self.stats["répétées"] += 1
+            if self.current[key] == hash_value:
+                return
+            if self.status[key] == "inchangées":
+                # Identique à la référence à la première occurrence, modifiée par la suivante
+                self.stats["inchangées"] -= 1
+                self.stats["modifiées"] += 1
+                self.status[key] = "modifiées"
+        elif self.previous.get(key) == hash_value:
+            self.current[key] = hash_value
+            self.status[key] = "inchangées"
+            self.stats["inchangées"] += 1
+            return
+        else:
+            self.status[key] = "ajoutées" if key not in self.previous else "modifiées"
+            self.stats[self.status[key]] += 1
+        self.current[key] = hash_value
+        self.pending[key] = (key, values, document, hash_value)
+
+    def take(self):
+        """Changements en attente (au plus un par clé), vidés."""
+        batch, self.pending = list(self.pending.values()), {}
+        return batch
+
+    def removed(self, sessions):
+        """Clés de référence des sessions du fichier qui n'y figurent plus."""
+        removed = [key for key in self.previous if key[0] in sessions and key not in self.current]
+        self.stats["supprimées"] = len(removed)
+        return removed
+
+
+def _apply(targets, method, items):
+    if not items:
+        return
+    for target in targets:
+        getattr(target, method)(items)
+
+
+def import_csv(file_path, table="formations", backends=("mongodb", "redis"),
+               batch_size=1000, chunksize=None, memory_limit_mb=None, redis_storage="json"):
+    """Import incrémental: seules les lignes ajoutées, modifiées ou supprimées sont écrites.
+
+    PostgreSQL est toujours mis à jour: sa colonne row_hash porte les empreintes
+    de référence et n'est validée qu'en dernier, donc si MongoDB ou Redis
+    (`backends`) échouent, le même delta sera rejoué à l'exécution suivante.
+    Les suppressions ne concernent que les sessions présentes dans le fichier.
+    """
+    start_time = time.time()
+    conn = None
+    cur = None
+    mongo_client = None
+    redis_client = None
+    try:
+        conn = psycopg2.connect(**db_params)
+        cur = conn.cursor()
+        prepare_postgres(cur, table)
+        previous = load_previous_hashes(cur, table)
+        print(f"{len(previous)} empreintes de référence chargées depuis {table}")
+
+        targets = []
+        db = None
+        if "mongodb" in backends:
+            mongo_client, db = import_in_mongo.connect_mongodb()
+            targets.append(MongoDelta(db["formations_mongodb"]))
+        if "redis" in backends:
+            redis_client = import_redis.connect_redis()
+            targets.append(RedisDelta(redis_client, redis_storage))
+        # PostgreSQL en dernier: il porte les empreintes, validées après les autres bases
+        targets.append(PostgresDelta(cur, table))
+
+        changes = ChangeSet(previous)
+        stats = changes.stats
+        sessions = set()
+        total_rows = 0
+
+        for chunk in read_csv_chunks(file_path, chunksize, memory_limit_mb):
+            for values, document in zip(to_tuples(chunk), to_documents(chunk)):
+                total_rows += 1
+                if values[SESSION_INDEX] is None or values[CODE_INDEX] is None:
+                    print(f"Ligne {total_rows} ignorée: clé (session, code) incomplète")
+                    continue
+                key = row_key(values)
+                sessions.add(key[0])
+                changes.add(key, values, document, row_hash(values))
+                if len(changes.pending) >= batch_size:
+                    _apply(targets, "upsert", changes.take())
+        _apply(targets, "upsert", changes.take())
+
+        removed = changes.removed(sessions)
+        for start in range(0, len(removed), batch_size):
+            _apply(targets, "delete", removed[start:start + batch_size])
+
+        # Validation des changements
+        conn.commit()
+        if any(stats[label] for label in ("ajoutées", "modifiées", "supprimées")):
+            invalidate_after_import(table, sessions)
+            # Agrégats précalculés des tableaux de bord
+            analytics.refresh_postgres(conn, table)
+            if db is not None:
+                analytics.refresh_mongodb(db)
+
+        duration = time.time() - start_time
+        print("\nRésumé de l'importation incrémentale:")
+        print(f"Durée totale: {str(timedelta(seconds=int(duration)))}")
+        print(f"Nombre total de lignes lues: {total_rows}")
+        for label, count in stats.items():
+            print(f"  Lignes {label}: {count}")
+        return stats
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"Erreur lors de l'importation incrémentale: {e}")
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            conn.close()
+        if mongo_client:
+            mongo_client.close()
+        if redis_client:
+            redis_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import incrémental (ajouts, modifications, suppressions)")
+    parser.add_argument("csv_file", nargs="?", default="data/cartographie_formations_parcoursup.csv")
+    parser.add_argument("--table", default="formations")
+    parser.add_argument("--backends", nargs="*", default=["mongodb", "redis"], choices=["mongodb", "redis"],
+                        help="Bases mises à jour en plus de PostgreSQL")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dedoublonner", action="store_true",
+                        help="Supprime une fois les doublons (session, code) de --table, conservés dans un CSV, "
+                             "et crée sa clé unique")
+    args = parser.parse_args()
+    if args.dedoublonner:
+        remove_duplicates(args.table)
+        return
+    import_csv(args.csv_file, args.table, args.backends, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
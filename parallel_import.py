@@ -0,0 +1,208 @@
+import argparse
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import psycopg2
+
+import analytics
+import create_table_postgre
+import import_in_mongo
+from csv_reader import read_csv_chunks
+from import_all import SINKS
+from query_cache import invalidate_after_import
+
+
+class _RangeReader(io.RawIOBase):
+    """Lecture d'une plage d'octets [start, end) du fichier, précédée de la ligne d'en-tête."""
+
+    def __init__(self, file_path, start, end, header):
+        self._file = open(file_path, "rb")
+        self._file.seek(start)
+        self._remaining = end - start
+        self._header = header
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._header:
+            size = min(len(buffer), len(self._header))
+            buffer[:size] = self._header[:size]
+            self._header = self._header[size:]
+            return size
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        data = self._file.read(size)
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def split_byte_ranges(file_path, parts):
+    """Découpe le fichier en `parts` plages d'octets alignées sur des débuts de ligne.
+
+    Renvoie la ligne d'en-tête et la liste des plages (début, fin). Le découpage
+    suppose qu'aucun champ entre guillemets ne contient de retour à la ligne.
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        header = f.readline()
+        data_start = f.tell()
+        boundaries = [data_start]
+        for i in range(1, parts):
+            f.seek(max(data_start + (file_size - data_start) * i // parts, boundaries[-1]))
+            # On avance jusqu'au début de la ligne suivante
+            f.readline()
+            boundaries.append(min(f.tell(), file_size))
+        boundaries.append(file_size)
+    ranges = [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+    return header, ranges
+
+
+def _import_range(file_path, start, end, header, sink_name, sink_options, chunksize):
+    """Travail d'un processus: lit sa plage et la charge via sa propre connexion."""
+    start_time = time.time()
+    sink = SINKS[sink_name](**sink_options)
+    stats = {"total_rows": 0, "successful_rows": 0, "error": None}
+    success = False
+    try:
+        sink.open()
+        with io.TextIOWrapper(io.BufferedReader(_RangeReader(file_path, start, end, header)),
+                              encoding="utf-8") as stream:
+            for chunk in read_csv_chunks(stream, chunksize):
+                # Numéros de ligne relatifs à la plage du processus
+                total_rows, successful_rows = sink.write(stats["total_rows"] + 1, chunk)
+                stats["total_rows"] += total_rows
+                stats["successful_rows"] += successful_rows
+        success = True
+        # Sessions chargées, pour invalider le cache une fois toutes les plages validées
+        stats["sessions"] = sorted(getattr(sink, "sessions", ()))
+    except Exception as e:
+        stats["error"] = f"{type(e).__name__}: {e}"
+        print(f"[{sink_name} {os.getpid()}] Erreur sur la plage {start}-{end}: {e}")
+    finally:
+        sink.close(success)
+    stats["duration"] = time.time() - start_time
+    return stats
+
+
+def _prepare(sink_name):
+    # Préparation unique dans le processus principal, avant le lancement des workers
+    if sink_name == "postgres":
+        create_table_postgre.create_table()
+
+
+def _finalize(sink_name, results):
+    """Index et agrégats construits une seule fois, après la validation de toutes les plages.
+
+    Recalculés dans chaque processus, les résumés MongoDB d'un processus
+    effaceraient ceux qu'un autre vient d'écrire.
+    """
+    if not any(result["error"] is None for result in results):
+        return
+    if sink_name == "postgres":
+        sessions = set().union(*(result.get("sessions", ()) for result in results))
+        invalidate_after_import("formations", sessions)
+        conn = psycopg2.connect(**create_table_postgre.db_params)
+        try:
+            analytics.refresh_postgres(conn, "formations")
+        finally:
+            conn.close()
+    elif sink_name == "mongodb":
+        client, db = import_in_mongo.connect_mongodb()
+        if client:
+            try:
+                # Index seulement si toutes les plages sont chargées, comme le sink
+                if all(result["error"] is None for result in results):
+                    import_in_mongo.create_indexes(db["formations_mongodb"])
+                analytics.refresh_mongodb(db)
+            finally:
+                client.close()
+
+
+# Options des sinks dans les workers: la préparation et la finalisation sont faites par le processus principal
+WORKER_SINK_OPTIONS = {
+    "postgres": {"create": False, "refresh": False},
+    "mongodb": {"indexes": None, "refresh": False},
+}
+
+
+def import_csv(file_path, sink_name, workers=os.cpu_count(), chunksize=None):
+    """Importe le CSV avec `workers` processus, chacun sur sa plage d'octets."""
+    start_time = time.time()
+    header, ranges = split_byte_ranges(file_path, workers)
+    _prepare(sink_name)
+
+    print(f"Début de l'importation vers {sink_name} avec {len(ranges)} processus...")
+    sink_options = WORKER_SINK_OPTIONS.get(sink_name, {})
+    with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [
+            executor.submit(_import_range, file_path, start, end, header, sink_name, sink_options, chunksize)
+            for start, end in ranges
+        ]
+        results = [future.result() for future in futures]
+
+    _finalize(sink_name, results)
+
+    # Fusion des résultats des processus
+    total_rows = sum(result["total_rows"] for result in results)
+    successful_rows = sum(result["successful_rows"] for result in results)
+    failed_ranges = [result["error"] for result in results if result["error"]]
+    duration = time.time() - start_time
+
+    # Affichage du résumé
+    print("\nRésumé de l'importation:")
+    print(f"Durée totale: {str(timedelta(seconds=int(duration)))}")
+    print(f"Nombre de processus: {len(ranges)}")
+    print(f"Nombre total de lignes traitées: {total_rows}")
+    print(f"Nombre de lignes importées avec succès: {successful_rows}")
+    print(f"Nombre de lignes en erreur: {total_rows - successful_rows}")
+    print(f"Plages en échec: {len(failed_ranges)}")
+    if total_rows > 0:
+        print(f"Taux de réussite: {(successful_rows/total_rows)*100:.2f}%")
+    if duration > 0:
+        print(f"Débit: {successful_rows / duration:.0f} lignes/s")
+    return {"workers": len(ranges), "total_rows": total_rows,
+            "successful_rows": successful_rows, "duration": duration}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import multi-processus du CSV, découpé en plages d'octets")
+    parser.add_argument("csv_file", nargs="?", default="data/cartographie_formations_parcoursup.csv")
+    parser.add_argument("--sink", default="postgres", choices=list(SINKS))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunksize", type=int, default=None)
+    parser.add_argument("--scaling", action="store_true",
+                        help="Mesure le débit de 1 à --workers processus (par puissances de 2); "
+                             "chaque mesure recharge le fichier complet dans la cible")
+    args = parser.parse_args()
+
+    if not args.scaling:
+        import_csv(args.csv_file, args.sink, args.workers, args.chunksize)
+        return
+
+    counts = []
+    workers = 1
+    while workers < args.workers:
+        counts.append(workers)
+        workers *= 2
+    counts.append(args.workers)
+
+    results = [import_csv(args.csv_file, args.sink, count, args.chunksize) for count in counts]
+    print("\nPassage à l'échelle:")
+    base_rate = results[0]["successful_rows"] / results[0]["duration"]
+    for result in results:
+        rate = result["successful_rows"] / result["duration"]
+        print(f"  {result['workers']:>3} processus: {rate:>10.0f} lignes/s (x{rate / base_rate:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import csv
+import io
+import time
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from column_mapping import SQL_COLUMNS
+from dead_letter import bisect_write
+
+# Colonnes des tables formations / formation_2, dans l'ordre des colonnes du CSV
+COLUMNS = SQL_COLUMNS
+
+# Modes de chargement disponibles, du plus rapide au plus lent
+LOAD_MODES = ("copy", "values", "row")
+
+# Lignes par lot quand les rejets sont isolés (un SAVEPOINT par lot)
+ISOLATED_BATCH_SIZE = 10000
+
+# Clé d'une formation: une seule ligne par (session, code) dans les tables chargées avec `upsert`
+UNIQUE_KEY = ("session", "code_formation_parcoursup")
+SESSION_POSITION = COLUMNS.index("session")
+CODE_POSITION = COLUMNS.index("code_formation_parcoursup")
+
+# Erreurs dues au contenu d'une ligne: le lot est coupé en deux pour trouver la ligne fautive.
+# Les autres erreurs (connexion, table absente...) interrompent le chargement.
+ROW_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+
+class _RowStream(io.TextIOBase):
+    """Expose un itérable de lignes comme un fichier CSV lu au fil de l'eau par COPY."""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self._pending = ""
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        # Sérialisation des lignes jusqu'à avoir au moins `size` caractères
+        while size < 0 or len(self._pending) + self._buffer.tell() < size:
+            try:
+                row = next(self._rows)
+            except StopIteration:
+                break
+            self._writer.writerow(row)
+            self.count += 1
+        self._pending += self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        if size < 0:
+            chunk, self._pending = self._pending, ""
+        else:
+            chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+
+def _column_list():
+    return sql.SQL(", ").join(sql.Identifier(column) for column in COLUMNS)
+
+
+def unique_key_index(table):
+    return f"{table}_cle_idx"
+
+
+def prepare_key(cur, table):
+    """Crée une fois la clé unique (session, code) de `table` et sa colonne d'empreinte `row_hash`.
+
+    L'index est permanent: les imports complets chargent par upsert (ON CONFLICT)
+    et l'import incrémental s'en sert sans le reconstruire. Une table qui contient
+    déjà des doublons est refusée: ils se retirent une fois, rejets conservés,
+    avec `python incremental_import.py --dedoublonner`.
+    """
+    cur.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS row_hash CHAR(32)").format(sql.Identifier(table)))
+    cur.execute("SELECT 1 FROM pg_indexes WHERE tablename = %s AND indexname = %s",
+                (table, unique_key_index(table)))
+    if cur.fetchone():
+        return
+    cur.execute("SAVEPOINT cle_unique")
+    try:
+        cur.execute(sql.SQL("CREATE UNIQUE INDEX {} ON {} ({})").format(
+            sql.Identifier(unique_key_index(table)), sql.Identifier(table),
+            sql.SQL(", ").join(sql.Identifier(column) for column in UNIQUE_KEY)))
+    except psycopg2.IntegrityError as e:
+        cur.execute("ROLLBACK TO SAVEPOINT cle_unique")
+        raise ValueError(f"La table {table} contient des doublons sur (session, code): les retirer une fois avec "
+                         f"`python incremental_import.py --dedoublonner --table {table}`") from e
+    cur.execute("RELEASE SAVEPOINT cle_unique")
+    print(f"Clé unique (session, code) créée sur {table}")
+
+
+def _upsert_clause():
+    # Ligne existante remplacée; son empreinte est effacée pour que l'import incrémental la recalcule
+    return sql.SQL(" ON CONFLICT ({}) DO UPDATE SET {}, row_hash = NULL").format(
+        sql.SQL(", ").join(sql.Identifier(column) for column in UNIQUE_KEY),
+        sql.SQL(", ").join(sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(column))
+                           for column in COLUMNS if column not in UNIQUE_KEY))
+
+
+def last_per_key(rows):
+    """Dernière ligne de chaque clé (session, code), dans l'ordre; les lignes à clé incomplète sont toutes gardées.
+
+    Une même requête ON CONFLICT DO UPDATE ne peut pas modifier deux fois la même ligne.
+    """
+    latest = {}
+    for position, values in enumerate(rows):
+        key = (values[SESSION_POSITION], values[CODE_POSITION])
+        # Les NULL ne sont jamais en conflit dans l'index unique: chaque ligne garde sa place
+        latest[position if None in key else key] = values
+    return list(latest.values())
+
+
+def insert_rows(cur, table, rows, upsert=False):
+    """Insertion ligne par ligne (une requête par ligne), conservée comme référence."""
+    insert_query = sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(
+        sql.Identifier(table),
+        _column_list(),
+        sql.SQL(", ").join(sql.Placeholder() * len(COLUMNS))
+    )
+    if upsert:
+        insert_query += _upsert_clause()
+    total_rows = 0
+    successful_rows = 0
+    for values in rows:
+        try:
+            total_rows += 1
+            cur.execute(insert_query, values)
+            successful_rows += 1
+        except Exception as e:
+            print(f"Erreur lors de l'insertion de la ligne {total_rows}: {e}")
+            continue
+    return total_rows, successful_rows
+
+
+def insert_rows_values(cur, table, rows, page_size=1000, upsert=False):
+    """Insertion par lots de `page_size` lignes avec execute_values."""
+    insert_query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
+        sql.Identifier(table),
+        _column_list()
+    )
+    if upsert:
+        insert_query += _upsert_clause()
+    insert_query = insert_query.as_string(cur)
+    total_rows = 0
+    batch = []
+
+    def send(batch):
+        # Un lot = une requête: une clé répétée dans le lot n'est envoyée qu'une fois
+        execute_values(cur, insert_query, last_per_key(batch) if upsert else batch, page_size=page_size)
+
+    for values in rows:
+        batch.append(values)
+        if len(batch) >= page_size:
+            send(batch)
+            total_rows += len(batch)
+            batch = []
+    if batch:
+        send(batch)
+        total_rows += len(batch)
+    return total_rows, total_rows
+
+
+def copy_rows(cur, table, rows, upsert=False):
+    """Chargement en flux continu avec COPY ... FROM STDIN (format CSV).
+
+    Avec `upsert`, COPY remplit une table temporaire, reportée ensuite dans
+    `table` par INSERT ... ON CONFLICT (dernière ligne de chaque clé).
+    """
+    target = _copy_staging(cur, table) if upsert else table
+    copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+        sql.Identifier(target),
+        _column_list()
+    ).as_string(cur)
+    stream = _RowStream(rows)
+    cur.copy_expert(copy_query, stream, size=65536)
+    if upsert:
+        _merge_staging(cur, table, target)
+    return stream.count, stream.count
+
+
+def _copy_staging(cur, table):
+    # Table temporaire des colonnes chargées, supprimée à la fin de la transaction
+    staging = f"{table}_copie"
+    cur.execute(sql.SQL("CREATE TEMP TABLE IF NOT EXISTS {} ON COMMIT DROP AS SELECT {} FROM {} WITH NO DATA").format(
+        sql.Identifier(staging), _column_list(), sql.Identifier(table)))
+    return staging
+
+
+def _merge_staging(cur, table, staging):
+    key = sql.SQL(", ").join(sql.Identifier(column) for column in UNIQUE_KEY)
+    # Clé incomplète: ctid unique, la ligne n'est regroupée avec aucune autre
+    incomplete = sql.SQL("CASE WHEN {} THEN ctid END").format(
+        sql.SQL(" OR ").join(sql.SQL("{} IS NULL").format(sql.Identifier(column)) for column in UNIQUE_KEY))
+    cur.execute(sql.SQL(
+        "INSERT INTO {table} ({columns}) SELECT DISTINCT ON ({key}, {incomplete}) {columns} FROM {staging} "
+        "ORDER BY {key}, {incomplete}, ctid DESC"
+    ).format(table=sql.Identifier(table), columns=_column_list(), key=key, incomplete=incomplete,
+             staging=sql.Identifier(staging)) + _upsert_clause())
+    cur.execute(sql.SQL("TRUNCATE {}").format(sql.Identifier(staging)))
+
+
+def load_rows_isolated(cur, table, rows, dead_letter, mode="copy", page_size=1000,
+                       batch_size=ISOLATED_BATCH_SIZE, row_numbers=None, upsert=False):
+    """Chargement par lots, chacun dans un SAVEPOINT; un lot refusé est coupé en deux jusqu'aux lignes fautives.
+
+    Les bonnes lignes restent chargées en masse, les lignes refusées sont écrites
+    dans `dead_letter` (dead_letter.DeadLetterWriter) avec l'erreur PostgreSQL,
+    ou seulement affichées et comptées si `dead_letter` vaut None.
+    `row_numbers` donne le numéro de ligne du CSV de chaque ligne (1, 2, ... par défaut).
+    """
+    def write_batch(batch):
+        cur.execute("SAVEPOINT lot")
+        try:
+            if mode == "copy":
+                copy_rows(cur, table, batch, upsert)
+            else:
+                insert_rows_values(cur, table, batch, page_size, upsert)
+        except ROW_ERRORS:
+            # La transaction reste utilisable: seul le lot est annulé
+            cur.execute("ROLLBACK TO SAVEPOINT lot")
+            raise
+        cur.execute("RELEASE SAVEPOINT lot")
+
+    def reject(row_number, values, error):
+        print(f"Erreur lors de l'insertion de la ligne {row_number}: {str(error).splitlines()[0]}")
+        if dead_letter is not None:
+            dead_letter.write(row_number, values, error)
+
+    if mode not in ("copy", "values"):
+        raise ValueError(f"Isolation des rejets possible en mode copy ou values, pas {mode}")
+    numbers = iter(row_numbers) if row_numbers is not None else None
+    total_rows = 0
+    successful_rows = 0
+    batch = []
+    for values in rows:
+        total_rows += 1
+        batch.append((next(numbers) if numbers is not None else total_rows, values))
+        if len(batch) >= batch_size:
+            successful_rows += bisect_write(write_batch, batch, reject, ROW_ERRORS)
+            batch = []
+    successful_rows += bisect_write(write_batch, batch, reject, ROW_ERRORS)
+    return total_rows, successful_rows
+
+
+def load_rows(cur, table, rows, mode="copy", page_size=1000, dead_letter=None, row_numbers=None, upsert=False):
+    """Charge `rows` dans `table` selon `mode` et renvoie (total, succès, durée).
+
+    Avec `dead_letter` (modes copy et values), les lignes refusées sont isolées
+    (load_rows_isolated) au lieu de faire échouer tout le chargement. Avec
+    `upsert`, une ligne dont la clé (session, code) existe déjà la remplace
+    (voir prepare_key).
+    """
+    start_time = time.time()
+    if dead_letter is not None and mode != "row":
+        total_rows, successful_rows = load_rows_isolated(cur, table, rows, dead_letter, mode, page_size,
+                                                         row_numbers=row_numbers, upsert=upsert)
+    elif mode == "copy":
+        total_rows, successful_rows = copy_rows(cur, table, rows, upsert)
+    elif mode == "values":
+        total_rows, successful_rows = insert_rows_values(cur, table, rows, page_size, upsert)
+    elif mode == "row":
+        total_rows, successful_rows = insert_rows(cur, table, rows, upsert)
+    else:
+        raise ValueError(f"Mode de chargement inconnu: {mode} (attendu: {', '.join(LOAD_MODES)})")
+    return total_rows, successful_rows, time.time() - start_time
+
+
+def rows_per_second(rows, duration):
+    return rows / duration if duration > 0 else float("inf")
@@ -0,0 +1,130 @@
+from psycopg2 import sql
+
+from postgres_bulk import load_rows, prepare_key, unique_key_index
+
+# Nombre de lignes accumulées par session avant un envoi vers sa table de chargement
+PARTITION_BATCH_SIZE = 10000
+
+
+def partition_name(table, session):
+    return f"{table}_{session}"
+
+
+def is_partitioned(cur, table):
+    cur.execute("""
+        SELECT 1 FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = %s AND pg_table_is_visible(c.oid)
+    """, (table,))
+    return cur.fetchone() is not None
+
+
+def attached_sessions(cur, table):
+    """Partitions attachées à la table, par session (d'après leur nom)."""
+    cur.execute("""
+        SELECT child.relname FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)
+    """, (table,))
+    prefix = f"{table}_"
+    return sorted(int(name[len(prefix):]) for (name,) in cur.fetchall()
+                  if name.startswith(prefix) and name[len(prefix):].isdigit())
+
+
+def _create_loading_table(cur, table, session):
+    # Table autonome de même structure, chargée hors de la table partitionnée
+    # (colonnes générées comprises: ATTACH PARTITION exige les mêmes expressions)
+    loading_table = partition_name(table, session) + "_chargement"
+    cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(loading_table)))
+    cur.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING GENERATED)").format(
+        sql.Identifier(loading_table), sql.Identifier(table)))
+    # Index (session, code) équivalent à celui de la table partitionnée: ATTACH PARTITION le rattache
+    prepare_key(cur, loading_table)
+    return loading_table
+
+
+def swap_partition(cur, table, session, loading_table):
+    """Remplace (ou ajoute) la partition de `session` par la table chargée.
+
+    À exécuter dans la transaction du chargement: les lecteurs voient l'ancienne
+    partition jusqu'au commit, puis la nouvelle, jamais un état intermédiaire.
+    """
+    partition = partition_name(table, session)
+    # La contrainte CHECK validée évite à ATTACH PARTITION de reparcourir la table
+    cur.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} CHECK (session IS NOT NULL AND session = {})").format(
+        sql.Identifier(loading_table), sql.Identifier(f"{partition}_session_check"), sql.Literal(session)))
+    if session in attached_sessions(cur, table):
+        cur.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+            sql.Identifier(table), sql.Identifier(partition)))
+        cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(partition)))
+    cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+        sql.Identifier(loading_table), sql.Identifier(partition)))
+    cur.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+        sql.Identifier(unique_key_index(loading_table)), sql.Identifier(unique_key_index(partition))))
+    cur.execute(sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES IN ({})").format(
+        sql.Identifier(table), sql.Identifier(partition), sql.Literal(session)))
+
+
+def load_partitions(cur, table, rows, mode="copy", dead_letter=None, upsert=False):
+    """Répartit les lignes par session dans des tables de chargement, puis les attache.
+
+    La session est la première colonne de chaque ligne. Renvoie (total, succès).
+    Avec `dead_letter`, les lignes refusées y sont écrites (voir load_rows); avec
+    `upsert`, une clé (session, code) répétée dans le fichier garde sa dernière ligne.
+    """
+    if not is_partitioned(cur, table):
+        raise ValueError(f"La table {table} n'est pas partitionnée par session (create_table(partitioned=True))")
+
+    loading_tables = {}
+    buffers = {}
+    # Numéros de ligne du CSV de chaque ligne en attente, pour les rejets
+    numbers = {}
+    total_rows = 0
+    successful_rows = 0
+
+    def flush(session):
+        nonlocal successful_rows
+        if session not in loading_tables:
+            loading_tables[session] = _create_loading_table(cur, table, session)
+        _, loaded, _ = load_rows(cur, loading_tables[session], buffers.pop(session), mode=mode,
+                                 dead_letter=dead_letter, row_numbers=numbers.pop(session), upsert=upsert)
+        successful_rows += loaded
+
+    for values in rows:
+        total_rows += 1
+        session = values[0]
+        if session is None:
+            print(f"Erreur lors de l'insertion de la ligne {total_rows}: session manquante")
+            if dead_letter is not None:
+                dead_letter.write(total_rows, values, "session manquante")
+            continue
+        session = int(session)
+        buffers.setdefault(session, []).append(values)
+        numbers.setdefault(session, []).append(total_rows)
+        if len(buffers[session]) >= PARTITION_BATCH_SIZE:
+            flush(session)
+    for session in list(buffers):
+        flush(session)
+
+    for session, loading_table in sorted(loading_tables.items()):
+        swap_partition(cur, table, session, loading_table)
+        print(f"Partition {partition_name(table, session)} attachée")
+    return total_rows, successful_rows
+
+
+def detach_session(conn, table, session, drop=False):
+    """Détache la partition d'une ancienne session sans bloquer les lectures, et la supprime si demandé."""
+    partition = partition_name(table, session)
+    autocommit = conn.autocommit
+    # DETACH PARTITION CONCURRENTLY ne peut pas s'exécuter dans une transaction
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {} CONCURRENTLY").format(
+                sql.Identifier(table), sql.Identifier(partition)))
+            if drop:
+                cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(partition)))
+    finally:
+        conn.autocommit = autocommit
+    print(f"Partition {partition} détachée{' et supprimée' if drop else ''}")
@@ -0,0 +1,218 @@
+import argparse
+import json
+import time
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from psycopg2 import sql
+
+from column_mapping import SQL_COLUMNS, tuple_to_document
+
+# Configuration du cache Redis des requêtes PostgreSQL
+cache_params = {
+    "prefix": "cache",
+    # Durée de vie (secondes) par type de requête
+    "ttl": {
+        "formation": 3600,
+        "etablissement": 900,
+        "counts": 300,
+    },
+    # Au-delà de cette taille (octets), la valeur sérialisée est compressée
+    "compress_min_bytes": 1024,
+}
+
+# Colonnes pour lesquelles counts_by est mis en cache
+COUNT_COLUMNS = ("region", "formation_type", "departement", "formation_apprentissage")
+
+# Premier octet des valeurs: format de sérialisation (majuscule = compressé avec zlib)
+_MSGPACK = b"m"
+_JSON = b"j"
+
+
+def dumps(value):
+    """Sérialisation compacte: MessagePack si disponible, sinon JSON, compressée au-delà d'un seuil."""
+    if msgpack is not None:
+        tag, payload = _MSGPACK, msgpack.packb(value)
+    else:
+        tag, payload = _JSON, json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(payload) >= cache_params["compress_min_bytes"]:
+        return tag.upper() + zlib.compress(payload, 1)
+    return tag + payload
+
+
+def loads(raw):
+    tag, payload = raw[:1], raw[1:]
+    if tag.isupper():
+        tag, payload = tag.lower(), zlib.decompress(payload)
+    if tag == _MSGPACK:
+        if msgpack is None:
+            raise ImportError("Valeur en cache au format MessagePack: installer le paquet msgpack")
+        return msgpack.unpackb(payload)
+    return json.loads(payload)
+
+
+def session_prefix(table, session=None):
+    """Préfixe des clés d'une table et d'une session (`all` pour les requêtes toutes sessions)."""
+    return f"{cache_params['prefix']}:{table}:{'all' if session is None else session}:"
+
+
+def invalidate(client, prefix):
+    """Supprime toutes les clés qui commencent par `prefix` (SCAN + UNLINK). Renvoie leur nombre."""
+    removed = 0
+    batch = []
+    for key in client.scan_iter(match=f"{prefix}*", count=1000):
+        batch.append(key)
+        if len(batch) >= 1000:
+            removed += client.unlink(*batch)
+            batch = []
+    if batch:
+        removed += client.unlink(*batch)
+    return removed
+
+
+def invalidate_sessions(client, table, sessions):
+    """Invalide les requêtes des sessions chargées et celles qui portent sur toutes les sessions."""
+    removed = invalidate(client, session_prefix(table))
+    for session in sessions:
+        removed += invalidate(client, session_prefix(table, session))
+    return removed
+
+
+def invalidate_after_import(table, sessions):
+    """Appelé par les imports PostgreSQL après validation; sans Redis, le cache est simplement ignoré."""
+    # Import local: l'import PostgreSQL ne dépend de Redis que si le cache est utilisé
+    import import_redis
+
+    client = import_redis.connect_redis()
+    if not client:
+        print("Cache Redis non invalidé (Redis indisponible)")
+        return
+    try:
+        removed = invalidate_sessions(client, table, sorted(sessions))
+        print(f"Cache invalidé: {removed} clés supprimées pour {table}")
+    finally:
+        client.close()
+
+
+def track_sessions(rows, sessions, position=0):
+    """Laisse passer les lignes en notant leur session (colonne `position`) dans `sessions`."""
+    for values in rows:
+        if values[position] is not None:
+            sessions.add(int(values[position]))
+        yield values
+
+
+class QueryCache:
+    """Lectures PostgreSQL fréquentes servies depuis Redis (lecture à travers le cache).
+
+    En cas d'absence, la requête est exécutée sur PostgreSQL et son résultat
+    conservé dans Redis pour la durée de vie de son type (cache_params["ttl"]).
+    """
+
+    def __init__(self, client, conn, table="formations", ttl=None):
+        self.client = client
+        self.conn = conn
+        self.table = table
+        self.ttl = dict(cache_params["ttl"], **(ttl or {}))
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, kind, session, suffix, query, params):
+        key = f"{session_prefix(self.table, session)}{kind}:{suffix}"
+        raw = self.client.get(key)
+        if raw is not None:
+            self.hits += 1
+            return loads(raw)
+        self.misses += 1
+        with self.conn.cursor() as cur:
+            cur.execute(query, params)
+            # Lignes en listes: même forme après un aller-retour MessagePack ou JSON
+            value = [list(row) for row in cur.fetchall()]
+        self.client.set(key, dumps(value), ex=self.ttl[kind])
+        return value
+
+    def _select(self, conditions):
+        return sql.SQL("SELECT {} FROM {} WHERE {}").format(
+            sql.SQL(", ").join(sql.Identifier(column) for column in SQL_COLUMNS),
+            sql.Identifier(self.table),
+            sql.SQL(" AND ").join(sql.SQL(condition) for condition in conditions))
+
+    def formation(self, session, code):
+        """Formation (document imbriqué) d'une session par code Parcoursup, None si absente."""
+        rows = self._cached("formation", session, code,
+                            self._select(["session = %s", "code_formation_parcoursup = %s"]),
+                            (session, str(code)))
+        return tuple_to_document(rows[0]) if rows else None
+
+    def formations_by_etablissement(self, etablissement_id, session=None):
+        conditions = ["etablissement_id = %s"]
+        params = [etablissement_id]
+        if session is not None:
+            conditions.append("session = %s")
+            params.append(session)
+        rows = self._cached("etablissement", session, etablissement_id, self._select(conditions), params)
+        return [tuple_to_document(row) for row in rows]
+
+    def counts_by(self, column, session=None):
+        """Nombre de formations par valeur de `column` (région, type, ...), pour une session ou toutes."""
+        if column not in COUNT_COLUMNS:
+            raise ValueError(f"Colonne non prise en charge: {column} (attendu: {', '.join(COUNT_COLUMNS)})")
+        query = sql.SQL("SELECT {0}, count(*) FROM {1} {2} GROUP BY {0}").format(
+            sql.Identifier(column), sql.Identifier(self.table),
+            sql.SQL("WHERE session = %s" if session is not None else ""))
+        rows = self._cached("counts", session, column, query, (session,) if session is not None else None)
+        return {value: count for value, count in rows}
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def main():
+    import psycopg2
+
+    import import_redis
+    from create_table_postgre import db_params
+
+    parser = argparse.ArgumentParser(description="Requêtes PostgreSQL servies par le cache Redis")
+    parser.add_argument("--table", default="formations")
+    parser.add_argument("--session", type=int)
+    parser.add_argument("--etablissement")
+    parser.add_argument("--code", help="Code Parcoursup de la formation (avec --session)")
+    parser.add_argument("--counts-by", choices=COUNT_COLUMNS)
+    parser.add_argument("--invalidate", action="store_true", help="Vide le cache de la table (ou de --session)")
+    args = parser.parse_args()
+
+    client = import_redis.connect_redis()
+    if not client:
+        return
+    conn = psycopg2.connect(**db_params)
+    try:
+        if args.invalidate:
+            sessions = [args.session] if args.session is not None else []
+            prefix = f"{cache_params['prefix']}:{args.table}:"
+            removed = invalidate_sessions(client, args.table, sessions) if sessions else invalidate(client, prefix)
+            print(f"{removed} clés supprimées")
+            return
+        cache = QueryCache(client, conn, args.table)
+        start_time = time.perf_counter()
+        if args.code:
+            result = cache.formation(args.session, args.code)
+        elif args.etablissement:
+            result = cache.formations_by_etablissement(args.etablissement, args.session)
+        else:
+            result = cache.counts_by(args.counts_by or "region", args.session)
+        duration = time.perf_counter() - start_time
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        print(f"{'Cache' if cache.hits else 'PostgreSQL'}: {duration * 1000:.2f} ms")
+    finally:
+        conn.close()
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
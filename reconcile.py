@@ -0,0 +1,362 @@
+import argparse
+import hashlib
+import json
+import re
+import struct
+import time
+
+from column_mapping import COLUMN_MAPPING, SQL_COLUMNS, document_to_tuple
+from redis_formats import STORAGE_FORMATS, _require_msgpack, load_formations, msgpack
+
+STORES = ("postgres", "mongodb", "redis")
+
+# Configuration du rapprochement entre bases
+reconcile_params = {
+    # Nombre de seaux (code de formation modulo buckets); les codes non numériques vont dans le seau `buckets`.
+    # Même règle dans les trois bases: code en texte sans blancs autour (CODE_BLANKS), numérique s'il n'a que des chiffres 0-9
+    "buckets": 1024,
+    # Préfixe des clés Redis des formations
+    "prefix": "formation",
+    # Clés Redis lues par aller-retour (SCAN puis pipeline de lectures)
+    "scan_count": 1000,
+}
+
+# Séparateur des valeurs dans la forme canonique d'une ligne (même que incremental_import.row_hash)
+SEPARATOR = "\x1f"
+
+# Blancs retirés autour du code avant le calcul du seau (str.strip, btrim et $trim avec ces caractères)
+CODE_BLANKS = " \t\r\n"
+CODE_PATTERN = "^[0-9]+$"
+
+SESSION_INDEX = SQL_COLUMNS.index("session")
+CODE_INDEX = SQL_COLUMNS.index("code_formation_parcoursup")
+
+# Empreinte de contenu par seau: somme des clés d'index haché MongoDB ($toHashedIndexKey) de chaque ligne,
+# réduites modulo HASH_MODULUS pour que la somme tienne dans un entier 64 bits
+HASH_MODULUS = 2 ** 40
+# Préfixe haché par MongoDB devant une chaîne: graine 0 puis type canonique String (15), en int32 little-endian
+HASH_PREFIX = struct.pack("<ii", 0, 15)
+
+# Champs comparés entre les bases, tous calculés côté serveur par PostgreSQL et MongoDB
+SIGNATURE_FIELDS = ("rows", "sessions", "length", "hash")
+
+
+def canonical(values):
+    """Ligne (ordre des colonnes SQL) sous forme de texte: valeurs séparées par \\x1f, NULL en chaîne vide."""
+    return SEPARATOR.join("" if value is None else str(value) for value in values)
+
+
+def hashed_key(text):
+    """Clé d'index haché MongoDB d'une chaîne ($toHashedIndexKey): md5 de l'élément BSON, 8 octets en int64."""
+    data = text.encode("utf-8") + b"\0"
+    digest = hashlib.md5(HASH_PREFIX + struct.pack("<i", len(data)) + data).digest()
+    return struct.unpack("<q", digest[:8])[0]
+
+
+def hashed_part(text):
+    # Reste tronqué puis valeur absolue, comme $abs de $mod: la somme par seau ne dépend pas de l'ordre des lignes
+    return abs(hashed_key(text)) % HASH_MODULUS
+
+
+def normalize_code(code):
+    """Code de formation en texte, sans blancs autour (None reste None)."""
+    return None if code is None else str(code).strip(CODE_BLANKS)
+
+
+def bucket_of(code, buckets=None):
+    buckets = buckets or reconcile_params["buckets"]
+    code = normalize_code(code)
+    # re plutôt que str.isdigit: "²" ou "١٢" ne sont pas des codes numériques pour SQL et MongoDB
+    return int(code) % buckets if code is not None and re.match(CODE_PATTERN, code) else buckets
+
+
+def _empty_signature():
+    return {"rows": 0, "sessions": 0, "length": 0, "hash": 0}
+
+
+def _row_key(values):
+    # (session, code) en texte, comme les renvoient PostgreSQL (session::text) et MongoDB ($toString)
+    session = values[SESSION_INDEX]
+    return None if session is None else str(session), normalize_code(values[CODE_INDEX])
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+# --- PostgreSQL: agrégats calculés par la base, seules les sommes par seau reviennent
+
+def _postgres_expressions(buckets):
+    # Importé ici: le rapprochement MongoDB / Redis fonctionne sans psycopg2
+    from psycopg2 import sql
+
+    canon = sql.SQL("concat_ws(chr(31), {})").format(sql.SQL(", ").join(
+        sql.SQL("coalesce({}::text, '')").format(sql.Identifier(column)) for column in SQL_COLUMNS))
+    code = sql.SQL("btrim({}, {})").format(sql.Identifier("code_formation_parcoursup"), sql.Literal(CODE_BLANKS))
+    bucket = sql.SQL("CASE WHEN {code} ~ {pattern} THEN ({code}::numeric % {n})::int ELSE {n} END").format(
+        code=code, pattern=sql.Literal(CODE_PATTERN), n=sql.Literal(buckets))
+    return canon, code, bucket
+
+
+def _little_endian(sql, hex_text, size):
+    # Octets d'une valeur hexadécimale dans l'ordre inverse (little-endian), toujours en hexadécimal
+    return sql.SQL(" || ").join(sql.SQL("substr({}, {}, 2)").format(hex_text, sql.Literal(2 * i + 1))
+                                for i in reversed(range(size)))
+
+
+def _postgres_hashed_part(sql):
+    # hashed_part en SQL: md5 sur l'élément BSON de `canon` (longueur int32 little-endian, texte, octet nul)
+    text = sql.SQL("convert_to(canon, 'UTF8')")
+    length = sql.SQL("lpad(to_hex(octet_length({}) + 1), 8, '0')").format(text)
+    digest = sql.SQL("md5(decode({prefix} || {length}, 'hex') || {text} || decode('00', 'hex'))").format(
+        prefix=sql.Literal(HASH_PREFIX.hex()), length=_little_endian(sql, length, 4), text=text)
+    return sql.SQL("abs((('x' || {})::bit(64)::bigint) % {})").format(
+        _little_endian(sql, sql.SQL("digest"), 8), sql.Literal(HASH_MODULUS)), digest
+
+
+def postgres_buckets(cur, table, buckets=None):
+    from psycopg2 import sql
+
+    buckets = buckets or reconcile_params["buckets"]
+    canon, _, bucket = _postgres_expressions(buckets)
+    hashed_part_sql, digest = _postgres_hashed_part(sql)
+    cur.execute(sql.SQL("""
+        SELECT bucket, count(*), coalesce(sum(session), 0), coalesce(sum(char_length(canon)), 0),
+               coalesce(sum({hashed_part}), 0)
+        FROM (SELECT bucket, session, canon, {digest} AS digest
+              FROM (SELECT {bucket} AS bucket, session, {canon} AS canon FROM {table}) lignes) empreintes
+        GROUP BY bucket
+    """).format(hashed_part=hashed_part_sql, digest=digest, bucket=bucket, canon=canon,
+                 table=sql.Identifier(table)))
+    return {bucket_id: {"rows": rows, "sessions": int(sessions), "length": int(length), "hash": int(hash_sum)}
+            for bucket_id, rows, sessions, length, hash_sum in cur.fetchall()}
+
+
+def postgres_rows(cur, table, bucket_ids, buckets=None):
+    """Empreinte de chaque ligne des seaux demandés: {(session, code): md5}."""
+    from psycopg2 import sql
+
+    buckets = buckets or reconcile_params["buckets"]
+    canon, code, bucket = _postgres_expressions(buckets)
+    query = sql.SQL("SELECT session::text, {code}, {canon} FROM {table} WHERE {bucket} = ANY(%s)")
+    cur.execute(query.format(code=code, canon=canon, table=sql.Identifier(table), bucket=bucket),
+                (sorted(bucket_ids),))
+    return {(session, code): hashlib.md5(text.encode("utf-8")).hexdigest() for session, code, text in cur}
+
+
+# --- MongoDB: même forme canonique et même seau calculés par le pipeline ($group)
+
+def _mongo_stages(buckets):
+    paths = [path for _, _, path, _ in COLUMN_MAPPING]
+    parts = []
+    for path in paths:
+        if parts:
+            parts.append(SEPARATOR)
+        parts.append({"$ifNull": [{"$toString": f"${path}"}, ""]})
+    # Code entier (imports anciens) ou texte: même forme texte que PostgreSQL avant le test des chiffres
+    code = {"$trim": {"input": {"$toString": "$formation.code_formation_parcoursup"}, "chars": CODE_BLANKS}}
+    return [
+        {"$project": {"_id": 0, "session": 1, "code": code, "canon": {"$concat": parts}}},
+        # Décimal: un code plus long qu'un entier 64 bits garde le même reste qu'en SQL (numeric)
+        {"$addFields": {"bucket": {"$cond": [
+            {"$regexMatch": {"input": {"$ifNull": ["$code", ""]}, "regex": CODE_PATTERN}},
+            {"$toInt": {"$mod": [{"$toDecimal": "$code"}, buckets]}},
+            buckets,
+        ]}}},
+    ]
+
+
+def mongodb_buckets(collection, buckets=None):
+    buckets = buckets or reconcile_params["buckets"]
+    pipeline = _mongo_stages(buckets) + [
+        {"$group": {"_id": "$bucket", "rows": {"$sum": 1}, "sessions": {"$sum": "$session"},
+                    "length": {"$sum": {"$strLenCP": "$canon"}},
+                    # Même empreinte que hashed_part, calculée par le serveur (MongoDB 4.4+)
+                    "hash": {"$sum": {"$abs": {"$mod": [{"$toHashedIndexKey": "$canon"}, HASH_MODULUS]}}}}},
+    ]
+    return {int(result["_id"]): {"rows": result["rows"], "sessions": int(result["sessions"]),
+                                 "length": int(result["length"]), "hash": int(result["hash"])}
+            for result in collection.aggregate(pipeline, allowDiskUse=True)}
+
+
+def mongodb_rows(collection, bucket_ids, buckets=None):
+    buckets = buckets or reconcile_params["buckets"]
+    pipeline = _mongo_stages(buckets) + [{"$match": {"bucket": {"$in": sorted(bucket_ids)}}}]
+    return {(None if result.get("session") is None else str(result["session"]), result.get("code")):
+            hashlib.md5(result["canon"].encode("utf-8")).hexdigest()
+            for result in collection.aggregate(pipeline, allowDiskUse=True)}
+
+
+# --- Redis: SCAN des clés formation:* et lectures pipelinées, sommes calculées côté client
+
+def _redis_formations(client, storage="json", bucket_ids=None, buckets=None):
+    """Valeurs (ordre des colonnes SQL) des formations, seulement celles des seaux `bucket_ids` si fourni.
+
+    Le seau se déduit du code dans le nom de la clé: les formations des autres
+    seaux ne sont pas lues.
+    """
+    _require_msgpack(storage)
+    prefix = reconcile_params["prefix"]
+    count = reconcile_params["scan_count"]
+
+    def wanted(code):
+        return bucket_ids is None or bucket_of(code, buckets) in bucket_ids
+
+    if storage == "bucket":
+        for bucket_key in client.scan_iter(match=f"{prefix}_bucket:*", count=count):
+            for code, raw in client.hgetall(bucket_key).items():
+                if wanted(code.decode()):
+                    yield tuple(msgpack.unpackb(raw))
+        return
+
+    def read(keys):
+        for document in load_formations(client, keys, storage):
+            if document is not None:
+                yield document_to_tuple(document)
+
+    batch = []
+    for key in client.scan_iter(match=f"{prefix}:*", count=count):
+        if wanted(key.decode().rsplit(":", 1)[1]):
+            batch.append(key)
+        if len(batch) >= count:
+            yield from read(batch)
+            batch = []
+    yield from read(batch)
+
+
+def redis_buckets(client, storage="json", buckets=None):
+    signatures = {}
+    for values in _redis_formations(client, storage, buckets=buckets):
+        text = canonical(values)
+        signature = signatures.setdefault(bucket_of(values[CODE_INDEX], buckets), _empty_signature())
+        signature["rows"] += 1
+        signature["sessions"] += _as_int(values[SESSION_INDEX])
+        signature["length"] += len(text)
+        signature["hash"] += hashed_part(text)
+    return signatures
+
+
+def redis_rows(client, bucket_ids, storage="json", buckets=None):
+    return {_row_key(values): hashlib.md5(canonical(values).encode("utf-8")).hexdigest()
+            for values in _redis_formations(client, storage, set(bucket_ids), buckets)}
+
+
+# --- Comparaison
+
+def differing_buckets(signatures):
+    """Seaux dont les signatures ne concordent pas entre les bases (`signatures`: base -> seau -> signature)."""
+    differing = set()
+    all_buckets = set().union(*(set(store_buckets) for store_buckets in signatures.values()))
+    for bucket_id in all_buckets:
+        found = [store_buckets.get(bucket_id) for store_buckets in signatures.values()]
+        if any(signature is None for signature in found):
+            differing.add(bucket_id)
+            continue
+        if any(len({signature[field] for signature in found}) > 1 for field in SIGNATURE_FIELDS):
+            differing.add(bucket_id)
+    return differing
+
+
+def diff_rows(rows):
+    """Lignes absentes ou divergentes: `rows` est base -> {(session, code): md5}.
+
+    Renvoie {"absentes": {base: [clés]}, "divergentes": [clés]}; une clé est
+    divergente quand les bases qui la contiennent n'ont pas toutes la même empreinte.
+    """
+    keys = set().union(*(set(store_rows) for store_rows in rows.values()))
+    missing = {store: [] for store in rows}
+    divergent = []
+    for key in sorted(keys, key=lambda key: tuple("" if part is None else part for part in key)):
+        hashes = set()
+        for store, store_rows in rows.items():
+            if key in store_rows:
+                hashes.add(store_rows[key])
+            else:
+                missing[store].append(key)
+        if len(hashes) > 1:
+            divergent.append(key)
+    return {"absentes": missing, "divergentes": divergent}
+
+
+def reconcile(stores=STORES, table="formations", redis_storage="json", buckets=None):
+    """Compare les bases par seaux puis ne lit que les lignes des seaux qui diffèrent."""
+    import psycopg2
+
+    import import_in_mongo
+    import import_redis
+    from create_table_postgre import db_params
+
+    buckets = buckets or reconcile_params["buckets"]
+    conn = mongo_client = redis_client = None
+    try:
+        readers = {}
+        if "postgres" in stores:
+            conn = psycopg2.connect(**db_params)
+            cur = conn.cursor()
+            readers["postgres"] = (lambda: postgres_buckets(cur, table, buckets),
+                                   lambda ids: postgres_rows(cur, table, ids, buckets))
+        if "mongodb" in stores:
+            mongo_client, db = import_in_mongo.connect_mongodb()
+            collection = db["formations_mongodb"]
+            readers["mongodb"] = (lambda: mongodb_buckets(collection, buckets),
+                                  lambda ids: mongodb_rows(collection, ids, buckets))
+        if "redis" in stores:
+            redis_client = import_redis.connect_redis()
+            readers["redis"] = (lambda: redis_buckets(redis_client, redis_storage, buckets),
+                                lambda ids: redis_rows(redis_client, ids, redis_storage, buckets))
+
+        signatures = {}
+        timings = {}
+        for store, (read_buckets, _) in readers.items():
+            start_time = time.perf_counter()
+            signatures[store] = read_buckets()
+            timings[store] = round(time.perf_counter() - start_time, 3)
+            rows = sum(signature["rows"] for signature in signatures[store].values())
+            print(f"{store:>8}: {rows} lignes, {len(signatures[store])} seaux en {timings[store]}s")
+
+        differing = differing_buckets(signatures)
+        print(f"Seaux différents: {len(differing)}/{buckets + 1}")
+        report = {"buckets": buckets, "differing_buckets": sorted(differing), "seconds": timings,
+                  "absentes": {store: [] for store in readers}, "divergentes": []}
+        if differing:
+            rows = {store: read_rows(differing) for store, (_, read_rows) in readers.items()}
+            report.update(diff_rows(rows))
+        return report
+    finally:
+        if conn:
+            conn.close()
+        if mongo_client:
+            mongo_client.close()
+        if redis_client:
+            redis_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vérifie que PostgreSQL, MongoDB et Redis ont les mêmes formations")
+    parser.add_argument("--stores", nargs="+", default=list(STORES), choices=STORES)
+    parser.add_argument("--table", default="formations")
+    parser.add_argument("--redis-storage", default="json", choices=STORAGE_FORMATS)
+    parser.add_argument("--buckets", type=int, default=None)
+    parser.add_argument("--output", default=None, help="Rapport JSON des clés absentes ou divergentes")
+    parser.add_argument("--show", type=int, default=20, help="Clés affichées par catégorie")
+    args = parser.parse_args()
+
+    report = reconcile(args.stores, args.table, args.redis_storage, args.buckets)
+    for store, keys in report["absentes"].items():
+        print(f"Absentes de {store}: {len(keys)}")
+        for session, code in keys[:args.show]:
+            print(f"  session {session}, code {code}")
+    print(f"Divergentes: {len(report['divergentes'])}")
+    for session, code in report["divergentes"][:args.show]:
+        print(f"  session {session}, code {code}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Rapport écrit dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
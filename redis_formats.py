@@ -0,0 +1,203 @@
+import argparse
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from column_mapping import COLUMN_MAPPING, document_to_tuple, formation_keys, to_documents, tuple_to_document
+
+# Formats de stockage d'une formation dans Redis
+#   json:    hash à un champ `data` contenant le document JSON (format historique)
+#   hash:    hash plat, un champ par colonne renseignée (encodage listpack si les valeurs sont courtes)
+#   msgpack: chaîne MessagePack des valeurs dans l'ordre des colonnes SQL, sans noms de champs
+#   bucket:  valeurs MessagePack regroupées par BUCKET_SIZE formations dans un même hash
+STORAGE_FORMATS = ("json", "hash", "msgpack", "bucket")
+
+# Nombre de codes de formation consécutifs partageant un hash en format bucket
+BUCKET_SIZE = 100
+
+# Champs du hash plat, par chemin du document imbriqué
+_HASH_FIELDS = [(path, redis_field) for _, _, path, redis_field in COLUMN_MAPPING]
+
+# Champs du hash plat relus en entier, comme dans les formats json et msgpack
+_INTEGER_FIELDS = {redis_field for _, sql_column, _, redis_field in COLUMN_MAPPING if sql_column == "session"}
+
+
+def _require_msgpack(storage):
+    if storage in ("msgpack", "bucket") and msgpack is None:
+        raise ImportError(f"Le format {storage} nécessite le paquet msgpack (pip install msgpack)")
+
+
+def bucket_location(formation_id):
+    """Clé du hash partagé et champ d'une formation en format bucket."""
+    head, session, code = formation_id.rsplit(":", 2)
+    bucket = int(code) // BUCKET_SIZE if code.isdigit() else zlib.crc32(code.encode("utf-8")) % 1024
+    return f"{head}_bucket:{session}:{bucket}", code
+
+
+def _flat_hash(document):
+    flat = {}
+    for path, redis_field in _HASH_FIELDS:
+        top, _, field = path.partition(".")
+        value = document[top][field] if field else document[top]
+        # Les valeurs NULL ne sont pas stockées: moins de champs, hash plus compact
+        if value is not None:
+            flat[redis_field] = value
+    return flat
+
+
+def _decode_hash_value(redis_field, value):
+    if value is None:
+        return None
+    value = value.decode("utf-8")
+    return int(value) if redis_field in _INTEGER_FIELDS else value
+
+
+def _document_from_flat_hash(flat):
+    return tuple_to_document(tuple(_decode_hash_value(redis_field, flat.get(redis_field.encode("utf-8")))
+                                   for _, _, _, redis_field in COLUMN_MAPPING))
+
+
+def queue_record(pipe, formation_id, document, storage="json"):
+    """Met en file l'écriture d'une formation dans le format demandé."""
+    if storage == "json":
+        pipe.hset(formation_id, mapping={"data": json.dumps(document, ensure_ascii=False)})
+    elif storage == "hash":
+        pipe.delete(formation_id)
+        pipe.hset(formation_id, mapping=_flat_hash(document))
+    elif storage == "msgpack":
+        pipe.set(formation_id, msgpack.packb(document_to_tuple(document)))
+    elif storage == "bucket":
+        bucket_key, field = bucket_location(formation_id)
+        pipe.hset(bucket_key, field, msgpack.packb(document_to_tuple(document)))
+    else:
+        raise ValueError(f"Format de stockage inconnu: {storage} (attendu: {', '.join(STORAGE_FORMATS)})")
+
+
+def queue_delete(pipe, formation_id, storage="json"):
+    if storage == "bucket":
+        pipe.hdel(*bucket_location(formation_id))
+    else:
+        pipe.delete(formation_id)
+
+
+def _queue_read(pipe, formation_id, storage):
+    if storage == "json":
+        pipe.hget(formation_id, "data")
+    elif storage == "hash":
+        pipe.hgetall(formation_id)
+    elif storage == "msgpack":
+        pipe.get(formation_id)
+    elif storage == "bucket":
+        pipe.hget(*bucket_location(formation_id))
+
+
+def _decode(raw, storage):
+    if not raw:
+        return None
+    if storage == "json":
+        return json.loads(raw)
+    if storage == "hash":
+        return _document_from_flat_hash(raw)
+    return tuple_to_document(msgpack.unpackb(raw))
+
+
+def load_formations(client, formation_ids, storage="json"):
+    """Documents imbriqués des formations demandées (None si absente), en un aller-retour."""
+    _require_msgpack(storage)
+    pipe = client.pipeline(transaction=False)
+    for formation_id in formation_ids:
+        _queue_read(pipe, formation_id, storage)
+    return [_decode(raw, storage) for raw in pipe.execute()]
+
+
+def scan_formations(client, storage="json", prefix="formation", count=1000):
+    """Parcourt toutes les formations stockées, par lots pipelinés."""
+    _require_msgpack(storage)
+    if storage == "bucket":
+        for bucket_key in client.scan_iter(match=f"{prefix}_bucket:*", count=count):
+            for raw in client.hvals(bucket_key):
+                yield tuple_to_document(msgpack.unpackb(raw))
+        return
+    batch = []
+    for key in client.scan_iter(match=f"{prefix}:*", count=count):
+        batch.append(key)
+        if len(batch) >= count:
+            yield from (document for document in load_formations(client, batch, storage) if document)
+            batch = []
+    yield from (document for document in load_formations(client, batch, storage) if document)
+
+
+def memory_report(client, chunk, storages=STORAGE_FORMATS, samples=200):
+    """Écrit le bloc dans chaque format sous un préfixe de test et mesure les octets par formation.
+
+    Les clés de test sont supprimées à la fin. Pour le format bucket, le gain dépend de
+    hash-max-listpack-value: au-delà de cette taille de valeur, Redis n'utilise plus le listpack.
+    """
+    documents = to_documents(chunk)
+    report = {}
+    for storage in storages:
+        _require_msgpack(storage)
+        prefix = f"memtest_{storage}"
+        formation_ids = formation_keys(chunk, "Code interne Parcoursup de la formation", prefix=prefix)
+        pipe = client.pipeline(transaction=False)
+        for formation_id, document in zip(formation_ids, documents):
+            queue_record(pipe, formation_id, document, storage)
+        pipe.execute()
+
+        keys = list(client.scan_iter(match=f"{prefix}*", count=1000))
+        sampled = keys[:samples]
+        pipe = client.pipeline(transaction=False)
+        for key in sampled:
+            pipe.memory_usage(key, samples=0)
+            pipe.object("encoding", key)
+        results = pipe.execute()
+        usages = results[0::2]
+        encodings = {}
+        for encoding in results[1::2]:
+            encoding = encoding.decode() if isinstance(encoding, bytes) else encoding
+            encodings[encoding] = encodings.get(encoding, 0) + 1
+
+        # Extrapolation des clés échantillonnées à toutes les clés du format
+        total_bytes = sum(usages) / max(len(sampled), 1) * len(keys)
+        report[storage] = {
+            "formations": len(documents),
+            "keys": len(keys),
+            "bytes_per_formation": round(total_bytes / max(len(documents), 1), 1),
+            "encodings": encodings,
+        }
+        for start in range(0, len(keys), 1000):
+            client.unlink(*keys[start:start + 1000])
+    return report
+
+
+def main():
+    import import_redis
+    from csv_reader import read_csv_chunks
+
+    parser = argparse.ArgumentParser(description="Compare la mémoire Redis utilisée par formation selon le format")
+    parser.add_argument("csv_file", nargs="?", default="data/cartographie_formations_parcoursup.csv")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--formats", nargs="+", default=list(STORAGE_FORMATS), choices=STORAGE_FORMATS)
+    args = parser.parse_args()
+
+    client = import_redis.connect_redis()
+    if not client:
+        return
+    try:
+        chunk = next(read_csv_chunks(args.csv_file, chunksize=args.rows))
+        report = memory_report(client, chunk, args.formats, args.samples)
+        print(f"Mémoire Redis par formation ({len(chunk)} formations, MEMORY USAGE sur {args.samples} clés):")
+        for storage, result in report.items():
+            print(f"  {storage:>8}: {result['bytes_per_formation']:>8.0f} octets/formation, "
+                  f"{result['keys']} clés, encodages {result['encodings']}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
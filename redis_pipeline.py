@@ -0,0 +1,102 @@
+import time
+
+import redis
+
+# Erreurs de transport: on ne sait pas quelles commandes du pipeline ont été appliquées.
+# Elles interrompent l'import (le point de reprise reste au dernier envoi réussi);
+# seules les erreurs par commande (raise_on_error=False) sont des lignes rejetées.
+TRANSPORT_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+
+
+def check_results(rows, results, reject=None):
+    """Associe les résultats d'un pipeline à ses lignes et signale les lignes en erreur.
+
+    `rows` liste les (numéro de ligne, nombre de commandes) dans l'ordre du
+    pipeline; `reject(numéro, erreur)` est appelé pour chaque ligne en erreur.
+    Renvoie (lignes écrites, commandes réussies).
+    """
+    successful_rows = 0
+    ops = 0
+    position = 0
+    for row_number, command_count in rows:
+        row_results = results[position:position + command_count]
+        position += command_count
+        errors = [result for result in row_results if isinstance(result, Exception)]
+        ops += command_count - len(errors)
+        if errors:
+            print(f"Erreur lors de l'insertion de la ligne {row_number}: {errors[0]}")
+            if reject is not None:
+                reject(row_number, errors[0])
+        else:
+            successful_rows += 1
+    return successful_rows, ops
+
+
+class PipelineWriter:
+    """Regroupe les commandes Redis de plusieurs lignes dans un pipeline non transactionnel.
+
+    Chaque ligne ajoute ses commandes au pipeline, envoyé en un seul aller-retour
+    toutes les `pipeline_size` lignes. Avec `pipeline_size=1`, on retrouve un
+    aller-retour par ligne.
+    """
+
+    def __init__(self, client, pipeline_size=1000, metrics=None, dead_letter=None):
+        self.client = client
+        # Latence de chaque envoi et lignes en erreur (import_metrics.ImportMetrics), si fourni
+        self.metrics = metrics
+        # Lignes non écrites, avec l'erreur Redis (dead_letter.DeadLetterWriter), si fourni
+        self.dead_letter = dead_letter
+        # Document de chaque ligne en attente, gardé seulement pour les rejets
+        self.pending_documents = {}
+        self.pipeline_size = max(1, pipeline_size)
+        self.pipe = client.pipeline(transaction=False)
+        # (numéro de ligne, nombre de commandes) pour chaque ligne du pipeline
+        self.pending_rows = []
+        self.successful_rows = 0
+        self.ops = 0
+        self.start_time = time.time()
+
+    def add_row(self, row_number, queue_commands, document=None):
+        """Ajoute les commandes d'une ligne; `queue_commands(pipe)` les met en file.
+
+        `document` (imbriqué) est écrit dans les rejets si la ligne échoue.
+        """
+        before = len(self.pipe)
+        queue_commands(self.pipe)
+        self.pending_rows.append((row_number, len(self.pipe) - before))
+        if self.dead_letter is not None and document is not None:
+            self.pending_documents[row_number] = document
+        if len(self.pending_rows) >= self.pipeline_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending_rows:
+            return
+        rows, self.pending_rows = self.pending_rows, []
+        documents, self.pending_documents = self.pending_documents, {}
+
+        def reject(row_number, error):
+            if row_number in documents:
+                self.dead_letter.write_document(row_number, documents[row_number], error)
+
+        start_time = time.perf_counter()
+        try:
+            results = self.pipe.execute(raise_on_error=False)
+        except TRANSPORT_ERRORS as e:
+            # Connexion perdue ou délai dépassé: l'erreur remonte à l'importeur
+            print(f"Erreur lors de l'envoi des lignes {rows[0][0]} à {rows[-1][0]}: {e}")
+            self.pipe.reset()
+            if self.metrics is not None:
+                self.metrics.add_errors("ecriture", len(rows))
+            raise
+        if self.metrics is not None:
+            self.metrics.record("ecriture", time.perf_counter() - start_time, batch=True)
+        successful_rows, ops = check_results(rows, results, reject)
+        self.successful_rows += successful_rows
+        self.ops += ops
+        if self.metrics is not None:
+            self.metrics.add_errors("ecriture", len(rows) - successful_rows)
+
+    def ops_per_second(self):
+        duration = time.time() - self.start_time
+        return self.ops / duration if duration > 0 else float("inf")
@@ -0,0 +1,116 @@
+import argparse
+import hashlib
+import json
+
+import import_redis
+from import_redis import INDEX_FAMILIES
+from redis_formats import STORAGE_FORMATS, load_formations
+
+# Durée de vie (secondes) des résultats d'intersection conservés pour la pagination
+RESULT_TTL = 300
+
+
+def index_keys(criteria):
+    """Clés des ensembles d'index pour des critères {famille: valeur}."""
+    keys = []
+    for family, value in sorted(criteria.items()):
+        if family not in INDEX_FAMILIES:
+            raise ValueError(f"Index inconnu: {family} (attendu: {', '.join(INDEX_FAMILIES)})")
+        if value is not None:
+            keys.append(f"{family}:{value}")
+    if not keys:
+        raise ValueError("Au moins un critère est nécessaire")
+    return keys
+
+
+def _result_key(client, keys):
+    """Intersection calculée par Redis et conservée RESULT_TTL secondes pour les pages suivantes."""
+    if len(keys) == 1:
+        return keys[0]
+    result_key = "requete:" + hashlib.sha1("|".join(keys).encode("utf-8")).hexdigest()
+    pipe = client.pipeline(transaction=False)
+    # L'intersection n'est recalculée que si le résultat a expiré
+    pipe.expire(result_key, RESULT_TTL)
+    expired = not pipe.execute()[0]
+    if expired:
+        pipe.sinterstore(result_key, keys)
+        pipe.expire(result_key, RESULT_TTL)
+        pipe.execute()
+    return result_key
+
+
+def find(client, criteria, cursor=0, count=50, storage="json"):
+    """Formations qui vérifient tous les critères, page par page.
+
+    Renvoie (curseur suivant, documents); un curseur suivant à 0 indique la
+    dernière page. Comme pour SSCAN, une page peut contenir plus ou moins
+    de `count` éléments.
+    """
+    result_key = _result_key(client, index_keys(criteria))
+    cursor, members = client.sscan(result_key, cursor=cursor, count=count)
+    formation_ids = sorted(member.decode("utf-8") for member in members)
+    documents = load_formations(client, formation_ids, storage)
+    return cursor, [document for document in documents if document]
+
+
+def count(client, criteria):
+    """Nombre de formations qui vérifient les critères, sans lire les formations."""
+    keys = index_keys(criteria)
+    if len(keys) == 1:
+        return client.scard(keys[0])
+    return client.sintercard(len(keys), keys)
+
+
+def count_by(client, family, criteria=None):
+    """Nombre de formations par valeur de `family`, éventuellement restreint par d'autres critères.
+
+    Les valeurs viennent du registre index_values:<famille> et chaque compte
+    est une cardinalité (SCARD / SINTERCARD) calculée par Redis.
+    """
+    filter_keys = index_keys(criteria) if criteria else []
+    values = sorted(value.decode("utf-8") for value in client.smembers(f"index_values:{family}"))
+    pipe = client.pipeline(transaction=False)
+    for value in values:
+        keys = [f"{family}:{value}"] + filter_keys
+        if len(keys) == 1:
+            pipe.scard(keys[0])
+        else:
+            pipe.sintercard(len(keys), keys)
+    counts = dict(zip(values, pipe.execute()))
+    # Les valeurs qui n'ont plus de formation (après suppressions) sont ignorées
+    return {value: total for value, total in counts.items() if total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recherche multi-critères sur les index Redis des formations")
+    for family in INDEX_FAMILIES:
+        parser.add_argument(f"--{family.replace('_', '-')}", dest=family)
+    parser.add_argument("--count", action="store_true", help="Affiche seulement le nombre de formations")
+    parser.add_argument("--count-by", choices=list(INDEX_FAMILIES),
+                        help="Affiche le nombre de formations par valeur de cet index")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--cursor", type=int, default=0)
+    parser.add_argument("--storage", default="json", choices=STORAGE_FORMATS)
+    args = parser.parse_args()
+
+    criteria = {family: getattr(args, family) for family in INDEX_FAMILIES if getattr(args, family) is not None}
+    client = import_redis.connect_redis()
+    if not client:
+        return
+    try:
+        if args.count_by:
+            for value, total in sorted(count_by(client, args.count_by, criteria).items(), key=lambda item: -item[1]):
+                print(f"{total:>8}  {value}")
+        elif args.count:
+            print(count(client, criteria))
+        else:
+            cursor, documents = find(client, criteria, args.cursor, args.page_size, args.storage)
+            for document in documents:
+                print(json.dumps(document, ensure_ascii=False))
+            print(f"Curseur suivant: {cursor}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
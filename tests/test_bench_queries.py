@@ -0,0 +1,22 @@
+import pytest
+
+# bench_queries importe les pilotes des trois bases
+for module in ("pandas", "psycopg2", "pymongo", "redis"):
+    pytest.importorskip(module)
+
+from bench_queries import percentile  # noqa: E402
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile(values, 0) == 1
+
+
+def test_percentile_small_and_empty():
+    assert percentile([], 50) is None
+    assert percentile([7.5], 99) == 7.5
+    assert percentile([1, 2, 3], 50) == 2
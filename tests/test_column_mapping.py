@@ -0,0 +1,53 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from column_mapping import (  # noqa: E402
+    CSV_COLUMNS, SQL_COLUMNS, document_to_tuple, formation_keys, to_documents, to_flat_hashes, to_tuples,
+    tuple_to_document,
+)
+
+
+@pytest.fixture
+def chunk():
+    rows = [
+        {column: f"{column} {row}" for column in CSV_COLUMNS}
+        for row in range(2)
+    ]
+    for row in rows:
+        row["Session"] = 2024
+        row["Code interne Parcoursup de la formation"] = "00123"
+    rows[1]["Commune"] = None
+    frame = pd.DataFrame(rows, columns=CSV_COLUMNS)
+    return frame.astype({"Session": "Int64", "Commune": "string"})
+
+
+def test_to_tuples_keeps_sql_order_and_nulls(chunk):
+    first, second = to_tuples(chunk)
+    assert len(first) == len(SQL_COLUMNS)
+    assert first[SQL_COLUMNS.index("session")] == 2024
+    assert first[SQL_COLUMNS.index("code_formation_parcoursup")] == "00123"
+    assert first[SQL_COLUMNS.index("commune")] == "Commune 0"
+    # pd.NA devient None au moment d'écrire
+    assert second[SQL_COLUMNS.index("commune")] is None
+
+
+def test_to_documents_nests_fields(chunk):
+    first, second = to_documents(chunk)
+    assert first["session"] == 2024
+    assert first["formation"]["code_formation_parcoursup"] == "00123"
+    assert first["localisation"]["commune"] == "Commune 0"
+    assert second["localisation"]["commune"] is None
+
+
+def test_documents_and_tuples_round_trip(chunk):
+    for values, document in zip(to_tuples(chunk), to_documents(chunk)):
+        assert document_to_tuple(document) == values
+        assert tuple_to_document(values) == document
+
+
+def test_flat_hashes_and_keys(chunk):
+    hashes = to_flat_hashes(chunk)
+    assert hashes[1]["localisation_commune"] == ""
+    assert formation_keys(chunk, "Code interne Parcoursup de la formation") == [
+        "formation:2024:00123", "formation:2024:00123"]
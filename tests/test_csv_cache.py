@@ -0,0 +1,86 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+pa = pytest.importorskip("pyarrow")
+
+import csv_cache  # noqa: E402
+import csv_reader  # noqa: E402
+from column_mapping import CSV_COLUMNS, to_tuples  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setitem(csv_cache.cache_params, "dir", str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+
+def write_csv(path, rows):
+    lines = [";".join(CSV_COLUMNS)]
+    for i in range(rows):
+        values = {column: f"{column[:3]} {i}" for column in CSV_COLUMNS}
+        values["Session"] = str(2023 + i % 2)
+        values["Code interne Parcoursup de la formation"] = f"{i:05d}"
+        # Régions nouvelles en cours de fichier: le dictionnaire grandit d'un lot à l'autre
+        values["Région"] = ["Bretagne", "Corse", "", "Guyane"][i % 4 if i >= rows // 2 else i % 2]
+        lines.append(";".join(values[column] for column in CSV_COLUMNS))
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+
+def test_file_hash_is_memoized_until_the_file_changes(tmp_path, monkeypatch):
+    path = write_csv(tmp_path / "data.csv", 3)
+    digest = csv_cache.file_hash(str(path))
+    with monkeypatch.context() as patch:
+        patch.setattr(csv_cache, "_content_hash", lambda file_path: pytest.fail("fichier relu"))
+        assert csv_cache.file_hash(str(path)) == digest
+
+    write_csv(path, 4)
+    assert csv_cache.file_hash(str(path)) != digest
+
+
+def test_stale_caches_only_match_the_same_file(tmp_path, cache_dir):
+    cache_dir.mkdir()
+    name = csv_cache._base_name(str(tmp_path / "data.csv"))
+    # Autre fichier au nom proche, et même nom dans un autre dossier
+    other_name = csv_cache._base_name(str(tmp_path / "data.v2.csv"))
+    other_dir = csv_cache._base_name(str(tmp_path / "autre" / "data.csv"))
+    names = [f"{name}.{'a' * 32}.v2.arrow", f"{name}.{'b' * 32}.arrow", f"{name}.{'c' * 32}.v1.arrow",
+             f"{other_name}.{'d' * 32}.v2.arrow", f"{other_dir}.{'e' * 32}.v2.arrow",
+             f"{name}.empreinte.json", f"{name}.notes.arrow"]
+    for entry in names:
+        (cache_dir / entry).touch()
+    kept = str(cache_dir / names[0])
+    stale = sorted(csv_cache._stale_caches(str(tmp_path / "data.csv"), kept))
+    assert stale == sorted([str(cache_dir / names[1]), str(cache_dir / names[2])])
+
+
+def test_same_name_in_other_directory_has_its_own_digest(tmp_path):
+    first = write_csv(tmp_path / "data.csv", 3)
+    (tmp_path / "autre").mkdir()
+    second = write_csv(tmp_path / "autre" / "data.csv", 5)
+    assert csv_cache.digest_path(str(first)) != csv_cache.digest_path(str(second))
+    assert csv_cache.file_hash(str(first)) != csv_cache.file_hash(str(second))
+    assert csv_cache.file_hash(str(first)) == csv_cache._content_hash(str(first))
+
+
+def test_open_cache_without_cache_does_not_read_the_file(tmp_path, monkeypatch):
+    path = write_csv(tmp_path / "data.csv", 3)
+    monkeypatch.setattr(csv_cache, "_content_hash", lambda file_path: pytest.fail("fichier relu"))
+    assert csv_cache.open_cache(str(path)) is None
+
+
+def test_cache_reads_like_pandas(tmp_path, monkeypatch):
+    # Petits lots: le cache est écrit en plusieurs record batches
+    monkeypatch.setitem(csv_cache.cache_params, "read_block_bytes", 4096)
+    monkeypatch.setitem(csv_cache.cache_params, "batch_rows", 16)
+    path = write_csv(tmp_path / "data.csv", 400)
+    cache = csv_cache.build_cache(str(path), csv_reader.NA_VALUES, dtypes=csv_reader.CSV_DTYPES)
+    assert cache == csv_cache.cache_path(str(path))
+
+    table = csv_cache.open_cache(str(path))
+    assert table.num_rows == 400
+    assert pa.types.is_dictionary(table.schema.field("Région").type)
+    chunk = csv_cache.to_dataframe(table, csv_reader.CSV_DTYPES)
+    expected = pd.read_csv(str(path), sep=";", dtype=csv_reader.CSV_DTYPES, na_values=csv_reader.NA_VALUES)
+    assert to_tuples(chunk) == to_tuples(expected)
+    assert chunk["Code interne Parcoursup de la formation"].iloc[0] == "00000"
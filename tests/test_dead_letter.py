@@ -0,0 +1,88 @@
+import asyncio
+import csv
+
+import pytest
+
+from column_mapping import CSV_COLUMNS
+from dead_letter import DeadLetterWriter, bisect_write, bisect_write_async
+
+
+class Refused(Exception):
+    pass
+
+
+def make_writer(bad, calls, written):
+    def write_batch(rows):
+        calls.append(list(rows))
+        if any(row in bad for row in rows):
+            raise Refused(f"refus de {sorted(row for row in rows if row in bad)}")
+        written.extend(rows)
+    return write_batch
+
+
+def test_bisect_write_writes_clean_batch_in_one_call():
+    calls, written, rejected = [], [], []
+    count = bisect_write(make_writer(set(), calls, written), list(enumerate("abcd", start=1)),
+                         lambda *args: rejected.append(args))
+    assert count == 4
+    assert calls == [["a", "b", "c", "d"]]
+    assert written == ["a", "b", "c", "d"]
+    assert rejected == []
+
+
+def test_bisect_write_isolates_bad_rows():
+    calls, written, rejected = [], [], []
+    rows = list(enumerate("abcdefgh", start=10))
+    count = bisect_write(make_writer({"c", "h"}, calls, written), rows,
+                         lambda number, row, error: rejected.append((number, row, type(error))))
+    assert count == 6
+    assert sorted(written) == ["a", "b", "d", "e", "f", "g"]
+    assert rejected == [(12, "c", Refused), (17, "h", Refused)]
+    # Bien moins d'envois qu'une ligne à la fois
+    assert len(calls) < len(rows) * 2
+
+
+def test_bisect_write_empty_and_unexpected_errors():
+    assert bisect_write(lambda rows: None, [], lambda *args: None) == 0
+
+    def fail(rows):
+        raise KeyError("inattendue")
+
+    # Une erreur hors de `errors` n'est pas un rejet: elle remonte
+    with pytest.raises(KeyError):
+        bisect_write(fail, [(1, "a"), (2, "b")], lambda *args: None, errors=(Refused,))
+
+
+def test_bisect_write_async_isolates_bad_rows():
+    calls, written, rejected = [], [], []
+    write = make_writer({"b", "g"}, calls, written)
+
+    async def write_batch(rows):
+        write(rows)
+
+    rows = list(enumerate("abcdefgh", start=1))
+    count = asyncio.run(bisect_write_async(write_batch, rows, lambda number, row, error: rejected.append((number, row)),
+                                           errors=(Refused,)))
+    assert count == 6
+    assert sorted(written) == ["a", "c", "d", "e", "f", "h"]
+    assert rejected == [(2, "b"), (7, "g")]
+
+
+def test_dead_letter_writer_appends_on_resume(tmp_path):
+    path = tmp_path / "rejets.csv"
+    values = tuple(f"v{i}" for i in range(len(CSV_COLUMNS)))
+    with DeadLetterWriter(str(path), "postgres") as writer:
+        writer.write(3, values, "valeur\ntrop longue")
+    with DeadLetterWriter(str(path), "postgres", append=True) as writer:
+        writer.write(8, values, "autre")
+
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = list(csv.reader(f, delimiter=";"))
+    assert rows[0] == CSV_COLUMNS + ["ligne_source", "base", "erreur"]
+    assert [row[-3:] for row in rows[1:]] == [["3", "postgres", "valeur trop longue"], ["8", "postgres", "autre"]]
+
+
+def test_dead_letter_writer_creates_no_file_without_rejects(tmp_path):
+    path = tmp_path / "rejets.csv"
+    DeadLetterWriter(str(path), "redis").close()
+    assert not path.exists()
@@ -0,0 +1,46 @@
+import pytest
+
+# incremental_import importe les pilotes des trois bases
+for module in ("pandas", "psycopg2", "pymongo", "redis"):
+    pytest.importorskip(module)
+
+from incremental_import import ChangeSet  # noqa: E402
+
+
+def add(changes, key, hash_value):
+    changes.add(key, ("valeurs", hash_value), {"document": hash_value}, hash_value)
+
+
+def test_classifies_rows_against_previous_hashes():
+    changes = ChangeSet({(2024, "1"): "h1", (2024, "2"): "h2", (2024, "3"): "h3", (2023, "9"): "h9"})
+    add(changes, (2024, "1"), "h1")
+    add(changes, (2024, "2"), "nouveau")
+    add(changes, (2024, "4"), "h4")
+    assert [key for key, _, _, _ in changes.take()] == [(2024, "2"), (2024, "4")]
+    # Seules les sessions présentes dans le fichier peuvent perdre des lignes
+    assert changes.removed({2024}) == [(2024, "3")]
+    assert changes.stats == {"ajoutées": 1, "modifiées": 1, "inchangées": 1, "répétées": 0, "supprimées": 1}
+
+
+def test_repeated_key_keeps_last_row_once_per_batch():
+    changes = ChangeSet({})
+    add(changes, (2024, "1"), "a")
+    add(changes, (2024, "1"), "b")
+    add(changes, (2024, "1"), "b")
+    batch = changes.take()
+    assert [(key, hash_value) for key, _, _, hash_value in batch] == [((2024, "1"), "b")]
+    assert changes.stats["ajoutées"] == 1
+    assert changes.stats["répétées"] == 2
+
+
+def test_repeat_in_a_later_batch_is_compared_to_this_run():
+    changes = ChangeSet({(2024, "1"): "a"})
+    add(changes, (2024, "1"), "a")
+    assert changes.take() == []
+    # Même clé, contenu différent plus loin dans le fichier: une modification, comptée une fois
+    add(changes, (2024, "1"), "b")
+    add(changes, (2024, "1"), "b")
+    assert [hash_value for _, _, _, hash_value in changes.take()] == ["b"]
+    assert changes.stats["modifiées"] == 1
+    assert changes.stats["inchangées"] == 0
+    assert changes.removed({2024}) == []
@@ -0,0 +1,55 @@
+import io
+
+import pytest
+
+# parallel_import charge les sinks de import_all, qui importent les pilotes des trois bases
+for module in ("pandas", "psycopg2", "pymongo", "redis"):
+    pytest.importorskip(module)
+
+from parallel_import import _RangeReader, split_byte_ranges  # noqa: E402
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / "formations.csv"
+    lines = [b"a;b\n"] + [f"{i};{'x' * (i % 7)}\n".encode() for i in range(1, 101)]
+    path.write_bytes(b"".join(lines))
+    return path, lines
+
+
+def read_range(path, start, end, header):
+    with io.TextIOWrapper(io.BufferedReader(_RangeReader(str(path), start, end, header)), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("parts", [1, 2, 3, 7, 200])
+def test_ranges_cover_every_line_once(csv_file, parts):
+    path, lines = csv_file
+    header, ranges = split_byte_ranges(str(path), parts)
+    assert header == lines[0]
+    assert len(ranges) <= parts
+    assert ranges[0][0] == len(lines[0])
+    assert ranges[-1][1] == path.stat().st_size
+    assert all(previous[1] == current[0] for previous, current in zip(ranges, ranges[1:]))
+
+    data = b"".join(lines[1:]).decode()
+    texts = [read_range(path, start, end, header) for start, end in ranges]
+    # Chaque plage commence par l'en-tête et ne coupe aucune ligne
+    assert all(text.startswith("a;b\n") and text.endswith("\n") for text in texts)
+    assert "".join(text[len("a;b\n"):] for text in texts) == data
+
+
+def test_range_reader_small_buffers(csv_file):
+    path, lines = csv_file
+    header, ranges = split_byte_ranges(str(path), 2)
+    start, end = ranges[1]
+    reader = _RangeReader(str(path), start, end, header)
+    chunks = []
+    buffer = bytearray(3)
+    while True:
+        size = reader.readinto(buffer)
+        if not size:
+            break
+        chunks.append(bytes(buffer[:size]))
+    reader.close()
+    assert b"".join(chunks) == header + path.read_bytes()[start:end]
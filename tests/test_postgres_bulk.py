@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from postgres_bulk import CODE_POSITION, COLUMNS, SESSION_POSITION, last_per_key  # noqa: E402
+
+
+def row(session, code, name):
+    values = [None] * len(COLUMNS)
+    values[SESSION_POSITION] = session
+    values[CODE_POSITION] = code
+    values[COLUMNS.index("formation_nom_court")] = name
+    return tuple(values)
+
+
+def test_last_per_key_keeps_last_row_of_each_key():
+    rows = [row(2024, "1", "a"), row(2024, "2", "b"), row(2024, "1", "c"), row(2023, "1", "d")]
+    assert last_per_key(rows) == [row(2024, "1", "c"), row(2024, "2", "b"), row(2023, "1", "d")]
+
+
+def test_last_per_key_keeps_every_row_with_incomplete_key():
+    # Une clé avec NULL n'est jamais en conflit dans l'index unique
+    rows = [row(None, "1", "a"), row(None, "1", "b"), row(2024, None, "c"), row(2024, None, "d")]
+    assert last_per_key(rows) == rows
@@ -0,0 +1,57 @@
+import pytest
+
+from reconcile import (HASH_MODULUS, bucket_of, canonical, diff_rows, differing_buckets, hashed_key, hashed_part,
+                       normalize_code)
+
+
+@pytest.mark.parametrize("code, bucket", [
+    ("1234", 1234 % 100),
+    (1234, 1234 % 100),
+    (" 1234\t", 1234 % 100),
+    ("00042", 42),
+    ("12345678901234567890123", 12345678901234567890123 % 100),
+])
+def test_numeric_codes_use_modulo(code, bucket):
+    assert bucket_of(code, 100) == bucket
+
+
+@pytest.mark.parametrize("code", [None, "", "  ", "12a", "-5", "1.5", "²", "١٢"])
+def test_other_codes_share_the_last_bucket(code):
+    assert bucket_of(code, 100) == 100
+
+
+def test_normalize_code():
+    assert normalize_code(None) is None
+    assert normalize_code(" 7 \n") == "7"
+    assert normalize_code(7) == "7"
+
+
+def test_canonical_and_hashed_part():
+    assert canonical((2024, None, "a")) == "2024\x1f\x1fa"
+    # Valeur de la documentation MongoDB de $toHashedIndexKey
+    assert hashed_key("string to hash") == 763543691661428748
+    assert 0 <= hashed_part("ligne") < HASH_MODULUS
+    assert hashed_part("ligne") == abs(hashed_key("ligne")) % HASH_MODULUS
+
+
+def test_differing_buckets():
+    same = {"rows": 2, "sessions": 4048, "length": 10, "hash": 5}
+    signatures = {
+        "postgres": {1: same, 2: same, 3: same},
+        "mongodb": {1: same, 2: dict(same, rows=3), 3: same},
+        "redis": {1: same, 3: dict(same, hash=6)},
+    }
+    # 1: concorde; 2: nombre de lignes et absent de Redis; 3: empreinte différente
+    assert differing_buckets(signatures) == {2, 3}
+
+
+def test_diff_rows():
+    rows = {
+        "postgres": {("2024", "1"): "a", ("2024", "2"): "b"},
+        "mongodb": {("2024", "1"): "a", ("2024", "2"): "c"},
+        "redis": {("2024", "2"): "b"},
+    }
+    assert diff_rows(rows) == {
+        "absentes": {"postgres": [], "mongodb": [], "redis": [("2024", "1")]},
+        "divergentes": [("2024", "2")],
+    }
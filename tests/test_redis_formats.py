@@ -0,0 +1,16 @@
+import json
+
+from column_mapping import SQL_COLUMNS, tuple_to_document
+from redis_formats import _decode, _flat_hash
+
+
+def test_hash_format_reads_back_like_json():
+    values = [f"valeur {position}" for position in range(len(SQL_COLUMNS))]
+    values[SQL_COLUMNS.index("session")] = 2024
+    values[SQL_COLUMNS.index("region")] = None
+    document = tuple_to_document(tuple(values))
+    stored = {field.encode("utf-8"): str(value).encode("utf-8") for field, value in _flat_hash(document).items()}
+
+    decoded = _decode(stored, "hash")
+    assert decoded == _decode(json.dumps(document).encode("utf-8"), "json") == document
+    assert decoded["session"] == 2024
@@ -0,0 +1,67 @@
+import pytest
+
+redis = pytest.importorskip("redis")
+
+from redis_pipeline import PipelineWriter  # noqa: E402
+
+
+class FakePipeline:
+    def __init__(self, outcome):
+        self.commands = []
+        self.outcome = outcome
+
+    def __len__(self):
+        return len(self.commands)
+
+    def set(self, key, value):
+        self.commands.append((key, value))
+
+    def execute(self, raise_on_error=True):
+        commands, self.commands = self.commands, []
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return [self.outcome(key, value) for key, value in commands]
+
+    def reset(self):
+        self.commands = []
+
+
+class FakeClient:
+    def __init__(self, outcome):
+        self.outcome = outcome
+
+    def pipeline(self, transaction=False):
+        return FakePipeline(self.outcome)
+
+
+class FakeDeadLetter:
+    def __init__(self):
+        self.rows = []
+
+    def write_document(self, row_number, document, error):
+        self.rows.append((row_number, document))
+
+
+def test_command_errors_are_rejected_rows():
+    def outcome(key, value):
+        return redis.ResponseError("WRONGTYPE") if value == "mauvaise" else True
+
+    dead_letter = FakeDeadLetter()
+    writer = PipelineWriter(FakeClient(outcome), pipeline_size=10, dead_letter=dead_letter)
+    for row_number, value in enumerate(["a", "mauvaise", "c"], start=1):
+        writer.add_row(row_number, lambda pipe, value=value: pipe.set(f"k{value}", value), {"valeur": value})
+    writer.flush()
+    assert writer.successful_rows == 2
+    assert dead_letter.rows == [(2, {"valeur": "mauvaise"})]
+
+
+@pytest.mark.parametrize("error", [redis.ConnectionError("coupure"), redis.TimeoutError("délai")])
+def test_transport_errors_propagate(error):
+    dead_letter = FakeDeadLetter()
+    writer = PipelineWriter(FakeClient(error), pipeline_size=10, dead_letter=dead_letter)
+    writer.add_row(1, lambda pipe: pipe.set("k", "v"), {"valeur": "v"})
+    with pytest.raises(type(error)):
+        writer.flush()
+    # Rien n'est compté comme rejeté: l'import s'arrête et sera repris
+    assert writer.successful_rows == 0
+    assert dead_letter.rows == []
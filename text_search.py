@@ -0,0 +1,139 @@
+import argparse
+import json
+
+from column_mapping import COLUMN_MAPPING, SQL_COLUMNS, tuple_to_document
+
+# Colonnes recherchées et leur poids dans le classement (A le plus fort)
+TEXT_COLUMNS = [
+    ("formation_nom_long", "A"),
+    ("etablissement_nom", "B"),
+    ("mentions_specialites", "C"),
+]
+
+# Poids équivalents pour l'index texte MongoDB
+MONGO_WEIGHTS = {"A": 10, "B": 5, "C": 2}
+
+# Filtres acceptés par search_*: nom -> colonne SQL
+FILTER_COLUMNS = {
+    "session": "session",
+    "region": "region",
+    "departement": "departement",
+    "type_formation": "formation_type",
+    "apprentissage": "formation_apprentissage",
+}
+
+_MONGO_PATHS = {sql_column: path for _, sql_column, path, _ in COLUMN_MAPPING}
+
+# Configuration PostgreSQL explicite: to_tsvector(regconfig, text) est immuable, donc utilisable en colonne générée
+TSVECTOR_EXPRESSION = " || ".join(
+    f"setweight(to_tsvector('french', coalesce({column}, '')), '{weight}')" for column, weight in TEXT_COLUMNS
+)
+
+
+def mongo_text_index():
+    """Clés et options de l'index texte MongoDB (un seul index texte par collection)."""
+    keys = [(_MONGO_PATHS[column], "text") for column, _ in TEXT_COLUMNS]
+    options = {
+        "name": "recherche_texte",
+        "default_language": "french",
+        "weights": {_MONGO_PATHS[column]: MONGO_WEIGHTS[weight] for column, weight in TEXT_COLUMNS},
+    }
+    return keys, options
+
+
+def prepare_postgres(cur, table):
+    """Ajoute la colonne `recherche` (tsvector français pondéré, calculé à l'insertion) et son index GIN."""
+    from psycopg2 import sql
+
+    cur.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS recherche TSVECTOR GENERATED ALWAYS AS ({}) STORED").format(
+        sql.Identifier(table), sql.SQL(TSVECTOR_EXPRESSION)))
+    cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} USING gin (recherche)").format(
+        sql.Identifier(f"{table}_recherche_idx"), sql.Identifier(table)))
+
+
+def _check_filters(filters):
+    unknown = set(filters or {}) - set(FILTER_COLUMNS)
+    if unknown:
+        raise ValueError(f"Filtres inconnus: {', '.join(sorted(unknown))} (attendu: {', '.join(FILTER_COLUMNS)})")
+    return {name: value for name, value in (filters or {}).items() if value is not None}
+
+
+def search_postgres(cur, query, filters=None, limit=20, table="formations"):
+    """Formations correspondant à `query` (syntaxe websearch: "phrase", -exclu, or), par pertinence.
+
+    `filters` restreint les résultats par égalité (voir FILTER_COLUMNS).
+    Renvoie une liste de (score, document imbriqué), comme search_mongodb.
+    """
+    from psycopg2 import sql
+
+    filters = _check_filters(filters)
+    conditions = [sql.SQL("recherche @@ q")] + [
+        sql.SQL("{} = {}").format(sql.Identifier(FILTER_COLUMNS[name]), sql.Placeholder(name)) for name in filters
+    ]
+    statement = sql.SQL("""
+        SELECT {columns}, ts_rank_cd(recherche, q) AS score
+        FROM {table}, websearch_to_tsquery('french', %(query)s) AS q
+        WHERE {conditions}
+        ORDER BY score DESC
+        LIMIT %(limit)s
+    """).format(
+        columns=sql.SQL(", ").join(sql.Identifier(column) for column in SQL_COLUMNS),
+        table=sql.Identifier(table),
+        conditions=sql.SQL(" AND ").join(conditions),
+    )
+    cur.execute(statement, dict(filters, query=query, limit=limit))
+    return [(row[-1], tuple_to_document(row[:-1])) for row in cur.fetchall()]
+
+
+def search_mongodb(collection, query, filters=None, limit=20):
+    """Même recherche avec l'index texte MongoDB, classée par textScore."""
+    filters = _check_filters(filters)
+    criteria = {"$text": {"$search": query, "$language": "french"}}
+    for name, value in filters.items():
+        criteria[_MONGO_PATHS[FILTER_COLUMNS[name]]] = value
+    documents = collection.find(criteria, {"_id": 0, "score": {"$meta": "textScore"}})
+    documents = documents.sort([("score", {"$meta": "textScore"})]).limit(limit)
+    return [(document.pop("score"), document) for document in documents]
+
+
+def main():
+    import psycopg2
+
+    import import_in_mongo
+    from create_table_postgre import db_params
+
+    parser = argparse.ArgumentParser(description="Recherche plein texte (français) dans les formations")
+    parser.add_argument("query")
+    parser.add_argument("--backend", default="postgres", choices=["postgres", "mongodb"])
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--table", default="formations")
+    parser.add_argument("--session", type=int)
+    for name in FILTER_COLUMNS:
+        if name != "session":
+            parser.add_argument(f"--{name.replace('_', '-')}", dest=name)
+    args = parser.parse_args()
+    filters = {name: getattr(args, name) for name in FILTER_COLUMNS}
+
+    if args.backend == "postgres":
+        conn = psycopg2.connect(**db_params)
+        try:
+            with conn.cursor() as cur:
+                results = search_postgres(cur, args.query, filters, args.limit, args.table)
+        finally:
+            conn.close()
+    else:
+        client, db = import_in_mongo.connect_mongodb()
+        try:
+            results = search_mongodb(db["formations_mongodb"], args.query, filters, args.limit)
+        finally:
+            client.close()
+
+    print(f"{len(results)} formations pour « {args.query} » ({args.backend}):")
+    for score, document in results:
+        print(f"{score:>8.3f}  " + json.dumps(
+            {"session": document["session"], "etablissement": document["etablissement"]["nom"],
+             "formation": document["formation"]["nom_long"]}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()